@@ -9,12 +9,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from llm_one_api import __version__
-from llm_one_api.api.routes import chat, completions, embeddings, models, stats
+from llm_one_api.api.routes import chat, completions, embeddings, models, stats, files, batches, jobs, metrics, admin
 from llm_one_api.middleware.auth import AuthMiddleware
 from llm_one_api.middleware.logging import LoggingMiddleware
 from llm_one_api.middleware.rate_limit import RateLimitMiddleware
+from llm_one_api.middleware.tracing import TracingMiddleware
 from llm_one_api.plugins.manager import PluginManager
+from llm_one_api.core.batch_executor import BatchExecutor
+from llm_one_api.core.job_manager import JobManager
+from llm_one_api.core.concurrency_limiter import ConcurrencyLimiter
+from llm_one_api.core.retry import configure_retry_budget
+from llm_one_api.core.metrics import configure_metrics
+from llm_one_api.core.tracing import configure_tracing, shutdown_tracing
 from llm_one_api.config.settings import get_settings
+from llm_one_api.utils.token_counter import configure_tokenizer, warmup_tokenizers
 from llm_one_api.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -30,19 +38,57 @@ async def lifespan(app: FastAPI):
     settings = get_settings()
     logger.info(f"📝 配置加载完成")
     
+    # 配置并预加载 tokenizer
+    tokenizer_config = settings.tokenizer or {}
+    configure_tokenizer(tokenizer_config)
+    if tokenizer_config.get("preload", True):
+        models = list(settings.models.keys()) + list(tokenizer_config.get("models", []))
+        loaded = await warmup_tokenizers(models, timeout=tokenizer_config.get("preload_timeout", 30))
+        logger.info(f"🔤 tokenizer 预加载完成: {sum(loaded.values())}/{len(models)}")
+    
+    # 全局重试预算
+    configure_retry_budget(settings.retry_budget)
+    
+    # Prometheus 指标
+    configure_metrics(settings.metrics)
+    
+    # 链路追踪
+    configure_tracing(settings.tracing)
+    
     # 初始化插件系统
     plugin_manager = PluginManager(settings)
     await plugin_manager.load_plugins()
     app.state.plugin_manager = plugin_manager
     logger.info(f"🔌 插件系统初始化完成")
     
+    # 启动批处理执行器（恢复未完成的批处理）
+    batch_executor = None
+    if settings.batch.get("enabled", True):
+        batch_executor = BatchExecutor(settings.batch, plugin_manager)
+        await batch_executor.start()
+    app.state.batch_executor = batch_executor
+    
+    # API Key 并发限制
+    app.state.concurrency_limiter = ConcurrencyLimiter(settings.concurrency_limits)
+    
+    # 异步任务管理器
+    job_manager = None
+    if settings.async_jobs.get("enabled", True):
+        job_manager = JobManager(settings.async_jobs)
+    app.state.job_manager = job_manager
+    
     logger.info(f"✅ LLM One API v{__version__} 启动成功")
     
     yield
     
     # 关闭时
     logger.info("🛑 LLM One API 正在关闭...")
+    if job_manager:
+        await job_manager.stop()
+    if batch_executor:
+        await batch_executor.stop()
     await plugin_manager.cleanup()
+    await shutdown_tracing()
     logger.info("👋 LLM One API 已关闭")
 
 
@@ -76,6 +122,10 @@ if settings.rate_limit.get("enabled", False):
     app.add_middleware(RateLimitMiddleware, requests_per_minute=requests_per_minute)
     logger.info(f"🚦 限流已启用: {requests_per_minute} 请求/分钟")
 
+# 链路追踪（最后添加，位于最外层，覆盖认证和限流）
+if settings.tracing.get("enabled", False):
+    app.add_middleware(TracingMiddleware)
+
 
 # 注册路由
 app.include_router(chat.router, prefix="/v1", tags=["chat"])
@@ -83,6 +133,21 @@ app.include_router(completions.router, prefix="/v1", tags=["completions"])
 app.include_router(embeddings.router, prefix="/v1", tags=["embeddings"])
 app.include_router(models.router, prefix="/v1", tags=["models"])
 app.include_router(stats.router, prefix="/v1", tags=["stats"])
+app.include_router(files.router, prefix="/v1", tags=["files"])
+app.include_router(batches.router, prefix="/v1", tags=["batches"])
+app.include_router(jobs.router, prefix="/v1", tags=["jobs"])
+
+# Prometheus 指标（不带 /v1 前缀，使用 metrics.token 认证）
+if settings.metrics.get("enabled", False):
+    app.include_router(metrics.router, tags=["metrics"])
+
+# 按需性能分析（需要管理 Token）
+if settings.profiling.get("enabled", False):
+    if settings.profiling.get("admin_token"):
+        app.include_router(admin.router, tags=["admin"])
+        logger.info("🩺 性能分析接口已启用: POST /admin/profile")
+    else:
+        logger.warning("⚠️  已启用性能分析但未配置 profiling.admin_token，接口不可用")
 
 
 @app.get("/")
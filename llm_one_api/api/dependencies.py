@@ -4,6 +4,8 @@ FastAPI 依赖注入
 提供常用的依赖项，如插件管理器、配置等
 """
 
+import hmac
+
 from fastapi import Request, Depends, HTTPException, status
 from typing import Optional
 
@@ -16,6 +18,29 @@ def get_plugin_manager(request: Request) -> PluginManager:
     return request.app.state.plugin_manager
 
 
+def get_batch_executor(request: Request):
+    """获取批处理执行器（未启用时返回 404）"""
+    batch_executor = getattr(request.app.state, "batch_executor", None)
+    
+    if batch_executor is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch API 未启用",
+        )
+    
+    return batch_executor
+
+
+def get_job_manager(request: Request):
+    """获取异步任务管理器（未启用时返回 None）"""
+    return getattr(request.app.state, "job_manager", None)
+
+
+def get_concurrency_limiter(request: Request):
+    """获取 API Key 并发限制器"""
+    return request.app.state.concurrency_limiter
+
+
 def get_current_settings() -> Settings:
     """获取当前配置"""
     return get_settings()
@@ -41,3 +66,61 @@ async def verify_api_key(request: Request) -> dict:
     
     return request.state.auth_result
 
+
+async def verify_metrics_token(request: Request, settings: Settings = Depends(get_current_settings)) -> None:
+    """
+    验证指标接口的抓取 Token（Authorization: Bearer <metrics.token>）
+    
+    未配置 Token 时不做认证
+    """
+    metrics_token = (settings.metrics or {}).get("token")
+    if not metrics_token:
+        return
+    
+    auth_header = request.headers.get("Authorization", "")
+    parts = auth_header.split()
+    token = parts[1] if len(parts) == 2 and parts[0].lower() == "bearer" else ""
+    
+    if not hmac.compare_digest(token.encode("utf-8"), metrics_token.encode("utf-8")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="指标 Token 无效",
+        )
+
+
+async def has_admin_token(request: Request, settings: Settings = Depends(get_current_settings)) -> bool:
+    """
+    请求是否带有有效的管理 Token（X-Admin-Token: <profiling.admin_token>）
+    
+    用于同时需要 API Key 认证的接口（Authorization 头已用于 API Key），未配置管理 Token 时总是返回 False
+    """
+    admin_token = (settings.profiling or {}).get("admin_token")
+    token = request.headers.get("X-Admin-Token")
+    if not admin_token or not token:
+        return False
+    
+    return hmac.compare_digest(token.encode("utf-8"), admin_token.encode("utf-8"))
+
+
+async def verify_admin_token(request: Request, settings: Settings = Depends(get_current_settings)) -> None:
+    """
+    验证管理接口的 Token（Authorization: Bearer <profiling.admin_token>）
+    
+    管理接口不经过 API Key 认证，只接受配置中的管理 Token
+    """
+    admin_token = (settings.profiling or {}).get("admin_token")
+    if not admin_token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="未配置管理 Token",
+        )
+    
+    auth_header = request.headers.get("Authorization", "")
+    parts = auth_header.split()
+    token = parts[1] if len(parts) == 2 and parts[0].lower() == "bearer" else ""
+    
+    if not hmac.compare_digest(token.encode("utf-8"), admin_token.encode("utf-8")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="管理 Token 无效",
+        )
@@ -0,0 +1,61 @@
+"""
+管理 API 路由
+
+POST /admin/profile 在当前 worker 进程内运行限时的性能分析会话（需要管理 Token，默认不启用）
+"""
+
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse, Response
+
+from llm_one_api.api.dependencies import get_current_settings, verify_admin_token
+from llm_one_api.core.profiler import run_profile, validate_profile_request
+from llm_one_api.utils.exceptions import LLMOneAPIError
+
+router = APIRouter()
+
+
+@router.post("/admin/profile")
+async def create_profile(
+    mode: str = "sample",
+    duration: Optional[float] = None,
+    interval: Optional[float] = None,
+    format: Optional[str] = None,
+    settings=Depends(get_current_settings),
+    _=Depends(verify_admin_token),
+):
+    """
+    运行一次性能分析会话，结束后返回结果
+    
+    参数:
+    - mode: sample（调用栈采样，默认）或 cprofile
+    - duration: 分析时长（秒），默认 profiling.default_duration，不超过 profiling.max_duration
+    - interval: 采样间隔（秒，只用于 sample 模式），默认 profiling.sample_interval
+    - format: sample 模式为 collapsed；cprofile 模式为 pstats（默认）或 text
+    
+    只分析处理该请求的 worker 进程（响应头 X-Profile-Pid），同一进程同时只允许一个会话
+    """
+    config = settings.profiling or {}
+    duration = duration if duration is not None else config.get("default_duration", 10)
+    interval = interval if interval is not None else config.get("sample_interval", 0.01)
+    
+    try:
+        output = validate_profile_request(mode, format, duration, interval, config.get("max_duration", 60))
+        result = await run_profile(mode, output, duration, interval)
+    except LLMOneAPIError as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"error": {"message": str(e), "type": e.error_type}},
+            headers=e.headers,
+        )
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="{result.filename}"',
+        "X-Profile-Pid": str(os.getpid()),
+    }
+    if mode == "sample":
+        headers["X-Profile-Samples"] = str(result.samples)
+    
+    return Response(content=result.content, media_type=result.media_type, headers=headers)
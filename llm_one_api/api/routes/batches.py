@@ -0,0 +1,114 @@
+"""
+Batches API 路由
+
+实现 /v1/batches 接口，兼容 OpenAI Batch API
+批处理在本地后台执行，详见 llm_one_api.core.batch_executor
+"""
+
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any
+
+from llm_one_api.api.dependencies import get_batch_executor, verify_api_key
+from llm_one_api.utils.logger import setup_logger
+from llm_one_api.utils.exceptions import LLMOneAPIError
+
+logger = setup_logger(__name__)
+
+router = APIRouter()
+
+
+class CreateBatchRequest(BaseModel):
+    """创建批处理请求"""
+    input_file_id: str = Field(..., description="输入文件 ID")
+    endpoint: str = Field(..., description="请求接口，如 /v1/chat/completions")
+    completion_window: str = Field("24h", description="完成时间窗口")
+    metadata: Optional[Dict[str, Any]] = Field(None, description="自定义元数据")
+
+
+def _batch_not_found(batch_id: str) -> JSONResponse:
+    """批处理不存在的错误响应"""
+    return JSONResponse(
+        status_code=404,
+        content={"error": {"message": f"批处理 {batch_id} 不存在", "type": "not_found"}}
+    )
+
+
+@router.post("/batches")
+async def create_batch(
+    request_data: CreateBatchRequest,
+    request: Request,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """
+    创建批处理
+    
+    兼容 OpenAI /v1/batches 接口
+    """
+    try:
+        batch = batch_executor.create_batch(
+            input_file_id=request_data.input_file_id,
+            endpoint=request_data.endpoint,
+            completion_window=request_data.completion_window,
+            auth_result=auth_result,
+            metadata=request_data.metadata,
+        )
+        return batch_executor.to_public(batch)
+    
+    except LLMOneAPIError as e:
+        logger.error(f"API 错误: {e}")
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"error": {"message": str(e), "type": e.error_type}},
+            headers=e.headers,
+        )
+
+
+@router.get("/batches")
+async def list_batches(
+    request: Request,
+    limit: int = 20,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """列出当前用户的批处理"""
+    batches = await batch_executor.list_batches(owner=auth_result.get("user_id"), limit=limit)
+    
+    return {
+        "object": "list",
+        "data": [batch_executor.to_public(batch) for batch in batches],
+    }
+
+
+@router.get("/batches/{batch_id}")
+async def retrieve_batch(
+    batch_id: str,
+    request: Request,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """获取批处理状态"""
+    batch = batch_executor.get_batch(batch_id, owner=auth_result.get("user_id"))
+    
+    if not batch:
+        return _batch_not_found(batch_id)
+    
+    return batch_executor.to_public(batch)
+
+
+@router.post("/batches/{batch_id}/cancel")
+async def cancel_batch(
+    batch_id: str,
+    request: Request,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """取消批处理"""
+    batch = batch_executor.cancel_batch(batch_id, owner=auth_result.get("user_id"))
+    
+    if not batch:
+        return _batch_not_found(batch_id)
+    
+    return batch_executor.to_public(batch)
@@ -6,13 +6,21 @@ Chat Completions API 路由
 
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 from typing import Optional
 
 from llm_one_api.models.request import ChatCompletionRequest
 from llm_one_api.models.response import ChatCompletionResponse
-from llm_one_api.api.dependencies import get_plugin_manager, verify_api_key
+from llm_one_api.api.dependencies import (
+    get_plugin_manager,
+    get_job_manager,
+    get_concurrency_limiter,
+    verify_api_key,
+)
 from llm_one_api.core.request_handler import RequestHandler
+from llm_one_api.core.deadline import Deadline
 from llm_one_api.core.forwarder import StreamForwarder, NonStreamForwarder
+from llm_one_api.core.job_manager import wants_async
 from llm_one_api.utils.logger import setup_logger
 from llm_one_api.utils.exceptions import LLMOneAPIError
 
@@ -26,6 +34,8 @@ async def create_chat_completion(
     request_data: ChatCompletionRequest,
     request: Request,
     plugin_manager=Depends(get_plugin_manager),
+    job_manager=Depends(get_job_manager),
+    concurrency_limiter=Depends(get_concurrency_limiter),
     auth_result=Depends(verify_api_key),
 ):
     """
@@ -33,7 +43,14 @@ async def create_chat_completion(
     
     兼容 OpenAI /v1/chat/completions 接口
     支持流式和非流式响应
+    
+    非流式请求携带 `Prefer: respond-async`（或 `X-Async: true`）时以异步任务执行，
+    立即返回 202 和任务 ID，结果通过 GET /v1/jobs/{job_id} 获取；
+    `X-Callback-Url` 可指定任务结束后的回调地址（需要启用 async_jobs.webhooks_enabled，且地址在允许列表中）
     """
+    slot = None
+    keep_slot = False  # 流式和异步任务在响应返回后继续占用并发名额
+    
     try:
         logger.info(f"收到 chat completion 请求: model={request_data.model}, stream={request_data.stream}")
         
@@ -49,18 +66,55 @@ async def create_chat_completion(
         handler = RequestHandler(model_config)
         processed_request = handler.process_chat_request(request_data)
         
+        # 请求截止时间（X-Request-Timeout 或模型配置的 request_timeout）
+        deadline = Deadline.from_request(request.headers, model_config)
+        
+        # 占用 API Key 的并发名额
+        slot = concurrency_limiter.acquire(auth_result, request_data.model, stream=request_data.stream)
+        
         # 流式响应
         if request_data.stream:
-            forwarder = StreamForwarder(model_config, plugin_manager)
+            forwarder = StreamForwarder(model_config, plugin_manager, deadline=deadline)
+            forwarder.check_admission(auth_result)
             stream_generator = forwarder.forward_chat_stream(processed_request, auth_result)
+            keep_slot = True
             return StreamingResponse(
-                stream_generator,
+                slot.wrap_stream(stream_generator),
                 media_type="text/event-stream",
+                background=BackgroundTask(slot.release),
+            )
+        
+        # 异步任务
+        elif job_manager is not None and wants_async(request.headers):
+            headers = request.headers
+            
+            async def run_job():
+                # 异步任务的时间预算从任务开始执行时计算
+                forwarder = NonStreamForwarder(
+                    model_config,
+                    plugin_manager,
+                    deadline=Deadline.from_request(headers, model_config),
+                )
+                try:
+                    return await forwarder.forward_chat(processed_request, auth_result)
+                finally:
+                    slot.release()
+            
+            job = job_manager.submit(
+                run_job,
+                owner=auth_result.get("user_id"),
+                callback_url=request.headers.get("x-callback-url"),
+            )
+            keep_slot = True
+            return JSONResponse(
+                status_code=202,
+                content=job.to_dict(),
+                headers={"Location": f"/v1/jobs/{job.id}"},
             )
         
         # 非流式响应
         else:
-            forwarder = NonStreamForwarder(model_config, plugin_manager)
+            forwarder = NonStreamForwarder(model_config, plugin_manager, deadline=deadline)
             response = await forwarder.forward_chat(processed_request, auth_result)
             return response
     
@@ -68,7 +122,8 @@ async def create_chat_completion(
         logger.error(f"API 错误: {e}")
         return JSONResponse(
             status_code=e.status_code,
-            content={"error": {"message": str(e), "type": e.error_type}}
+            content={"error": {"message": str(e), "type": e.error_type}},
+            headers=e.headers,
         )
     
     except Exception as e:
@@ -77,4 +132,8 @@ async def create_chat_completion(
             status_code=500,
             content={"error": {"message": "内部服务器错误", "type": "internal_error"}}
         )
+    
+    finally:
+        if slot and not keep_slot:
+            slot.release()
 
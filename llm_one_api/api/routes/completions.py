@@ -6,10 +6,12 @@ Completions API 路由
 
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 
 from llm_one_api.models.request import CompletionRequest
-from llm_one_api.api.dependencies import get_plugin_manager, verify_api_key
+from llm_one_api.api.dependencies import get_plugin_manager, get_concurrency_limiter, verify_api_key
 from llm_one_api.core.request_handler import RequestHandler
+from llm_one_api.core.deadline import Deadline
 from llm_one_api.core.forwarder import StreamForwarder, NonStreamForwarder
 from llm_one_api.utils.logger import setup_logger
 from llm_one_api.utils.exceptions import LLMOneAPIError
@@ -24,6 +26,7 @@ async def create_completion(
     request_data: CompletionRequest,
     request: Request,
     plugin_manager=Depends(get_plugin_manager),
+    concurrency_limiter=Depends(get_concurrency_limiter),
     auth_result=Depends(verify_api_key),
 ):
     """
@@ -31,6 +34,9 @@ async def create_completion(
     
     兼容 OpenAI /v1/completions 接口
     """
+    slot = None
+    keep_slot = False  # 流式响应在返回后继续占用并发名额
+    
     try:
         logger.info(f"收到 completion 请求: model={request_data.model}, stream={request_data.stream}")
         
@@ -46,18 +52,27 @@ async def create_completion(
         handler = RequestHandler(model_config)
         processed_request = handler.process_completion_request(request_data)
         
+        # 请求截止时间（X-Request-Timeout 或模型配置的 request_timeout）
+        deadline = Deadline.from_request(request.headers, model_config)
+        
+        # 占用 API Key 的并发名额
+        slot = concurrency_limiter.acquire(auth_result, request_data.model, stream=request_data.stream)
+        
         # 流式响应
         if request_data.stream:
-            forwarder = StreamForwarder(model_config, plugin_manager)
+            forwarder = StreamForwarder(model_config, plugin_manager, deadline=deadline)
+            forwarder.check_admission(auth_result)
             stream_generator = forwarder.forward_completion_stream(processed_request, auth_result)
+            keep_slot = True
             return StreamingResponse(
-                stream_generator,
+                slot.wrap_stream(stream_generator),
                 media_type="text/event-stream",
+                background=BackgroundTask(slot.release),
             )
         
         # 非流式响应
         else:
-            forwarder = NonStreamForwarder(model_config, plugin_manager)
+            forwarder = NonStreamForwarder(model_config, plugin_manager, deadline=deadline)
             response = await forwarder.forward_completion(processed_request, auth_result)
             return response
     
@@ -65,7 +80,8 @@ async def create_completion(
         logger.error(f"API 错误: {e}")
         return JSONResponse(
             status_code=e.status_code,
-            content={"error": {"message": str(e), "type": e.error_type}}
+            content={"error": {"message": str(e), "type": e.error_type}},
+            headers=e.headers,
         )
     
     except Exception as e:
@@ -74,4 +90,8 @@ async def create_completion(
             status_code=500,
             content={"error": {"message": "内部服务器错误", "type": "internal_error"}}
         )
+    
+    finally:
+        if slot and not keep_slot:
+            slot.release()
 
@@ -8,8 +8,9 @@ from fastapi import APIRouter, Request, Depends
 from fastapi.responses import JSONResponse
 
 from llm_one_api.models.request import EmbeddingRequest
-from llm_one_api.api.dependencies import get_plugin_manager, verify_api_key
+from llm_one_api.api.dependencies import get_plugin_manager, get_concurrency_limiter, verify_api_key
 from llm_one_api.core.request_handler import RequestHandler
+from llm_one_api.core.deadline import Deadline
 from llm_one_api.core.forwarder import NonStreamForwarder
 from llm_one_api.utils.logger import setup_logger
 from llm_one_api.utils.exceptions import LLMOneAPIError
@@ -24,6 +25,7 @@ async def create_embedding(
     request_data: EmbeddingRequest,
     request: Request,
     plugin_manager=Depends(get_plugin_manager),
+    concurrency_limiter=Depends(get_concurrency_limiter),
     auth_result=Depends(verify_api_key),
 ):
     """
@@ -31,6 +33,8 @@ async def create_embedding(
     
     兼容 OpenAI /v1/embeddings 接口
     """
+    slot = None
+    
     try:
         logger.info(f"收到 embedding 请求: model={request_data.model}")
         
@@ -46,8 +50,14 @@ async def create_embedding(
         handler = RequestHandler(model_config)
         processed_request = handler.process_embedding_request(request_data)
         
+        # 请求截止时间（X-Request-Timeout 或模型配置的 request_timeout）
+        deadline = Deadline.from_request(request.headers, model_config)
+        
+        # 占用 API Key 的并发名额
+        slot = concurrency_limiter.acquire(auth_result, request_data.model)
+        
         # Embedding 不支持流式，只有非流式
-        forwarder = NonStreamForwarder(model_config, plugin_manager)
+        forwarder = NonStreamForwarder(model_config, plugin_manager, deadline=deadline)
         response = await forwarder.forward_embedding(processed_request, auth_result)
         return response
     
@@ -55,7 +65,8 @@ async def create_embedding(
         logger.error(f"API 错误: {e}")
         return JSONResponse(
             status_code=e.status_code,
-            content={"error": {"message": str(e), "type": e.error_type}}
+            content={"error": {"message": str(e), "type": e.error_type}},
+            headers=e.headers,
         )
     
     except Exception as e:
@@ -64,4 +75,8 @@ async def create_embedding(
             status_code=500,
             content={"error": {"message": "内部服务器错误", "type": "internal_error"}}
         )
+    
+    finally:
+        if slot:
+            slot.release()
 
@@ -0,0 +1,172 @@
+"""
+Files API 路由
+
+实现 /v1/files 接口，兼容 OpenAI API
+文件保存在本地磁盘，主要用于 Batch API 的输入和输出
+磁盘读写在线程池中执行，不阻塞事件循环
+"""
+
+import asyncio
+from functools import partial
+
+from fastapi import APIRouter, Request, Depends, File, Form, UploadFile
+from fastapi.responses import FileResponse, JSONResponse
+
+from llm_one_api.api.dependencies import get_batch_executor, verify_api_key
+from llm_one_api.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+router = APIRouter()
+
+# 上传时每次读取的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _file_not_found(file_id: str) -> JSONResponse:
+    """文件不存在的错误响应"""
+    return JSONResponse(
+        status_code=404,
+        content={"error": {"message": f"文件 {file_id} 不存在", "type": "not_found"}}
+    )
+
+
+@router.post("/files")
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    purpose: str = Form(...),
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """
+    上传文件
+    
+    兼容 OpenAI /v1/files 接口，目前仅支持 purpose=batch
+    文件大小超过 batch.max_file_bytes 时返回 413
+    """
+    if purpose != "batch":
+        return JSONResponse(
+            status_code=400,
+            content={"error": {"message": f"不支持的 purpose: {purpose}", "type": "validation_error"}}
+        )
+    
+    loop = asyncio.get_running_loop()
+    file_store = batch_executor.file_store
+    max_bytes = batch_executor.max_file_bytes
+    file_id, writer = await loop.run_in_executor(None, file_store.create_writer)
+    
+    try:
+        size = 0
+        try:
+            # 分块写入磁盘，避免大文件整体加载到内存
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    break
+                await loop.run_in_executor(None, writer.write, chunk)
+        finally:
+            await loop.run_in_executor(None, writer.close)
+        
+        if size > max_bytes:
+            await loop.run_in_executor(None, file_store.delete, file_id)
+            return JSONResponse(
+                status_code=413,
+                content={"error": {"message": f"文件大小超过上限 {max_bytes} 字节", "type": "file_too_large"}}
+            )
+        
+        meta = await loop.run_in_executor(
+            None, file_store.register, file_id, file.filename or "upload.jsonl", purpose, auth_result.get("user_id")
+        )
+        return file_store.to_public(meta)
+    
+    except Exception as e:
+        logger.exception(f"保存上传文件失败: {e}")
+        await loop.run_in_executor(None, file_store.delete, file_id)
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "内部服务器错误", "type": "internal_error"}}
+        )
+
+
+@router.get("/files")
+async def list_files(
+    request: Request,
+    purpose: str = None,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """列出当前用户的文件"""
+    file_store = batch_executor.file_store
+    files = await asyncio.get_running_loop().run_in_executor(
+        None, partial(file_store.list, owner=auth_result.get("user_id"), purpose=purpose)
+    )
+    
+    return {
+        "object": "list",
+        "data": [file_store.to_public(meta) for meta in files],
+    }
+
+
+@router.get("/files/{file_id}")
+async def retrieve_file(
+    file_id: str,
+    request: Request,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """获取文件信息"""
+    file_store = batch_executor.file_store
+    meta = file_store.get(file_id)
+    
+    if not meta or meta.get("owner") != auth_result.get("user_id"):
+        return _file_not_found(file_id)
+    
+    return file_store.to_public(meta)
+
+
+@router.get("/files/{file_id}/content")
+async def retrieve_file_content(
+    file_id: str,
+    request: Request,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """下载文件内容"""
+    file_store = batch_executor.file_store
+    meta = file_store.get(file_id)
+    
+    if not meta or meta.get("owner") != auth_result.get("user_id"):
+        return _file_not_found(file_id)
+    
+    return FileResponse(
+        file_store.content_path(file_id),
+        media_type="application/jsonl",
+        filename=meta["filename"],
+    )
+
+
+@router.delete("/files/{file_id}")
+async def delete_file(
+    file_id: str,
+    request: Request,
+    batch_executor=Depends(get_batch_executor),
+    auth_result=Depends(verify_api_key),
+):
+    """删除文件"""
+    file_store = batch_executor.file_store
+    meta = file_store.get(file_id)
+    
+    if not meta or meta.get("owner") != auth_result.get("user_id"):
+        return _file_not_found(file_id)
+    
+    file_store.delete(file_id)
+    
+    return {
+        "id": file_id,
+        "object": "file",
+        "deleted": True,
+    }
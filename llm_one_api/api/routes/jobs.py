@@ -0,0 +1,53 @@
+"""
+异步任务 API 路由
+
+实现 /v1/jobs/{job_id} 接口，获取异步任务的状态和结果
+任务的执行方式详见 llm_one_api.core.job_manager
+"""
+
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import JSONResponse
+
+from llm_one_api.api.dependencies import get_job_manager, verify_api_key
+from llm_one_api.utils.exceptions import LLMOneAPIError
+from llm_one_api.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    request: Request,
+    wait: float = 0,
+    job_manager=Depends(get_job_manager),
+    auth_result=Depends(verify_api_key),
+):
+    """
+    获取异步任务
+    
+    wait > 0 时长轮询：任务结束或等待超时（不超过 max_wait）后返回
+    任务未结束时返回 202，结束后返回 200
+    """
+    job = job_manager.get(job_id, owner=auth_result.get("user_id")) if job_manager else None
+    
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": {"message": f"任务 {job_id} 不存在", "type": "not_found"}}
+        )
+    
+    try:
+        await job_manager.wait(job, wait)
+    except LLMOneAPIError as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"error": {"message": str(e), "type": e.error_type}},
+        )
+    
+    return JSONResponse(
+        status_code=200 if job.finished else 202,
+        content=job.to_dict(),
+    )
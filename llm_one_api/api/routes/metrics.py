@@ -0,0 +1,26 @@
+"""
+Prometheus 指标路由
+
+GET /metrics 以 Prometheus 文本格式导出请求、延迟、token 和上游状态指标
+"""
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from llm_one_api.api.dependencies import verify_metrics_token
+from llm_one_api.core.load_balancer import collect_upstream_metrics
+from llm_one_api.core.metrics import registry
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(verify_metrics_token)])
+async def get_metrics():
+    """
+    导出 Prometheus 指标
+    
+    配置了 metrics.token 时需要 Authorization: Bearer <token>，否则请在网络层限制访问
+    """
+    return PlainTextResponse(registry.render(collect_upstream_metrics()), media_type=CONTENT_TYPE)
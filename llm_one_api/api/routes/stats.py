@@ -4,39 +4,64 @@
 提供负载均衡状态、系统统计等信息
 """
 
+import time
+from datetime import datetime
 from fastapi import APIRouter, Request, Depends
-from typing import Dict, Any
+from fastapi.responses import JSONResponse
+from typing import Dict, Any, Optional
 
-from llm_one_api.api.dependencies import get_plugin_manager, verify_api_key
+from llm_one_api import __version__
+from llm_one_api.api.dependencies import get_plugin_manager, has_admin_token, verify_api_key
+from llm_one_api.core.concurrency_limiter import resolve_key_id
+from llm_one_api.core.load_balancer import get_balancer_snapshot
 from llm_one_api.utils.logger import logger
 
 router = APIRouter()
 
+# 只返回给管理员的上游字段（上游地址和 Key 状态）
+ADMIN_ONLY_SERVER_FIELDS = ("api_base", "keys")
+
+
+def _public_balancer_stats(stats: Optional[Dict[str, Any]], is_admin: bool) -> Optional[Dict[str, Any]]:
+    """非管理员请求去掉上游地址和 Key 状态（快照在请求之间共享，返回副本）"""
+    if stats is None or is_admin:
+        return stats
+    
+    servers = [
+        {key: value for key, value in server.items() if key not in ADMIN_ONLY_SERVER_FIELDS}
+        for server in stats["servers"]
+    ]
+    return {**stats, "servers": servers}
+
 
 @router.get("/stats/load_balancers")
 async def get_load_balancer_stats(
     request: Request,
     plugin_manager=Depends(get_plugin_manager),
     auth_result=Depends(verify_api_key),
+    is_admin: bool = Depends(has_admin_token),
 ):
     """
     获取所有模型的负载均衡器状态
     
-    需要认证
+    返回每个上游的健康状态、熔断状态、活跃连接数、请求/失败总数、延迟 EWMA 和最近错误率
+    数据来自缓存的快照（最多 1 秒前），不与请求处理争用
+    
+    需要认证；上游地址（api_base）和 Key 状态只在同时带有管理 Token（X-Admin-Token）时返回
     """
     try:
-        stats = {}
-        
-        # 获取所有模型
+        snapshot = get_balancer_snapshot()
         models = await plugin_manager.list_models()
         
-        # TODO: 从每个模型的转发器获取负载均衡器统计信息
-        # 这需要在插件管理器中添加方法来获取转发器实例
-        
         return {
             "success": True,
-            "models": list(models.keys()),
-            "message": "负载均衡器统计功能开发中",
+            "generated_at": snapshot["generated_at"],
+            "models": {
+                model_name: _public_balancer_stats(stats, is_admin)
+                for model_name, stats in snapshot["models"].items()
+            },
+            # 还没有收到请求的模型尚未创建负载均衡器
+            "idle_models": [name for name in models if name not in snapshot["models"]],
         }
     
     except Exception as e:
@@ -53,11 +78,13 @@ async def get_model_stats(
     request: Request,
     plugin_manager=Depends(get_plugin_manager),
     auth_result=Depends(verify_api_key),
+    is_admin: bool = Depends(has_admin_token),
 ):
     """
     获取指定模型的负载均衡统计
     
-    返回该模型所有上游服务器的健康状态、请求统计等
+    返回该模型所有上游服务器的健康状态、请求统计等；
+    上游地址和 Key 状态只在同时带有管理 Token（X-Admin-Token）时返回
     """
     try:
         model_config = await plugin_manager.get_model_config(model_name)
@@ -68,17 +95,23 @@ async def get_model_stats(
                 "error": f"模型 {model_name} 不存在",
             }
         
-        # TODO: 获取该模型的负载均衡器统计
+        snapshot = get_balancer_snapshot()
+        balancer_stats = _public_balancer_stats(snapshot["models"].get(model_name), is_admin)
+        
+        config = {
+            "has_load_balancer": "upstreams" in model_config,
+            "upstreams_count": len(model_config.get("upstreams") or []) or 1,
+        }
+        if is_admin:
+            config["api_base"] = model_config.get("api_base", "N/A")
         
         return {
             "success": True,
             "model": model_name,
-            "config": {
-                "api_base": model_config.get("api_base", "N/A"),
-                "has_load_balancer": "upstreams" in model_config,
-                "upstreams_count": len(model_config.get("upstreams", [])),
-            },
-            "message": "详细统计功能开发中",
+            "generated_at": snapshot["generated_at"],
+            "config": config,
+            # 模型还没有收到请求时为 None
+            "load_balancer": balancer_stats,
         }
     
     except Exception as e:
@@ -89,6 +122,133 @@ async def get_model_stats(
         }
 
 
+@router.get("/stats/concurrency")
+async def get_concurrency_stats(
+    request: Request,
+    auth_result=Depends(verify_api_key),
+    is_admin: bool = Depends(has_admin_token),
+):
+    """
+    获取 API Key 当前的并发占用情况
+    
+    需要认证；只返回调用者自己的 Key，同时带有管理 Token（X-Admin-Token）时返回所有 Key
+    """
+    key_id = None if is_admin else resolve_key_id(auth_result)
+    
+    return {
+        "success": True,
+        **request.app.state.concurrency_limiter.get_stats(key_id),
+    }
+
+
+@router.get("/stats/pipeline")
+async def get_stats_pipeline_stats(
+    plugin_manager=Depends(get_plugin_manager),
+    auth_result=Depends(verify_api_key),
+):
+    """
+    获取异步统计管道的队列状态（排队数、丢弃数、插件错误数）
+    
+    需要认证
+    """
+    if not plugin_manager.stats_pipeline:
+        return {"success": True, "enabled": False}
+    
+    return {
+        "success": True,
+        "enabled": True,
+        **plugin_manager.stats_pipeline.get_stats(),
+    }
+
+
+def _parse_time(value: Optional[str], default: float) -> float:
+    """解析时间参数（Unix 时间戳或 ISO 8601 格式）"""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"无效的时间: {value}，请使用 Unix 时间戳或 ISO 8601 格式")
+
+
+@router.get("/stats/usage")
+async def get_usage_stats(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    group_by: str = "model",
+    bucket: Optional[str] = None,
+    user: Optional[str] = None,
+    plugin_manager=Depends(get_plugin_manager),
+    auth_result=Depends(verify_api_key),
+    is_admin: bool = Depends(has_admin_token),
+):
+    """
+    查询时间范围内的 token 用量、成本和延迟
+    
+    数据来自持久化统计插件（sqlite 或 columnar）的分钟汇总，需要在 plugins.stats 中启用
+    
+    参数:
+    - start / end: 时间范围（Unix 时间戳或 ISO 8601），默认最近 24 小时
+    - group_by: 分组维度，逗号分隔（model, user, upstream），为空表示不分组
+    - bucket: 时间粒度（minute, hour, day），默认整个范围汇总
+    - user: 只查询指定用户，默认查询所有用户（需要管理 Token）
+    
+    需要认证：API Key 只能查询自己的用量，
+    同时带有管理 Token（X-Admin-Token: <profiling.admin_token>）时可以查询所有用户
+    """
+    if not is_admin:
+        own_user = auth_result.get("user_id") or ""
+        if user is not None and user != own_user:
+            return JSONResponse(
+                status_code=403,
+                content={"success": False, "error": "只能查询自己的用量，查询其他用户需要管理 Token"},
+            )
+        user = own_user
+    
+    plugin = next(
+        (p for p in plugin_manager.stats_plugins if hasattr(p, "query_usage")),
+        None,
+    )
+    if plugin is None:
+        return {
+            "success": False,
+            "error": "没有启用支持用量查询的统计插件（sqlite 或 columnar）",
+        }
+    
+    try:
+        end_ts = _parse_time(end, time.time())
+        start_ts = _parse_time(start, end_ts - 86400)
+        dimensions = [item.strip() for item in group_by.split(",") if item.strip()]
+        
+        rows = await plugin.query_usage(start_ts, end_ts, group_by=dimensions, bucket=bucket or None, user=user)
+    
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": str(e),
+        }
+    except Exception as e:
+        logger.exception(f"查询用量统计失败: {e}")
+        return {
+            "success": False,
+            "error": str(e),
+        }
+    
+    return {
+        "success": True,
+        "start": start_ts,
+        "end": end_ts,
+        "group_by": dimensions,
+        "bucket": bucket or None,
+        "user": user,
+        "data": rows,
+    }
+
+
 @router.get("/health/detailed")
 async def detailed_health_check(
     request: Request,
@@ -96,18 +256,54 @@ async def detailed_health_check(
     """
     详细的健康检查
     
-    包括所有上游服务器的健康状态
+    汇总每个模型的上游熔断状态（不包含上游地址）：
+    - healthy: 所有上游都健康（closed）
+    - degraded: 部分上游不健康，但每个模型至少还有一个健康或正在探测恢复（half_open）的上游
+    - unhealthy: 有模型的上游全部处于熔断冷却中（open，返回 503）
+    
     不需要认证（用于监控系统）
     """
-    return {
-        "status": "healthy",
-        "version": "0.1.0",
+    snapshot = get_balancer_snapshot()
+    
+    models = {}
+    for model_name, stats in snapshot["models"].items():
+        total = stats["total_servers"]
+        circuits = [server["circuit"] for server in stats["servers"]]
+        healthy = circuits.count("closed")
+        recovering = circuits.count("half_open")
+        if healthy == total:
+            model_status = "healthy"
+        elif healthy + recovering > 0:
+            model_status = "degraded"
+        else:
+            model_status = "unhealthy"
+        
+        models[model_name] = {
+            "status": model_status,
+            "healthy_upstreams": healthy,
+            "recovering_upstreams": recovering,
+            "total_upstreams": total,
+            "active_connections": sum(server["active_connections"] for server in stats["servers"]),
+        }
+    
+    statuses = {model["status"] for model in models.values()}
+    if "unhealthy" in statuses:
+        status = "unhealthy"
+    elif "degraded" in statuses:
+        status = "degraded"
+    else:
+        status = "healthy"
+    
+    content = {
+        "status": status,
+        "version": __version__,
+        "generated_at": snapshot["generated_at"],
+        "models": models,
         "features": {
             "load_balancing": True,
             "streaming": True,
             "token_extraction": True,
             "plugins": True,
         },
-        "message": "LLM One API 运行正常",
     }
-
+    return JSONResponse(status_code=503 if status == "unhealthy" else 200, content=content)
@@ -46,6 +46,17 @@ class Settings(BaseSettings):
         description="认证配置"
     )
     
+    # 认证缓存配置
+    auth_cache: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "ttl": 60,
+            "negative_ttl": 5,
+            "max_entries": 10000,
+        },
+        description="认证缓存配置"
+    )
+    
     # 模型配置
     models: Dict[str, Any] = Field(
         default_factory=lambda: {
@@ -58,6 +69,17 @@ class Settings(BaseSettings):
         description="模型配置"
     )
     
+    # Tokenizer 配置
+    tokenizer: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "assets_dir": None,
+            "offline": False,
+            "preload": True,
+            "preload_timeout": 30,
+        },
+        description="Tokenizer 配置"
+    )
+    
     # 统计配置
     stats: Dict[str, Any] = Field(
         default_factory=lambda: {
@@ -68,6 +90,55 @@ class Settings(BaseSettings):
         description="统计配置"
     )
     
+    # 异步统计管道（统计插件在后台批量调用，不阻塞请求）
+    stats_pipeline: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "max_queue": 10000,
+            "batch_size": 100,
+            "flush_interval": 0.5,
+            "overflow": "drop_oldest",
+            "shutdown_timeout": 10,
+        },
+        description="异步统计管道配置"
+    )
+    
+    # Prometheus 指标配置（GET /metrics）
+    metrics: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "enabled": False,
+            "token": "",
+            "max_series": 1000,
+        },
+        description="Prometheus 指标配置"
+    )
+    
+    # 链路追踪配置（按阶段记录 span，导出为 OTLP JSON Lines）
+    tracing: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "enabled": False,
+            "sample_rate": 0.01,
+            "trust_incoming_sampling": False,
+            "server_timing": True,
+            "export_path": "logs/traces.jsonl",
+            "max_queue": 10000,
+            "service_name": "llm-one-api",
+        },
+        description="链路追踪配置"
+    )
+    
+    # 按需性能分析（POST /admin/profile，需要管理 Token）
+    profiling: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "enabled": False,
+            "admin_token": "",
+            "default_duration": 10,
+            "max_duration": 60,
+            "sample_interval": 0.01,
+        },
+        description="性能分析配置"
+    )
+    
     # 限流配置
     rate_limit: Dict[str, Any] = Field(
         default_factory=lambda: {
@@ -77,6 +148,54 @@ class Settings(BaseSettings):
         description="限流配置"
     )
     
+    # 批处理配置（/v1/files + /v1/batches）
+    batch: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "storage_dir": "data/batches",
+            "default_concurrency": 4,
+            "model_concurrency": {},
+            "checkpoint_interval": 100,
+            "max_file_bytes": 200 * 1024 * 1024,
+        },
+        description="批处理配置"
+    )
+    
+    # API Key 并发限制默认值（可被认证插件返回的 metadata 覆盖）
+    concurrency_limits: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "max_concurrent_requests": None,
+            "max_concurrent_streams": None,
+        },
+        description="API Key 并发限制配置"
+    )
+    
+    # 全局重试预算
+    retry_budget: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "ratio": 0.2,
+            "min_per_second": 1.0,
+        },
+        description="全局重试预算配置"
+    )
+    
+    # 异步任务配置（Prefer: respond-async）
+    async_jobs: Dict[str, Any] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "max_concurrent": 32,
+            "max_pending": 1000,
+            "max_jobs": 10000,
+            "result_ttl": 3600,
+            "max_wait": 60,
+            "webhook_timeout": 10,
+            "webhooks_enabled": False,
+            "callback_allowlist": [],
+            "allow_private_callbacks": False,
+        },
+        description="异步任务配置"
+    )
+    
     class Config:
         env_prefix = "LLM_ONE_API_"
         case_sensitive = False
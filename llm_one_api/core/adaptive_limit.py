@@ -0,0 +1,131 @@
+"""
+自适应并发上限（AIMD）
+
+上游的限流阈值未知且随时间变化，固定的 max_inflight 要么过于保守，要么频繁触发 429
+每个上游维护一个自适应的并发上限：
+- 加性增长：上限被实际用到（在途请求数 >= 上限的一半）且请求成功时，上限 +1
+- 乘性减少：上游返回 429/503、请求超时，或延迟明显升高时，上限 × backoff_ratio
+
+延迟升高的判断参考 Gradient 算法：短期延迟均值超过长期基线的 latency_tolerance 倍
+流式请求使用首 token 延迟；非流式请求的完整响应时间随输出长度增长，
+有输出 token 数时使用每个输出 token 的平均耗时（长输出不会被误判为上游变慢）
+不同类型的延迟信号分别维护基线，互不比较
+
+配置示例（模型级别，对每个上游生效）：
+    adaptive_concurrency:
+      enabled: true
+      initial_limit: 10
+      min_limit: 1
+      max_limit: 200          # 上游配置了 max_inflight 时取两者中较小的值
+      backoff_ratio: 0.9
+      latency_tolerance: 2.0  # 设为 null 时只根据 429 等错误调整
+"""
+
+from typing import Any, Dict, List, Optional
+
+# 短期和长期延迟均值的平滑系数
+_SHORT_ALPHA = 0.3
+_LONG_ALPHA = 0.02
+
+# 延迟样本数达到该值后才开始判断延迟升高
+_WARMUP_SAMPLES = 10
+
+
+class AdaptiveLimit:
+    """AIMD 并发上限"""
+    
+    def __init__(
+        self,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        backoff_ratio: float = 0.9,
+        latency_tolerance: Optional[float] = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        
+        self._limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        
+        # 延迟信号类型 -> [短期均值, 长期均值, 样本数]
+        self._latency: Dict[str, List[float]] = {}
+        
+        self.total_increases = 0
+        self.total_decreases = 0
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], max_inflight: Optional[int] = None) -> "AdaptiveLimit":
+        """根据配置创建自适应上限（max_inflight 作为硬上限）"""
+        max_limit = config.get("max_limit", 200)
+        if max_inflight is not None:
+            max_limit = min(max_limit, max_inflight)
+        
+        return cls(
+            initial_limit=config.get("initial_limit", 10),
+            min_limit=config.get("min_limit", 1),
+            max_limit=max_limit,
+            backoff_ratio=config.get("backoff_ratio", 0.9),
+            latency_tolerance=config.get("latency_tolerance", 2.0),
+        )
+    
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return int(self._limit)
+    
+    def on_success(self, inflight: int, latency: Optional[float] = None, signal: str = "latency"):
+        """
+        请求成功
+        
+        Args:
+            inflight: 请求结束时的在途请求数（包括本请求）
+            latency: 延迟信号（秒）
+            signal: 延迟信号类型（latency: 首 token 延迟或完整响应时间，per_token: 每个输出 token 的耗时）
+        """
+        if latency is not None and self._observe_latency(signal, latency):
+            self._decrease()
+            return
+        
+        # 只有上限被实际用到时才增长，避免空闲时上限无限增大
+        if inflight * 2 >= self._limit and self._limit < self.max_limit:
+            self._limit = min(self._limit + 1, self.max_limit)
+            self.total_increases += 1
+    
+    def on_overload(self):
+        """上游过载（429/503/超时）"""
+        self._decrease()
+    
+    def _decrease(self):
+        """乘性减少"""
+        self._limit = max(self._limit * self.backoff_ratio, self.min_limit)
+        self.total_decreases += 1
+    
+    def _observe_latency(self, signal: str, latency: float) -> bool:
+        """记录延迟样本，返回该类型的延迟是否明显升高"""
+        state = self._latency.get(signal)
+        if state is None:
+            state = self._latency[signal] = [latency, latency, 0]
+        else:
+            state[0] += _SHORT_ALPHA * (latency - state[0])
+            state[1] += _LONG_ALPHA * (latency - state[1])
+        
+        state[2] += 1
+        
+        if self.latency_tolerance is None or state[2] < _WARMUP_SAMPLES:
+            return False
+        
+        return state[0] > state[1] * self.latency_tolerance
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "limit": self.limit,
+            "latency": {
+                signal: {"short": round(state[0], 4), "long": round(state[1], 4)}
+                for signal, state in self._latency.items()
+            },
+            "total_increases": self.total_increases,
+            "total_decreases": self.total_decreases,
+        }
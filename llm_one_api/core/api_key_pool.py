@@ -0,0 +1,189 @@
+"""
+上游 API Key 池
+
+一个上游可以配置多个 API Key（通常来自同一服务商的不同组织或项目），
+每个 Key 有独立的限流额度，请求在 Key 之间轮换，总吞吐随 Key 数量增长：
+    upstreams:
+      - api_base: "https://api.openai.com/v1"
+        api_keys: ["sk-org-a", "sk-org-b", "sk-org-c"]
+        key_cooldown: 10          # Key 返回 429 且没有 Retry-After 时暂停使用的时间（秒）
+        key_auth_cooldown: 300    # Key 返回 401/403 时暂停使用的时间（秒）
+
+选择 Key 时：
+- 暂停中的 Key 和限流额度已用完的 Key 不参与选择（都不可用时退而求其次）
+- 在途请求最少、剩余额度最多的 Key 优先，条件相同时轮换
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from llm_one_api.core.retry import parse_retry_after
+from llm_one_api.core.upstream_quota import UpstreamQuota
+from llm_one_api.utils.logger import logger
+
+DEFAULT_COOLDOWN = 10.0
+DEFAULT_AUTH_COOLDOWN = 300.0
+
+# 说明 Key 本身无效或无权限的状态码
+AUTH_ERROR_STATUS = (401, 403)
+
+
+def is_key_error(error: Optional[BaseException]) -> bool:
+    """判断错误是否只与所用的 Key 有关（限流、无效或无权限），换一个 Key 可能成功"""
+    return (
+        isinstance(error, httpx.HTTPStatusError)
+        and (error.response.status_code == 429 or error.response.status_code in AUTH_ERROR_STATUS)
+    )
+
+
+def mask_key(value: str) -> str:
+    """脱敏显示 API Key"""
+    if len(value) <= 8:
+        return "***"
+    return f"{value[:3]}...{value[-4:]}"
+
+
+@dataclass
+class UpstreamKey:
+    """上游的单个 API Key"""
+    value: str
+    quota: UpstreamQuota = field(default_factory=UpstreamQuota)
+    
+    # 暂停使用（429/401/403）
+    benched_until: float = 0.0
+    bench_reason: Optional[str] = None
+    
+    # 使用统计
+    active: int = 0
+    total_requests: int = 0
+    total_failures: int = 0
+    total_throttled: int = 0
+    total_auth_errors: int = 0
+    
+    @property
+    def benched(self) -> bool:
+        """是否处于暂停状态"""
+        return time.monotonic() < self.benched_until
+    
+    @property
+    def available(self) -> bool:
+        """是否可以使用（未暂停且额度未用完）"""
+        return not self.benched and not self.quota.exhausted
+
+
+class ApiKeyPool:
+    """上游的 API Key 池"""
+    
+    def __init__(
+        self,
+        keys: List[str],
+        cooldown: float = DEFAULT_COOLDOWN,
+        auth_cooldown: float = DEFAULT_AUTH_COOLDOWN,
+    ):
+        """
+        初始化 Key 池
+        
+        Args:
+            keys: API Key 列表
+            cooldown: Key 返回 429 且没有 Retry-After 时暂停使用的时间（秒）
+            auth_cooldown: Key 返回 401/403 时暂停使用的时间（秒）
+        """
+        self.keys = [UpstreamKey(value=value) for value in keys] or [UpstreamKey(value="")]
+        self.cooldown = cooldown
+        self.auth_cooldown = auth_cooldown
+        self._next = 0
+    
+    def acquire(self) -> UpstreamKey:
+        """
+        选择一个 Key 并标记请求开始
+        
+        Returns:
+            选中的 Key，请求结束后必须调用 release()
+        """
+        candidates = (
+            [k for k in self.keys if k.available]
+            or [k for k in self.keys if not k.benched]
+            or [min(self.keys, key=lambda k: k.benched_until)]
+        )
+        
+        # 从轮换位置开始查找，条件相同时选择靠前的 Key
+        start = self._next % len(candidates)
+        self._next += 1
+        rotated = candidates[start:] + candidates[:start]
+        key = min(rotated, key=lambda k: (k.active, -round(k.quota.headroom(), 1)))
+        
+        key.active += 1
+        key.total_requests += 1
+        return key
+    
+    def release(self, key: UpstreamKey, error: Optional[BaseException] = None):
+        """
+        标记请求结束
+        
+        Args:
+            key: acquire() 返回的 Key
+            error: 请求失败时的错误
+        """
+        key.active -= 1
+        
+        if error is None:
+            return
+        
+        key.total_failures += 1
+        
+        if not isinstance(error, httpx.HTTPStatusError):
+            return
+        
+        status_code = error.response.status_code
+        
+        if status_code == 429:
+            key.total_throttled += 1
+            retry_after = parse_retry_after(error.response)
+            self._bench(key, retry_after if retry_after is not None else self.cooldown, "throttled")
+        elif status_code in AUTH_ERROR_STATUS:
+            key.total_auth_errors += 1
+            self._bench(key, self.auth_cooldown, f"http_{status_code}")
+    
+    def _bench(self, key: UpstreamKey, duration: float, reason: str):
+        """暂停使用 Key"""
+        key.benched_until = max(key.benched_until, time.monotonic() + duration)
+        key.bench_reason = reason
+        
+        if len(self.keys) > 1:
+            logger.warning(f"暂停使用 API Key {mask_key(key.value)} {duration:.1f}s: {reason}")
+    
+    @property
+    def has_available(self) -> bool:
+        """是否还有未暂停的 Key"""
+        return any(not k.benched for k in self.keys)
+    
+    @property
+    def exhausted(self) -> bool:
+        """所有 Key 都不可用（暂停或额度用完）"""
+        return not any(k.available for k in self.keys)
+    
+    def headroom(self) -> float:
+        """剩余额度比例（未暂停的 Key 中最大的一个）"""
+        return max((k.quota.headroom() for k in self.keys if not k.benched), default=0.0)
+    
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """获取每个 Key 的统计信息（Key 已脱敏）"""
+        now = time.monotonic()
+        return [
+            {
+                "key": mask_key(key.value),
+                "available": key.available,
+                "benched_for": round(key.benched_until - now, 3) if key.benched else None,
+                "bench_reason": key.bench_reason if key.benched else None,
+                "active": key.active,
+                "total_requests": key.total_requests,
+                "total_failures": key.total_failures,
+                "total_throttled": key.total_throttled,
+                "total_auth_errors": key.total_auth_errors,
+                "quota": key.quota.get_stats(),
+            }
+            for key in self.keys
+        ]
@@ -0,0 +1,680 @@
+"""
+批处理执行器
+
+实现 OpenAI 兼容的 Batch API：
+- 输入为 /v1/files 上传的 JSONL 文件，每行一个请求
+- 后台调度器复用现有转发器执行请求，每个模型独立限制并发
+- 结果逐行追加到输出文件，输出文件本身就是检查点，服务重启后从断点继续
+- 完成后输出文件登记到文件存储，可通过 /v1/files/{id}/content 下载
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from pydantic import ValidationError as PydanticValidationError
+
+from llm_one_api.core.deadline import Deadline
+from llm_one_api.core.file_store import FileStore
+from llm_one_api.core.forwarder import NonStreamForwarder
+from llm_one_api.core.request_handler import RequestHandler
+from llm_one_api.models.request import ChatCompletionRequest, CompletionRequest, EmbeddingRequest
+from llm_one_api.utils.exceptions import (
+    DeadlineExceededError,
+    LLMOneAPIError,
+    ModelNotFoundError,
+    OverloadedError,
+    ValidationError,
+)
+from llm_one_api.utils.logger import logger
+
+# 支持的接口 -> (请求模型, 请求处理方法, 转发方法)
+ENDPOINTS = {
+    "/v1/chat/completions": (ChatCompletionRequest, "process_chat_request", "forward_chat"),
+    "/v1/completions": (CompletionRequest, "process_completion_request", "forward_completion"),
+    "/v1/embeddings": (EmbeddingRequest, "process_embedding_request", "forward_embedding"),
+}
+
+COMPLETION_WINDOWS = {"24h": 24 * 3600}
+
+# 未结束的批处理状态（服务启动时需要恢复）
+ACTIVE_STATUSES = {"validating", "in_progress", "finalizing", "cancelling"}
+
+# 批处理 ID 格式，其他 ID 不会被拼接到路径中
+BATCH_ID_PATTERN = re.compile(r"^batch_[0-9a-f]{32}$")
+
+# 每次在线程池中读取的输入行数
+READ_LINES = 256
+
+# 结果缓冲的最大条数和最长时间（秒），达到任一条件时在线程池中写入磁盘
+WRITE_BUFFER_RECORDS = 64
+WRITE_BUFFER_SECONDS = 1.0
+
+
+class BatchExecutor:
+    """批处理执行器"""
+    
+    def __init__(self, config: Dict[str, Any], plugin_manager):
+        """
+        初始化批处理执行器
+        
+        Args:
+            config: 批处理配置
+            plugin_manager: 插件管理器
+        """
+        storage_dir = config.get("storage_dir", "data/batches")
+        
+        self.plugin_manager = plugin_manager
+        self.file_store = FileStore(storage_dir)
+        self.root = Path(storage_dir) / "batches"
+        self.root.mkdir(parents=True, exist_ok=True)
+        
+        self.default_concurrency = config.get("default_concurrency", 4)
+        self.model_concurrency: Dict[str, int] = config.get("model_concurrency", {}) or {}
+        self.checkpoint_interval = config.get("checkpoint_interval", 100)
+        # 上传文件大小上限（字节）
+        self.max_file_bytes = config.get("max_file_bytes", 200 * 1024 * 1024)
+        
+        # 模型名称 -> 并发信号量（所有批处理共享）
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # batch_id -> 后台任务
+        self._runners: Dict[str, asyncio.Task] = {}
+        # batch_id -> 运行中的批处理状态
+        self._active: Dict[str, Dict[str, Any]] = {}
+    
+    async def start(self):
+        """启动执行器，恢复未完成的批处理"""
+        resumed = 0
+        
+        for path in self.root.glob("*.json"):
+            batch = self._load(path.stem)
+            if batch and batch["status"] in ACTIVE_STATUSES:
+                self._spawn(batch)
+                resumed += 1
+        
+        logger.info(f"批处理执行器已启动，恢复 {resumed} 个未完成的批处理")
+    
+    async def stop(self):
+        """停止执行器（未完成的批处理在下次启动时恢复）"""
+        runners = list(self._runners.values())
+        
+        for task in runners:
+            task.cancel()
+        
+        if runners:
+            await asyncio.gather(*runners, return_exceptions=True)
+        
+        logger.info("批处理执行器已停止")
+    
+    def create_batch(
+        self,
+        input_file_id: str,
+        endpoint: str,
+        completion_window: str,
+        auth_result: Dict[str, Any],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        创建批处理
+        
+        Args:
+            input_file_id: 输入文件 ID
+            endpoint: 请求接口
+            completion_window: 完成时间窗口
+            auth_result: 创建者的认证结果
+            metadata: 用户自定义元数据
+        
+        Returns:
+            批处理对象
+        """
+        if endpoint not in ENDPOINTS:
+            raise ValidationError(f"不支持的接口: {endpoint}，支持: {', '.join(ENDPOINTS)}")
+        
+        if completion_window not in COMPLETION_WINDOWS:
+            raise ValidationError(f"不支持的 completion_window: {completion_window}")
+        
+        file_meta = self.file_store.get(input_file_id) if FileStore.is_valid_id(input_file_id) else None
+        if not file_meta or file_meta.get("owner") != auth_result.get("user_id"):
+            raise LLMOneAPIError(f"文件 {input_file_id} 不存在", status_code=404, error_type="not_found")
+        
+        if file_meta.get("purpose") != "batch":
+            raise ValidationError(f"文件 {input_file_id} 的 purpose 必须为 batch")
+        
+        now = int(time.time())
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": None,
+            "expires_at": now + COMPLETION_WINDOWS[completion_window],
+            "finalizing_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "expired_at": None,
+            "cancelling_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": metadata,
+            # 内部字段
+            "_owner": auth_result.get("user_id"),
+            "_auth": {"user_id": auth_result.get("user_id"), "metadata": auth_result.get("metadata")},
+            "_output_file_id": FileStore.new_file_id(),
+            "_error_file_id": FileStore.new_file_id(),
+        }
+        
+        self._save(batch)
+        self._spawn(batch)
+        
+        logger.info(f"批处理已创建: {batch_id}, 接口={endpoint}, 输入文件={input_file_id}")
+        return batch
+    
+    def get_batch(self, batch_id: str, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """获取批处理（运行中的批处理返回内存中的最新状态）"""
+        batch = self._active.get(batch_id) or self._load(batch_id)
+        
+        if batch is None or (owner is not None and batch.get("_owner") != owner):
+            return None
+        
+        return batch
+    
+    async def list_batches(self, owner: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """列出批处理（按创建时间倒序；磁盘上的状态在线程池中读取，运行中的批处理返回内存中的最新状态）"""
+        stored = await asyncio.get_running_loop().run_in_executor(None, self._load_all)
+        
+        batches = []
+        for batch in stored:
+            batch = self._active.get(batch["id"]) or batch
+            if owner is None or batch.get("_owner") == owner:
+                batches.append(batch)
+        
+        batches.sort(key=lambda b: b["created_at"], reverse=True)
+        return batches[:limit]
+    
+    def cancel_batch(self, batch_id: str, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        取消批处理
+        
+        正在执行的请求会继续完成，未开始的请求不再发送
+        """
+        batch = self.get_batch(batch_id, owner)
+        if batch is None:
+            return None
+        
+        if batch["status"] in ("validating", "in_progress"):
+            batch["status"] = "cancelling"
+            batch["cancelling_at"] = int(time.time())
+            self._save(batch)
+            
+            if batch_id not in self._runners:
+                self._spawn(batch)
+        
+        return batch
+    
+    @staticmethod
+    def to_public(batch: Dict[str, Any]) -> Dict[str, Any]:
+        """转换为对外返回的批处理对象（去掉内部字段）"""
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+    
+    def _spawn(self, batch: Dict[str, Any]):
+        """为批处理创建后台任务"""
+        self._active[batch["id"]] = batch
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._runners[batch["id"]] = task
+        
+        def on_done(_):
+            self._runners.pop(batch["id"], None)
+            self._active.pop(batch["id"], None)
+        
+        task.add_done_callback(on_done)
+    
+    async def _run_batch(self, batch: Dict[str, Any]):
+        """执行批处理"""
+        try:
+            if batch["status"] == "validating":
+                await self._validate(batch)
+            
+            if batch["status"] == "failed":
+                return
+            
+            if batch["status"] == "in_progress":
+                await self._execute(batch)
+            
+            self._finalize(batch)
+        
+        except asyncio.CancelledError:
+            # 服务关闭：保存当前进度，下次启动时继续
+            self._save(batch)
+            raise
+        
+        except Exception as e:
+            logger.exception(f"批处理执行失败: {batch['id']} - {e}")
+            batch["status"] = "failed"
+            batch["failed_at"] = int(time.time())
+            batch["errors"] = {
+                "object": "list",
+                "data": [{"code": "internal_error", "message": str(e), "line": None}],
+            }
+            self._save(batch)
+    
+    async def _validate(self, batch: Dict[str, Any]):
+        """校验输入文件（在线程池中执行，避免大文件阻塞事件循环）"""
+        input_path = self.file_store.content_path(batch["input_file_id"])
+        loop = asyncio.get_running_loop()
+        total, errors = await loop.run_in_executor(None, _validate_input, input_path, batch["endpoint"])
+        
+        if batch["status"] == "cancelling":
+            return
+        
+        if errors:
+            batch["status"] = "failed"
+            batch["failed_at"] = int(time.time())
+            batch["errors"] = {"object": "list", "data": errors}
+            logger.warning(f"批处理输入文件校验失败: {batch['id']}, 错误数={len(errors)}")
+        else:
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = int(time.time())
+            batch["request_counts"]["total"] = total
+        
+        self._save(batch)
+    
+    async def _execute(self, batch: Dict[str, Any]):
+        """逐行调度请求，结果追加到输出文件（文件读写都在线程池中执行）"""
+        loop = asyncio.get_running_loop()
+        output_path = self.file_store.content_path(batch["_output_file_id"])
+        error_path = self.file_store.content_path(batch["_error_file_id"])
+        
+        # 输出文件即检查点：已写入结果的请求不再重复执行
+        completed = await loop.run_in_executor(None, _load_progress, output_path)
+        failed = await loop.run_in_executor(None, _load_progress, error_path)
+        done = completed | failed
+        batch["request_counts"]["completed"] = len(completed)
+        batch["request_counts"]["failed"] = len(failed)
+        
+        if done:
+            logger.info(f"批处理从检查点恢复: {batch['id']}, 已完成 {len(done)} 个请求")
+        
+        in_flight: Set[asyncio.Task] = set()
+        output_file = _ResultWriter(output_path)
+        error_file = _ResultWriter(error_path)
+        input_file = open(self.file_store.content_path(batch["input_file_id"]), "rb")
+        
+        try:
+            while batch["status"] == "in_progress":
+                lines = await loop.run_in_executor(None, _read_lines, input_file, READ_LINES)
+                if not lines:
+                    break
+                
+                for line in lines:
+                    if batch["status"] != "in_progress":
+                        break
+                    
+                    if time.time() > batch["expires_at"]:
+                        batch["status"] = "expired"
+                        batch["expired_at"] = int(time.time())
+                        break
+                    
+                    if not line.strip():
+                        continue
+                    
+                    request = json.loads(line)
+                    if request["custom_id"] in done:
+                        continue
+                    
+                    # 获取模型并发名额后再继续调度，避免一次性加载整个文件
+                    model = (request.get("body") or {}).get("model", "")
+                    semaphore = self._get_semaphore(model)
+                    await semaphore.acquire()
+                    
+                    task = asyncio.ensure_future(
+                        self._execute_request(batch, request, semaphore, output_file, error_file)
+                    )
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+            
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            
+            await output_file.flush()
+            await error_file.flush()
+        
+        except asyncio.CancelledError:
+            for task in in_flight:
+                task.cancel()
+            raise
+        
+        finally:
+            input_file.close()
+            # 服务关闭时同步写入剩余的结果，保证检查点完整
+            output_file.close()
+            error_file.close()
+    
+    async def _execute_request(
+        self,
+        batch: Dict[str, Any],
+        request: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+        output_file: "_ResultWriter",
+        error_file: "_ResultWriter",
+    ):
+        """执行单个请求并写入结果"""
+        record = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": None,
+            "error": None,
+        }
+        
+        try:
+            response = await self._forward(batch, request.get("body") or {})
+            record["response"] = {"status_code": 200, "request_id": response.get("id"), "body": response}
+            target = output_file
+            batch["request_counts"]["completed"] += 1
+        
+        except LLMOneAPIError as e:
+            record["response"] = {
+                "status_code": e.status_code,
+                "request_id": None,
+                "body": {"error": {"message": e.message, "type": e.error_type}},
+            }
+            target = error_file
+            batch["request_counts"]["failed"] += 1
+        
+        except Exception as e:
+            record["error"] = {"code": "internal_error", "message": str(e)}
+            target = error_file
+            batch["request_counts"]["failed"] += 1
+        
+        finally:
+            semaphore.release()
+        
+        await target.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        
+        counts = batch["request_counts"]
+        if (counts["completed"] + counts["failed"]) % self.checkpoint_interval == 0:
+            await output_file.flush()
+            await error_file.flush()
+            self._save(batch)
+    
+    async def _forward(self, batch: Dict[str, Any], body: Dict[str, Any]) -> Dict[str, Any]:
+        """通过现有转发器执行请求"""
+        request_model, process_method, forward_method = ENDPOINTS[batch["endpoint"]]
+        
+        # 批处理只支持非流式
+        body = dict(body)
+        body.pop("stream", None)
+        
+        try:
+            request_data = request_model(**body)
+        except PydanticValidationError as e:
+            raise ValidationError(f"请求参数错误: {e}")
+        
+        model_config = await self.plugin_manager.get_model_config(request_data.model)
+        if not model_config:
+            raise ModelNotFoundError(request_data.model)
+        
+        handler = RequestHandler(model_config)
+        processed_request = getattr(handler, process_method)(request_data)
+        
+        # 批处理请求以 batch 优先级调度，不影响交互式请求的延迟
+        auth_result = dict(batch["_auth"], priority="batch")
+        
+        # 请求（包括过载重试和排队）不能超过批处理的完成时间窗口
+        remaining = batch["expires_at"] - time.time()
+        if remaining <= 0:
+            raise DeadlineExceededError("批处理已超过完成时间窗口")
+        
+        forwarder = NonStreamForwarder(model_config, self.plugin_manager, deadline=Deadline(remaining))
+        
+        # 上游过载时等待后重试，而不是把请求记为失败
+        while True:
+            try:
+                return await getattr(forwarder, forward_method)(processed_request, auth_result)
+            except OverloadedError as e:
+                if batch["status"] != "in_progress" or forwarder.deadline.remaining() <= e.retry_after:
+                    raise
+                await asyncio.sleep(e.retry_after)
+    
+    def _finalize(self, batch: Dict[str, Any]):
+        """登记输出文件并更新最终状态"""
+        now = int(time.time())
+        owner = batch["_owner"]
+        
+        if batch["status"] == "in_progress":
+            batch["status"] = "finalizing"
+            batch["finalizing_at"] = now
+        
+        for key, public_key, suffix in (
+            ("_output_file_id", "output_file_id", "output"),
+            ("_error_file_id", "error_file_id", "errors"),
+        ):
+            path = self.file_store.content_path(batch[key])
+            if path.exists() and path.stat().st_size > 0:
+                self.file_store.register(
+                    batch[key], f"{batch['id']}_{suffix}.jsonl", "batch_output", owner
+                )
+                batch[public_key] = batch[key]
+        
+        if batch["status"] == "finalizing":
+            batch["status"] = "completed"
+            batch["completed_at"] = now
+        elif batch["status"] == "cancelling":
+            batch["status"] = "cancelled"
+            batch["cancelled_at"] = now
+        
+        self._save(batch)
+        
+        counts = batch["request_counts"]
+        logger.info(
+            f"批处理结束: {batch['id']}, 状态={batch['status']}, "
+            f"成功={counts['completed']}, 失败={counts['failed']}, 总数={counts['total']}"
+        )
+    
+    def _get_semaphore(self, model: str) -> asyncio.Semaphore:
+        """获取模型的并发信号量"""
+        semaphore = self._semaphores.get(model)
+        
+        if semaphore is None:
+            limit = self.model_concurrency.get(model, self.default_concurrency)
+            semaphore = asyncio.Semaphore(max(int(limit), 1))
+            self._semaphores[model] = semaphore
+        
+        return semaphore
+    
+    def _load(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """从磁盘加载批处理状态"""
+        if not BATCH_ID_PATTERN.match(batch_id):
+            return None
+        
+        path = self.root / f"{batch_id}.json"
+        
+        if not path.exists():
+            return None
+        
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    def _load_all(self) -> List[Dict[str, Any]]:
+        """从磁盘加载所有批处理状态（在线程池中执行）"""
+        batches = []
+        
+        for path in self.root.glob("*.json"):
+            batch = self._load(path.stem)
+            if batch:
+                batches.append(batch)
+        
+        return batches
+    
+    def _save(self, batch: Dict[str, Any]):
+        """原子写入批处理状态"""
+        path = self.root / f"{batch['id']}.json"
+        tmp_path = path.with_suffix(".json.tmp")
+        
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(batch, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+
+def _validate_input(path: Path, endpoint: str):
+    """
+    校验输入文件
+    
+    Returns:
+        (请求总数, 错误列表)
+    """
+    total = 0
+    errors = []
+    custom_ids = set()
+    
+    def add_error(code: str, message: str, line: int):
+        if len(errors) < 100:
+            errors.append({"code": code, "message": message, "line": line})
+    
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError:
+                add_error("invalid_json_line", "无法解析 JSON", line_no)
+                continue
+            
+            if not isinstance(request, dict) or not request.get("custom_id"):
+                add_error("missing_required_parameter", "缺少 custom_id", line_no)
+                continue
+            
+            if request["custom_id"] in custom_ids:
+                add_error("duplicate_custom_id", f"重复的 custom_id: {request['custom_id']}", line_no)
+                continue
+            
+            if request.get("url") != endpoint:
+                add_error("mismatched_endpoint", f"请求 url 与批处理接口 {endpoint} 不一致", line_no)
+                continue
+            
+            if not isinstance(request.get("body"), dict) or not request["body"].get("model"):
+                add_error("missing_required_parameter", "body 中缺少 model", line_no)
+                continue
+            
+            custom_ids.add(request["custom_id"])
+            total += 1
+    
+    if total == 0 and not errors:
+        add_error("empty_file", "输入文件中没有请求", 0)
+    
+    return total, errors
+
+
+def _read_lines(f, count: int) -> List[bytes]:
+    """读取最多 count 行（在线程池中执行）"""
+    lines = []
+    for _ in range(count):
+        line = f.readline()
+        if not line:
+            break
+        lines.append(line)
+    return lines
+
+
+def _load_progress(path: Path) -> Set[str]:
+    """
+    逐行读取输出文件中已完成的 custom_id（在线程池中执行）
+    
+    如果服务在写入过程中退出，最后一行可能不完整，此时截断到最后一个完整行
+    """
+    if not path.exists():
+        return set()
+    
+    custom_ids = set()
+    valid_size = 0
+    
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid_size += len(line)
+            if line.strip():
+                custom_ids.add(json.loads(line)["custom_id"])
+    
+    if valid_size < path.stat().st_size:
+        with open(path, "r+b") as f:
+            f.truncate(valid_size)
+    
+    return custom_ids
+
+
+class _ResultWriter:
+    """
+    结果文件写入器
+    
+    结果先缓存在内存中，达到条数或时间上限时在线程池中写入磁盘并 flush，
+    不在事件循环上执行文件 I/O；服务异常退出时缓冲中的结果会丢失，对应请求在恢复后重新执行
+    """
+    
+    def __init__(self, path: Path):
+        self._file = open(path, "ab")
+        self._buffer: List[bytes] = []
+        self._last_flush = time.monotonic()
+        # 保证多次 flush 按顺序写入
+        self._lock = asyncio.Lock()
+        # 保护文件句柄：线程池中尚未完成的写入数，close() 后由最后一次写入关闭文件
+        self._io_lock = threading.Lock()
+        self._outstanding = 0
+        self._closed = False
+    
+    async def write(self, data: bytes):
+        """追加一条结果"""
+        self._buffer.append(data)
+        
+        if (
+            len(self._buffer) >= WRITE_BUFFER_RECORDS
+            or time.monotonic() - self._last_flush >= WRITE_BUFFER_SECONDS
+        ):
+            await self.flush()
+    
+    async def flush(self):
+        """在线程池中写入缓冲的结果"""
+        async with self._lock:
+            if not self._buffer:
+                return
+            
+            data, self._buffer = b"".join(self._buffer), []
+            self._last_flush = time.monotonic()
+            
+            with self._io_lock:
+                self._outstanding += 1
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+    
+    def _write(self, data: bytes):
+        with self._io_lock:
+            self._file.write(data)
+            self._file.flush()
+            self._outstanding -= 1
+            if self._closed and not self._outstanding:
+                self._file.close()
+    
+    def close(self):
+        """同步写入剩余的结果；线程池中还有写入时由最后一次写入关闭文件"""
+        with self._io_lock:
+            if self._buffer:
+                self._file.write(b"".join(self._buffer))
+                self._file.flush()
+                self._buffer = []
+            self._closed = True
+            if not self._outstanding:
+                self._file.close()
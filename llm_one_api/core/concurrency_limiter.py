@@ -0,0 +1,160 @@
+"""
+按 API Key 限制并发
+
+RateLimitMiddleware 只限制每分钟请求数，无法限制一个 Key 同时占用的长连接（流式）数量
+这里按 API Key（以及 Key + 模型）统计在途的请求数和流数，超过上限时返回 429
+
+上限来自认证插件返回的 metadata，未设置时使用全局默认值：
+    metadata:
+      max_concurrent_requests: 20     # 该 Key 同时在途的请求数（包括流式）
+      max_concurrent_streams: 5       # 该 Key 同时打开的流数
+      model_limits:                   # 按模型的上限
+        gpt-4:
+          max_concurrent_requests: 4
+          max_concurrent_streams: 2
+"""
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from llm_one_api.core.metrics import record_rejection
+from llm_one_api.utils.exceptions import RateLimitError
+from llm_one_api.utils.logger import logger
+
+# 计数器键：(key_id, 模型（"*" 表示所有模型）, 类型)
+CounterKey = Tuple[str, str, str]
+
+ALL_MODELS = "*"
+
+
+def resolve_key_id(auth_result: Dict[str, Any]) -> str:
+    """并发计数使用的 Key 标识（没有 key_id 时使用 user_id）"""
+    return auth_result.get("key_id") or auth_result.get("user_id") or "anonymous"
+
+
+class ConcurrencySlot:
+    """已占用的并发名额，释放操作是幂等的"""
+    
+    def __init__(self, limiter: "ConcurrencyLimiter", counters: List[CounterKey]):
+        self._limiter = limiter
+        self._counters = counters
+        self._released = False
+    
+    def release(self):
+        """释放名额（可以重复调用）"""
+        if self._released:
+            return
+        
+        self._released = True
+        self._limiter._release(self._counters)
+    
+    async def wrap_stream(self, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """包装流式响应，流结束、出错或客户端断开时释放名额"""
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            self.release()
+
+
+class ConcurrencyLimiter:
+    """按 API Key 的并发限制器"""
+    
+    def __init__(self, config: Dict[str, Any]):
+        """
+        初始化并发限制器
+        
+        Args:
+            config: 并发限制配置
+                - max_concurrent_requests: 默认的每个 Key 在途请求数上限（None 表示不限制）
+                - max_concurrent_streams: 默认的每个 Key 流数上限（None 表示不限制）
+        """
+        self.default_limits = {
+            "requests": config.get("max_concurrent_requests"),
+            "streams": config.get("max_concurrent_streams"),
+        }
+        
+        self._inflight: Dict[CounterKey, int] = {}
+        self.total_rejected = 0
+    
+    def acquire(self, auth_result: Dict[str, Any], model: str, stream: bool = False) -> ConcurrencySlot:
+        """
+        占用一个并发名额
+        
+        Args:
+            auth_result: 认证结果
+            model: 模型名称
+            stream: 是否为流式请求
+        
+        Returns:
+            并发名额，请求结束后必须调用 release()
+        
+        Raises:
+            RateLimitError: 超过并发上限
+        """
+        key_id = resolve_key_id(auth_result)
+        metadata = auth_result.get("metadata") or {}
+        
+        kinds = ("requests", "streams") if stream else ("requests",)
+        counters = [(key_id, scope, kind) for scope in (ALL_MODELS, model) for kind in kinds]
+        
+        for counter in counters:
+            limit = self._get_limit(metadata, counter[1], counter[2])
+            if limit is not None and self._inflight.get(counter, 0) >= limit:
+                self.total_rejected += 1
+                record_rejection("concurrency")
+                scope = "" if counter[1] == ALL_MODELS else f"模型 {counter[1]} 的"
+                kind = "流" if counter[2] == "streams" else "请求"
+                logger.warning(f"并发超限: key={key_id}, {scope}并发{kind}数已达上限 {limit}")
+                raise RateLimitError(f"{scope}并发{kind}数已达上限 {limit}，请等待已有{kind}结束后重试")
+        
+        for counter in counters:
+            self._inflight[counter] = self._inflight.get(counter, 0) + 1
+        
+        return ConcurrencySlot(self, counters)
+    
+    def _get_limit(self, metadata: Dict[str, Any], scope: str, kind: str) -> Optional[int]:
+        """获取上限（模型级别只使用 model_limits，不回退到默认值）"""
+        name = f"max_concurrent_{kind}"
+        
+        if scope == ALL_MODELS:
+            return metadata.get(name, self.default_limits[kind])
+        
+        model_limits = (metadata.get("model_limits") or {}).get(scope) or {}
+        return model_limits.get(name)
+    
+    def _release(self, counters: List[CounterKey]):
+        """释放计数"""
+        for counter in counters:
+            count = self._inflight.get(counter, 0) - 1
+            if count > 0:
+                self._inflight[counter] = count
+            else:
+                self._inflight.pop(counter, None)
+    
+    def get_stats(self, key_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        获取当前占用情况
+        
+        Args:
+            key_id: 只返回该 Key 的占用情况（不包含全局的拒绝次数）；None 表示返回所有 Key
+        """
+        keys: Dict[str, Dict[str, Any]] = {}
+        
+        for (counter_key_id, scope, kind), count in self._inflight.items():
+            if key_id is not None and counter_key_id != key_id:
+                continue
+            entry = keys.setdefault(counter_key_id, {"requests": 0, "streams": 0, "models": {}})
+            if scope == ALL_MODELS:
+                entry[kind] = count
+            else:
+                entry["models"].setdefault(scope, {"requests": 0, "streams": 0})[kind] = count
+        
+        stats = {
+            "in_flight_requests": sum(entry["requests"] for entry in keys.values()),
+            "in_flight_streams": sum(entry["streams"] for entry in keys.values()),
+            "keys": keys,
+        }
+        if key_id is None:
+            stats["total_rejected"] = self.total_rejected
+        
+        return stats
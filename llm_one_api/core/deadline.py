@@ -0,0 +1,72 @@
+"""
+请求截止时间
+
+客户端通过请求头 `X-Request-Timeout: <秒>` 声明能够等待的总时间，
+未声明时使用模型配置的 request_timeout
+
+转发时每次尝试（包括排队等待上游名额）都只使用剩余的时间预算：
+单次尝试的超时取 min(上游 timeout, 剩余时间)，剩余时间不足时不再重试，直接返回 504
+"""
+
+import math
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from llm_one_api.utils.exceptions import ValidationError
+
+TIMEOUT_HEADER = "x-request-timeout"
+
+
+class Deadline:
+    """请求截止时间"""
+    
+    def __init__(self, timeout: float):
+        """
+        Args:
+            timeout: 从现在开始的时间预算（秒）
+        """
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+    
+    def remaining(self) -> float:
+        """剩余时间（秒）"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+    
+    @property
+    def expired(self) -> bool:
+        """是否已经超时"""
+        return self.remaining() <= 0
+    
+    def cap(self, timeout: float) -> float:
+        """把超时时间限制在剩余预算之内"""
+        return min(timeout, self.remaining())
+    
+    @classmethod
+    def from_request(
+        cls,
+        headers: Mapping[str, str],
+        model_config: Dict[str, Any],
+    ) -> Optional["Deadline"]:
+        """
+        根据请求头或模型配置创建截止时间
+        
+        Args:
+            headers: 请求头
+            model_config: 模型配置
+        
+        Returns:
+            截止时间，没有设置时返回 None
+        """
+        value = headers.get(TIMEOUT_HEADER)
+        
+        if value is not None:
+            try:
+                timeout = float(value)
+            except ValueError:
+                raise ValidationError(f"无效的 X-Request-Timeout: {value}")
+            if not math.isfinite(timeout) or timeout <= 0:
+                raise ValidationError("X-Request-Timeout 必须是大于 0 的有限数值")
+            return cls(timeout)
+        
+        timeout = model_config.get("request_timeout")
+        return cls(float(timeout)) if timeout else None
@@ -0,0 +1,467 @@
+"""
+Embedding 请求微批处理与拆分
+
+将同一模型在短时间窗口内到达的多个 embedding 请求合并为一次上游调用，
+再把返回的 data 数组和按 token 比例分摊的 usage 拆分给每个调用方
+
+合并后的请求由批处理器自己发送：截止时间取批次中最晚的一个，
+单个调用方超时或断开只影响它自己；统计仍由每个调用方分别记录
+
+反过来，超过上游批次上限的大请求会被拆分为多个分片并发发送，
+结果按原始顺序重新组装
+
+配置示例（模型级别）：
+    embedding_batching:
+      enabled: true
+      max_wait_ms: 5          # 最长等待时间（毫秒）
+      max_batch_size: 64      # 单批最多输入条数
+      max_batch_tokens: 8192  # 单批最多 token 数
+"""
+
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from llm_one_api.core.deadline import Deadline
+from llm_one_api.core.load_balancer import config_fingerprint
+from llm_one_api.core.scheduler import PRIORITIES, resolve_tenant
+from llm_one_api.utils.exceptions import DeadlineExceededError, UpstreamError
+from llm_one_api.utils.logger import logger
+from llm_one_api.utils.token_counter import acount_tokens_batch
+
+# 合并后的请求不携带这些字段（每个调用方不同）
+_PER_CALLER_FIELDS = ("input", "user")
+
+# 发送函数：(请求数据, 截止时间, 认证结果) -> (响应数据, 处理请求的上游)
+SendFunc = Callable[
+    [Dict[str, Any], Optional[Deadline], Optional[Dict[str, Any]]],
+    Awaitable[Tuple[Dict[str, Any], Optional[str]]],
+]
+
+
+def normalize_inputs(raw_input: Any) -> Optional[Tuple[str, List[Any]]]:
+    """
+    把 embedding 请求的 input 规范为 (类型, 输入列表)
+    
+    - str -> ("text", [str])
+    - List[str] -> ("text", 原列表)
+    - List[int]（一条已经分词的输入）-> ("tokens", [原列表])
+    - List[List[int]] -> ("tokens", 原列表)
+    
+    Returns:
+        其他形式（空列表、混合类型等）返回 None，原样交给上游校验
+    """
+    if isinstance(raw_input, str):
+        return "text", [raw_input]
+    
+    if not isinstance(raw_input, list) or not raw_input:
+        return None
+    
+    if all(isinstance(item, str) for item in raw_input):
+        return "text", raw_input
+    if all(isinstance(item, int) for item in raw_input):
+        return "tokens", [raw_input]
+    if all(isinstance(item, list) and all(isinstance(t, int) for t in item) for item in raw_input):
+        return "tokens", raw_input
+    
+    return None
+
+
+async def count_input_tokens(kind: str, inputs: List[Any], model: str) -> List[int]:
+    """每条输入的 token 数（已分词的输入直接取长度）"""
+    if kind == "tokens":
+        return [len(item) for item in inputs]
+    return await acount_tokens_batch(inputs, model)
+
+
+@dataclass
+class _BatchEntry:
+    """批次中的单个调用方"""
+    inputs: List[Any]
+    tokens: int
+    deadline: Optional[Deadline]
+    auth_result: Optional[Dict[str, Any]]
+    future: "asyncio.Future[Tuple[Dict[str, Any], Optional[str]]]"
+
+
+@dataclass
+class _PendingBatch:
+    """正在收集中的批次"""
+    params: Dict[str, Any]
+    entries: List[_BatchEntry] = field(default_factory=list)
+    size: int = 0
+    tokens: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    """Embedding 微批处理器（每个模型一个实例）"""
+    
+    def __init__(
+        self,
+        model_name: str,
+        send: SendFunc,
+        max_wait_ms: float = 5,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 8192,
+    ):
+        """
+        初始化微批处理器
+        
+        Args:
+            model_name: 模型名称
+            send: 发送请求到上游的函数（批处理器自己持有，不绑定任何调用方）
+            max_wait_ms: 批次最长等待时间（毫秒）
+            max_batch_size: 单批最多输入条数
+            max_batch_tokens: 单批最多 token 数
+        """
+        self.model_name = model_name
+        self.send = send
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        
+        # 请求参数（除 input 外）-> 收集中的批次
+        self._pending: Dict[str, _PendingBatch] = {}
+        # 正在发送的批次（保留引用，避免任务被垃圾回收）
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        
+        self.total_batches = 0
+        self.total_requests = 0
+    
+    async def submit(
+        self,
+        request_data: Dict[str, Any],
+        deadline: Optional[Deadline] = None,
+        auth_result: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        提交一个 embedding 请求，等待所在批次完成
+        
+        Args:
+            request_data: 原始请求数据
+            deadline: 调用方的截止时间（只限制调用方自己的等待，不影响同批次的其他请求）
+            auth_result: 认证结果
+        
+        Returns:
+            (只包含本请求结果的响应数据, 处理请求的上游)
+        """
+        normalized = normalize_inputs(request_data.get("input"))
+        if normalized is None:
+            return await self.send(request_data, deadline, auth_result)
+        
+        kind, inputs = normalized
+        tokens = sum(await count_input_tokens(kind, inputs, self.model_name))
+        
+        # 单个请求已超过批次上限，不参与合并
+        if len(inputs) >= self.max_batch_size or tokens >= self.max_batch_tokens:
+            return await self.send(request_data, deadline, auth_result)
+        
+        # 文本和 token 数组不能出现在同一个 input 中，分开成批
+        params = {k: v for k, v in request_data.items() if k not in _PER_CALLER_FIELDS}
+        batch_key = kind + ":" + json.dumps(params, sort_keys=True, default=str)
+        
+        batch = self._pending.get(batch_key)
+        if batch and (
+            batch.size + len(inputs) > self.max_batch_size
+            or batch.tokens + tokens > self.max_batch_tokens
+        ):
+            self._flush(batch_key)
+            batch = None
+        
+        if batch is None:
+            batch = _PendingBatch(params=params)
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.max_wait, self._flush, batch_key
+            )
+            self._pending[batch_key] = batch
+        
+        entry = _BatchEntry(
+            inputs=inputs,
+            tokens=tokens,
+            deadline=deadline,
+            auth_result=auth_result,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        batch.entries.append(entry)
+        batch.size += len(inputs)
+        batch.tokens += tokens
+        self.total_requests += 1
+        
+        if batch.size >= self.max_batch_size:
+            self._flush(batch_key)
+        
+        if deadline is None:
+            return await entry.future
+        
+        # 超时只取消本调用方的 future，批次中的其他请求不受影响
+        try:
+            return await asyncio.wait_for(entry.future, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError()
+    
+    def _flush(self, batch_key: str):
+        """将收集中的批次发送到上游"""
+        batch = self._pending.pop(batch_key, None)
+        if batch is None:
+            return
+        
+        if batch.timer:
+            batch.timer.cancel()
+        
+        self.total_batches += 1
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: _PendingBatch):
+        """执行合并后的请求并拆分结果"""
+        # 已经超时或断开的调用方不再发送
+        entries = [entry for entry in batch.entries if not entry.future.done()]
+        if not entries:
+            return
+        
+        merged_inputs = [item for entry in entries for item in entry.inputs]
+        merged_request = dict(batch.params, input=merged_inputs)
+        
+        logger.debug(
+            f"Embedding 批次发送: model={self.model_name}, "
+            f"请求数={len(entries)}, 输入数={len(merged_inputs)}"
+        )
+        
+        try:
+            response_data, upstream = await self.send(
+                merged_request,
+                _batch_deadline(entries),
+                _batch_auth_result(self.model_name, entries),
+            )
+            results = self._split_response(entries, response_data)
+        except asyncio.CancelledError:
+            # 批次任务被取消（如服务关闭）时也要结束所有调用方的等待
+            _fail_entries(entries, UpstreamError("embedding 批次已取消"))
+            raise
+        except Exception as e:
+            _fail_entries(entries, e)
+            return
+        
+        for entry, result in zip(entries, results):
+            if not entry.future.done():
+                entry.future.set_result((result, upstream))
+    
+    def _split_response(
+        self,
+        entries: List[_BatchEntry],
+        response_data: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        """按输入顺序拆分 data 数组，并按 token 比例分摊 usage"""
+        data = sorted(response_data.get("data", []), key=lambda item: item.get("index", 0))
+        
+        expected = sum(len(entry.inputs) for entry in entries)
+        if len(data) != expected:
+            raise ValueError(f"上游返回的 embedding 数量不匹配: 期望 {expected}，实际 {len(data)}")
+        
+        usage = response_data.get("usage") or {}
+        prompt_shares = _prorate(usage.get("prompt_tokens", 0), [e.tokens for e in entries])
+        total_shares = _prorate(usage.get("total_tokens", 0), [e.tokens for e in entries])
+        
+        results = []
+        offset = 0
+        
+        for i, entry in enumerate(entries):
+            items = []
+            for index, item in enumerate(data[offset:offset + len(entry.inputs)]):
+                items.append(dict(item, index=index))
+            offset += len(entry.inputs)
+            
+            result = {key: value for key, value in response_data.items() if key not in ("data", "usage")}
+            result["data"] = items
+            if usage:
+                result["usage"] = {
+                    "prompt_tokens": prompt_shares[i],
+                    "total_tokens": total_shares[i],
+                }
+            results.append(result)
+        
+        return results
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计信息"""
+        return {
+            "model": self.model_name,
+            "total_requests": self.total_requests,
+            "total_batches": self.total_batches,
+            "avg_batch_requests": (
+                self.total_requests / self.total_batches if self.total_batches else 0
+            ),
+        }
+
+
+def _fail_entries(entries: List[_BatchEntry], error: BaseException):
+    """把错误传给所有仍在等待的调用方"""
+    for entry in entries:
+        if not entry.future.done():
+            entry.future.set_exception(error)
+            # 调用方可能已经不再等待，避免 "exception was never retrieved"
+            entry.future.exception()
+
+
+def _batch_deadline(entries: List[_BatchEntry]) -> Optional[Deadline]:
+    """批次的截止时间：取各调用方中最晚的一个（有调用方不限时间时不限制）"""
+    if any(entry.deadline is None for entry in entries):
+        return None
+    return Deadline(max(entry.deadline.remaining() for entry in entries))
+
+
+def _batch_auth_result(model_name: str, entries: List[_BatchEntry]) -> Dict[str, Any]:
+    """
+    批次排队时使用的调度身份
+    
+    所有调用方属于同一租户时沿用该租户，否则使用批次专用租户；优先级取调用方中最高的
+    """
+    tenants = [resolve_tenant(entry.auth_result) for entry in entries]
+    
+    users = {tenant for tenant, _, _ in tenants}
+    user_id = users.pop() if len(users) == 1 else f"embedding-batch:{model_name}"
+    priority = min((p for _, _, p in tenants), key=PRIORITIES.index)
+    
+    return {"user_id": user_id, "priority": priority}
+
+
+def _prorate(total: int, weights: List[int]) -> List[int]:
+    """按权重分摊整数总量，保证各部分之和等于总量"""
+    weight_sum = sum(weights)
+    if not weight_sum:
+        weights = [1] * len(weights)
+        weight_sum = len(weights)
+    
+    shares = [total * w // weight_sum for w in weights]
+    remainder = total - sum(shares)
+    
+    # 余数分给小数部分最大的调用方
+    order = sorted(
+        range(len(weights)),
+        key=lambda i: (total * weights[i]) % weight_sum,
+        reverse=True,
+    )
+    for i in order[:remainder]:
+        shares[i] += 1
+    
+    return shares
+
+
+def split_inputs(
+    token_counts: List[int],
+    max_batch_size: Optional[int] = None,
+    max_batch_tokens: Optional[int] = None,
+) -> List[Tuple[int, int]]:
+    """
+    按条数和 token 上限把输入切分为连续的分片
+    
+    Args:
+        token_counts: 每条输入的 token 数
+        max_batch_size: 单个分片最多条数
+        max_batch_tokens: 单个分片最多 token 数（单条超限的输入独占一个分片）
+    
+    Returns:
+        分片区间列表 [(start, end), ...]
+    """
+    chunks = []
+    start = 0
+    tokens = 0
+    
+    for i, count in enumerate(token_counts):
+        size = i - start
+        if size and (
+            (max_batch_size and size >= max_batch_size)
+            or (max_batch_tokens and tokens + count > max_batch_tokens)
+        ):
+            chunks.append((start, i))
+            start = i
+            tokens = 0
+        tokens += count
+    
+    if start < len(token_counts):
+        chunks.append((start, len(token_counts)))
+    
+    return chunks
+
+
+def merge_responses(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按分片顺序合并多个 embedding 响应
+    
+    Args:
+        responses: 各分片的响应数据（与分片顺序一致）
+    
+    Returns:
+        合并后的响应数据，data 重新编号，usage 求和
+    """
+    merged = {key: value for key, value in responses[0].items() if key not in ("data", "usage")}
+    data = []
+    usage: Dict[str, int] = {}
+    
+    for response in responses:
+        offset = len(data)
+        items = sorted(response.get("data", []), key=lambda item: item.get("index", 0))
+        for index, item in enumerate(items):
+            data.append(dict(item, index=offset + index))
+        
+        for key, value in (response.get("usage") or {}).items():
+            if isinstance(value, int):
+                usage[key] = usage.get(key, 0) + value
+    
+    merged["data"] = data
+    if usage:
+        merged["usage"] = usage
+    
+    return merged
+
+
+# 模型名称 -> 批处理器
+# 模型名称 -> (上游配置指纹, 微批处理配置, 批处理器)
+_batchers: Dict[str, Tuple[str, Dict[str, Any], EmbeddingBatcher]] = {}
+
+
+def get_embedding_batcher(model_config: Dict[str, Any], send: SendFunc) -> Optional[EmbeddingBatcher]:
+    """
+    获取模型对应的微批处理器
+    
+    Args:
+        model_config: 模型配置
+        send: 发送函数，只在创建批处理器时使用，不能依赖某个调用方的状态
+    
+    Returns:
+        批处理器，如果该模型未启用微批处理返回 None
+    
+    模型的上游配置（与负载均衡器使用同一个指纹）或微批处理配置变化时重新创建批处理器，
+    旧批处理器中还未发送的批次也改用新的发送函数，不再使用重新加载前的配置
+    """
+    batching = model_config.get("embedding_batching") or {}
+    
+    if not batching.get("enabled", False):
+        return None
+    
+    model_name = model_config.get("model_name", "")
+    fingerprint = config_fingerprint(model_config)
+    
+    cached = _batchers.get(model_name)
+    if cached and cached[0] == fingerprint and cached[1] == batching:
+        batcher = cached[2]
+    else:
+        if cached:
+            cached[2].send = send
+        batcher = EmbeddingBatcher(
+            model_name=model_name,
+            send=send,
+            max_wait_ms=batching.get("max_wait_ms", 5),
+            max_batch_size=batching.get("max_batch_size", 64),
+            max_batch_tokens=batching.get("max_batch_tokens", 8192),
+        )
+        _batchers[model_name] = (fingerprint, batching, batcher)
+        logger.info(
+            f"启用 embedding 微批处理: model={model_name}, "
+            f"窗口={batcher.max_wait * 1000:.0f}ms, 最大批次={batcher.max_batch_size}"
+        )
+    
+    return batcher
@@ -0,0 +1,151 @@
+"""
+本地文件存储
+
+为 /v1/files 和 /v1/batches 提供基于本地磁盘的文件存储
+每个文件保存为两部分：内容文件 <file_id>.jsonl 和元数据文件 <file_id>.json
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from llm_one_api.utils.logger import logger
+
+# new_file_id() 生成的 ID 格式，其他 ID 不会被拼接到路径中
+FILE_ID_PATTERN = re.compile(r"^file-[0-9a-f]{32}$")
+
+
+class FileStore:
+    """本地文件存储"""
+    
+    def __init__(self, storage_dir: str):
+        """
+        初始化文件存储
+        
+        Args:
+            storage_dir: 存储目录
+        """
+        self.root = Path(storage_dir) / "files"
+        self.root.mkdir(parents=True, exist_ok=True)
+    
+    def content_path(self, file_id: str) -> Path:
+        """获取文件内容路径"""
+        return self.root / f"{file_id}.jsonl"
+    
+    def _meta_path(self, file_id: str) -> Path:
+        """获取文件元数据路径"""
+        return self.root / f"{file_id}.json"
+    
+    @staticmethod
+    def new_file_id() -> str:
+        """生成文件 ID"""
+        return f"file-{uuid.uuid4().hex}"
+    
+    @staticmethod
+    def is_valid_id(file_id: str) -> bool:
+        """是否为 new_file_id() 生成的 ID（来自请求的 ID 在访问磁盘前必须检查）"""
+        return bool(FILE_ID_PATTERN.match(file_id or ""))
+    
+    def create_writer(self, file_id: Optional[str] = None):
+        """
+        创建文件内容写入句柄（用于流式写入上传内容或批处理输出）
+        
+        Returns:
+            (file_id, 文件句柄)
+        """
+        file_id = file_id or self.new_file_id()
+        return file_id, open(self.content_path(file_id), "ab")
+    
+    def register(
+        self,
+        file_id: str,
+        filename: str,
+        purpose: str,
+        owner: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        登记已写入的文件，生成元数据
+        
+        Args:
+            file_id: 文件 ID
+            filename: 原始文件名
+            purpose: 文件用途（batch, batch_output 等）
+            owner: 所属用户
+        
+        Returns:
+            文件对象
+        """
+        meta = {
+            "id": file_id,
+            "object": "file",
+            "bytes": self.content_path(file_id).stat().st_size,
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "owner": owner,
+        }
+        
+        self._write_meta(file_id, meta)
+        logger.info(f"文件已保存: {file_id} ({filename}, {meta['bytes']} bytes)")
+        return meta
+    
+    def _write_meta(self, file_id: str, meta: Dict[str, Any]):
+        """原子写入元数据"""
+        path = self._meta_path(file_id)
+        tmp_path = path.with_suffix(".json.tmp")
+        
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """获取文件元数据"""
+        if not self.is_valid_id(file_id):
+            return None
+        
+        path = self._meta_path(file_id)
+        
+        if not path.exists():
+            return None
+        
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    def list(self, owner: Optional[str] = None, purpose: Optional[str] = None) -> List[Dict[str, Any]]:
+        """列出文件（读取所有元数据文件，在事件循环中调用时应放到线程池执行）"""
+        files = []
+        
+        for path in self.root.glob("*.json"):
+            with open(path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            
+            if owner is not None and meta.get("owner") != owner:
+                continue
+            if purpose is not None and meta.get("purpose") != purpose:
+                continue
+            files.append(meta)
+        
+        return sorted(files, key=lambda m: m["created_at"], reverse=True)
+    
+    def delete(self, file_id: str) -> bool:
+        """删除文件"""
+        if not self.is_valid_id(file_id):
+            return False
+        
+        existed = False
+        
+        for path in (self._meta_path(file_id), self.content_path(file_id)):
+            if path.exists():
+                path.unlink()
+                existed = True
+        
+        return existed
+    
+    @staticmethod
+    def to_public(meta: Dict[str, Any]) -> Dict[str, Any]:
+        """转换为对外返回的文件对象（去掉内部字段）"""
+        return {key: value for key, value in meta.items() if key != "owner"}
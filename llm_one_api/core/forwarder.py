@@ -7,76 +7,73 @@
 """
 
 import json
+import time
+import asyncio
 import httpx
-from typing import Dict, Any, AsyncIterator, Union
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
 from datetime import datetime
 
 from llm_one_api.utils.logger import logger
-from llm_one_api.utils.exceptions import LLMOneAPIError, UpstreamError
+from llm_one_api.utils.exceptions import DeadlineExceededError, LLMOneAPIError, StreamTimeoutError, UpstreamError
 from llm_one_api.core.token_extractor import TokenExtractor
-from llm_one_api.core.load_balancer import LoadBalancer, SingleServerWrapper, UpstreamServer
+from llm_one_api.core.load_balancer import UpstreamServer, get_load_balancer
+from llm_one_api.core.api_key_pool import is_key_error
+from llm_one_api.core.deadline import Deadline
+from llm_one_api.core.stream_timing import StreamTiming, StreamWatchdog, has_content
+from llm_one_api.core.metrics import INTER_TOKEN_LATENCY, TIME_TO_FIRST_TOKEN, record_error, record_request, registry
+from llm_one_api.core.retry import RetryPolicy, get_retry_budget
+from llm_one_api.core.tracing import SPAN_KIND_CLIENT, http_trace_extensions, span, start_span
+from llm_one_api.core.embedding_batcher import count_input_tokens, get_embedding_batcher, merge_responses, normalize_inputs, split_inputs
 
 
 class BaseForwarder:
     """转发器基类"""
     
-    def __init__(self, model_config: Dict[str, Any], plugin_manager):
+    def __init__(
+        self,
+        model_config: Dict[str, Any],
+        plugin_manager,
+        deadline: Optional[Deadline] = None,
+    ):
         self.model_config = model_config
         self.plugin_manager = plugin_manager
         
-        # 初始化负载均衡器
-        self.load_balancer = self._create_load_balancer(model_config)
+        # 请求截止时间（None 表示只受上游 timeout 限制）
+        self.deadline = deadline
+        # 剩余时间少于该值时不再发起新的尝试
+        self.min_attempt_timeout = model_config.get("min_attempt_timeout", 1.0)
+        
+        self.retry_policy = RetryPolicy.from_config(model_config.get("retry"))
+        
+        # 获取模型共享的负载均衡器
+        self.load_balancer = get_load_balancer(model_config)
+        
+        # 成功处理请求的上游（记录在统计数据中）
+        self.upstream: Optional[str] = None
     
-    def _create_load_balancer(self, config: Dict[str, Any]) -> Union[LoadBalancer, SingleServerWrapper]:
-        """创建负载均衡器"""
-        # 检查是否配置了多个上游服务器
-        upstreams = config.get("upstreams")
-        
-        if upstreams and isinstance(upstreams, list):
-            if len(upstreams) > 1:
-                # 多服务器：使用负载均衡器
-                strategy = config.get("load_balance_strategy", "round_robin")
-                health_check_interval = config.get("health_check_interval", 30)
-                max_failures = config.get("max_failures", 3)
-                
-                logger.info(
-                    f"启用负载均衡: 服务器数量={len(upstreams)}, "
-                    f"策略={strategy}"
-                )
-                
-                return LoadBalancer(
-                    servers=upstreams,
-                    strategy=strategy,
-                    health_check_interval=health_check_interval,
-                    max_failures=max_failures,
-                )
-            else:
-                # 单个 upstream：从 upstreams[0] 获取配置
-                upstream = upstreams[0]
-                api_base = upstream.get("api_base", "").rstrip("/")
-                api_key = upstream.get("api_key")
-                timeout = upstream.get("timeout", 60)
-                
-                logger.info(f"使用单个上游: {api_base}")
-                
-                return SingleServerWrapper(
-                    api_base=api_base,
-                    api_key=api_key,
-                    timeout=timeout,
-                )
-        else:
-            # 旧格式配置：直接从顶层获取
-            api_base = config.get("api_base", "").rstrip("/")
-            api_key = config.get("api_key")
-            timeout = config.get("timeout", 60)
-            
-            logger.info(f"使用传统配置: {api_base}")
+    def check_admission(self, auth_result: Optional[Dict] = None):
+        """检查请求是否会被过载保护拒绝（过载时抛出 OverloadedError）"""
+        self.load_balancer.check_admission(auth_result)
+    
+    def _attempt_timeout(self, server: UpstreamServer) -> float:
+        """单次尝试的超时时间：上游 timeout 与剩余预算中较小的一个"""
+        if self.deadline is None:
+            return server.timeout
+        return self.deadline.cap(server.timeout)
+    
+    async def _acquire_server(self, auth_result: Optional[Dict] = None) -> UpstreamServer:
+        """获取上游服务器，排队等待的时间也计入预算"""
+        with span("upstream.acquire"):
+            if self.deadline is None:
+                return await self.load_balancer.acquire(auth_result)
             
-            return SingleServerWrapper(
-                api_base=api_base,
-                api_key=api_key,
-                timeout=timeout,
-            )
+            try:
+                return await asyncio.wait_for(
+                    self.load_balancer.acquire(auth_result),
+                    timeout=self.deadline.remaining(),
+                )
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError("请求超时：等待上游服务器期间时间预算已用完")
     
     def _get_headers(self, api_key: str) -> Dict[str, str]:
         """获取请求头"""
@@ -85,61 +82,145 @@ class BaseForwarder:
             "Content-Type": "application/json",
         }
     
-    async def _execute_with_retry(self, request_func, *args, **kwargs):
+    async def _execute_with_retry(self, request_func, auth_result: Optional[Dict] = None):
         """
         执行请求并支持重试（故障转移）
         
+        上游达到并发上限时按租户排队等待
+        只重试可恢复的错误（见 RetryPolicy），重试前按指数退避等待，并受全局重试预算限制
+        设置了截止时间时，每次尝试只使用剩余的时间预算，预算不足时不再重试
+        
         Args:
-            request_func: 请求函数
-            *args, **kwargs: 请求参数
+            request_func: 请求函数，参数为选中的服务器
+            auth_result: 认证结果（用于调度）
         """
+        retry_budget = get_retry_budget()
+        retry_budget.record_request()
+        
         last_error = None
+        max_attempts = self.retry_policy.max_attempts
         
-        # 尝试所有可用服务器
-        for attempt in range(3):  # 最多重试3次
-            server = self.load_balancer.get_server()
+        for attempt in range(max_attempts):
+            # 预算已用完，或剩余时间不足以完成一次重试
+            if self.deadline and (
+                self.deadline.expired
+                or (attempt and self.deadline.remaining() < self.min_attempt_timeout)
+            ):
+                logger.warning(
+                    f"时间预算不足 ({self.deadline.remaining():.2f}s)，放弃第 {attempt + 1} 次尝试"
+                    + (f"，上次错误: {last_error}" if last_error else "")
+                )
+                raise DeadlineExceededError()
             
-            if not server:
-                raise UpstreamError("没有可用的上游服务器")
+            server = await self._acquire_server(auth_result)
+            attempt_start = time.monotonic()
             
             try:
-                self.load_balancer.mark_request_start(server)
+                # 执行请求（每次尝试一个 span）
+                attributes = {"attempt": attempt + 1, "upstream": server.api_base}
+                with span("upstream.attempt", attributes, kind=SPAN_KIND_CLIENT):
+                    if self.deadline is None:
+                        result = await request_func(server)
+                    else:
+                        result = await asyncio.wait_for(request_func(server), timeout=self.deadline.remaining())
                 
-                # 执行请求
-                result = await request_func(server, *args, **kwargs)
-                
-                self.load_balancer.mark_request_success(server)
+                self.load_balancer.mark_request_success(
+                    server, time.monotonic() - attempt_start, _output_tokens(result)
+                )
+                self.upstream = server.api_base
                 return result
             
-            except Exception as e:
+            except asyncio.CancelledError:
+                self.load_balancer.mark_request_cancelled(server)
+                raise
+            
+            except asyncio.TimeoutError as e:
+                # 只有截止时间会触发 wait_for 超时，预算已用完
                 self.load_balancer.mark_request_failure(server, e)
+                raise DeadlineExceededError()
+            
+            except Exception as e:
                 last_error = e
+                switch_key = is_key_error(e) and server.key_pool.has_available
+                
+                if switch_key:
+                    # 单个 Key 被限流或无效，上游还有其他 Key：不影响上游健康状态，立即换 Key 重试
+                    self.load_balancer.mark_request_cancelled(server)
+                elif self.retry_policy.is_retryable(e):
+                    self.load_balancer.mark_request_failure(server, e)
+                else:
+                    # 上游正常响应了客户端错误（如 400），不影响健康状态，也不重试
+                    self.load_balancer.mark_request_success(server)
+                    raise
                 
                 logger.warning(
-                    f"服务器 {server.api_base} 请求失败 (尝试 {attempt + 1}/3): {e}"
+                    f"服务器 {server.api_base} 请求失败 (尝试 {attempt + 1}/{max_attempts}): {e}"
                 )
-                
-                # 如果还有其他服务器，继续尝试
-                continue
+            
+            if attempt + 1 >= max_attempts:
+                break
+            
+            delay = 0.0 if switch_key else self.retry_policy.get_delay(attempt + 1, last_error)
+            if delay is None:
+                logger.warning("上游要求的等待时间过长，不再重试")
+                break
+            
+            if self.deadline and self.deadline.remaining() < delay + self.min_attempt_timeout:
+                logger.warning(f"剩余时间不足以在退避 {delay:.2f}s 后重试，不再重试")
+                break
+            
+            if not retry_budget.try_acquire():
+                logger.warning("全局重试预算已用完，不再重试")
+                break
+            
+            # 如果还有其他服务器，退避后继续尝试
+            with span("retry.backoff", {"delay": delay}):
+                await asyncio.sleep(delay)
         
-        # 所有服务器都失败了
+        # 所有尝试都失败了
         raise last_error or UpstreamError("所有上游服务器均不可用")
+    
+    def _record_error(self, request_data: Dict[str, Any], endpoint: str, error: BaseException):
+        """记录失败请求的指标（按错误类型）"""
+        if isinstance(error, httpx.HTTPStatusError):
+            error_type = f"upstream_{error.response.status_code}"
+        elif isinstance(error, httpx.TimeoutException):
+            error_type = "upstream_timeout"
+        elif isinstance(error, LLMOneAPIError):
+            error_type = error.error_type
+        else:
+            error_type = "internal_error"
+        
+        record_error(request_data.get("model") or "", endpoint, error_type)
 
 
 class NonStreamForwarder(BaseForwarder):
     """非流式转发器"""
     
     async def _do_forward(self, server: UpstreamServer, url: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
-        """执行实际的转发请求"""
-        async with httpx.AsyncClient(timeout=server.timeout) as client:
-            response = await client.post(
-                url,
-                json=request_data,
-                headers=self._get_headers(server.api_key),
-            )
-            
-            response.raise_for_status()
-            return response.json()
+        """执行实际的转发请求（从上游的 Key 池中选择 API Key）"""
+        key = server.key_pool.acquire()
+        error = None
+        
+        try:
+            async with httpx.AsyncClient(timeout=self._attempt_timeout(server)) as client:
+                response = await client.post(
+                    url,
+                    json=request_data,
+                    headers=self._get_headers(key.value),
+                    extensions=http_trace_extensions(),
+                )
+                
+                key.quota.update(response.headers)
+                response.raise_for_status()
+                return response.json()
+        
+        except Exception as e:
+            error = e
+            raise
+        
+        finally:
+            server.key_pool.release(key, error)
     
     async def forward_chat(self, request_data: Dict[str, Any], auth_result: Dict) -> Dict[str, Any]:
         """
@@ -149,7 +230,7 @@ class NonStreamForwarder(BaseForwarder):
         Args:
             request_data: 请求数据
             auth_result: 认证结果
-            
+        
         Returns:
             响应数据
         """
@@ -161,7 +242,7 @@ class NonStreamForwarder(BaseForwarder):
                 url = f"{server.api_base}/chat/completions"
                 return await self._do_forward(server, url, request_data)
             
-            response_data = await self._execute_with_retry(request_func)
+            response_data = await self._execute_with_retry(request_func, auth_result)
             
             # 提取 token 使用量
             token_usage = TokenExtractor.extract_from_response(response_data)
@@ -170,22 +251,29 @@ class NonStreamForwarder(BaseForwarder):
             duration = (datetime.now() - start_time).total_seconds()
             
             # 记录统计
-            await self._record_stats(request_data, response_data, token_usage, duration, auth_result)
+            await self._record_stats("chat", request_data, response_data, token_usage, duration, auth_result)
             
             return response_data
         
         except httpx.HTTPStatusError as e:
+            self._record_error(request_data, "chat", e)
             logger.error(f"上游 API 返回错误: {e.response.status_code} - {e.response.text}")
             raise UpstreamError(
                 f"上游 API 错误: {e.response.status_code}",
                 status_code=e.response.status_code,
             )
         
-        except httpx.TimeoutException:
+        except httpx.TimeoutException as e:
+            self._record_error(request_data, "chat", e)
             logger.error(f"请求超时")
             raise UpstreamError("请求超时", status_code=504)
         
+        except LLMOneAPIError as e:
+            self._record_error(request_data, "chat", e)
+            raise
+        
         except Exception as e:
+            self._record_error(request_data, "chat", e)
             logger.exception(f"转发请求失败: {e}")
             raise UpstreamError(f"转发失败: {str(e)}")
     
@@ -198,19 +286,25 @@ class NonStreamForwarder(BaseForwarder):
                 url = f"{server.api_base}/completions"
                 return await self._do_forward(server, url, request_data)
             
-            response_data = await self._execute_with_retry(request_func)
+            response_data = await self._execute_with_retry(request_func, auth_result)
             
             token_usage = TokenExtractor.extract_from_response(response_data)
             duration = (datetime.now() - start_time).total_seconds()
-            await self._record_stats(request_data, response_data, token_usage, duration, auth_result)
+            await self._record_stats("completion", request_data, response_data, token_usage, duration, auth_result)
             
             return response_data
         
         except httpx.HTTPStatusError as e:
+            self._record_error(request_data, "completion", e)
             logger.error(f"上游 API 返回错误: {e.response.status_code}")
             raise UpstreamError(f"上游 API 错误: {e.response.status_code}", status_code=e.response.status_code)
         
+        except LLMOneAPIError as e:
+            self._record_error(request_data, "completion", e)
+            raise
+        
         except Exception as e:
+            self._record_error(request_data, "completion", e)
             logger.exception(f"转发请求失败: {e}")
             raise UpstreamError(f"转发失败: {str(e)}")
     
@@ -219,28 +313,122 @@ class NonStreamForwarder(BaseForwarder):
         start_time = datetime.now()
         
         try:
-            async def request_func(server: UpstreamServer):
-                url = f"{server.api_base}/embeddings"
-                return await self._do_forward(server, url, request_data)
+            # 启用微批处理时，与同一时间窗口内的其他请求合并发送
+            batcher = get_embedding_batcher(
+                self.model_config,
+                _embedding_batch_sender(self.model_config, self.plugin_manager),
+            )
             
-            response_data = await self._execute_with_retry(request_func)
+            if batcher:
+                response_data, self.upstream = await batcher.submit(request_data, self.deadline, auth_result)
+            else:
+                response_data = await self._send_embedding(request_data, auth_result)
             
             token_usage = TokenExtractor.extract_from_response(response_data)
             duration = (datetime.now() - start_time).total_seconds()
-            await self._record_stats(request_data, response_data, token_usage, duration, auth_result)
+            await self._record_stats("embedding", request_data, response_data, token_usage, duration, auth_result)
             
             return response_data
         
         except httpx.HTTPStatusError as e:
+            self._record_error(request_data, "embedding", e)
             logger.error(f"上游 API 返回错误: {e.response.status_code}")
             raise UpstreamError(f"上游 API 错误: {e.response.status_code}", status_code=e.response.status_code)
         
+        except LLMOneAPIError as e:
+            self._record_error(request_data, "embedding", e)
+            raise
+        
         except Exception as e:
+            self._record_error(request_data, "embedding", e)
             logger.exception(f"转发请求失败: {e}")
             raise UpstreamError(f"转发失败: {str(e)}")
     
+    async def _send_embedding(
+        self,
+        request_data: Dict[str, Any],
+        auth_result: Optional[Dict] = None,
+    ) -> Dict[str, Any]:
+        """
+        发送嵌入请求到上游（支持负载均衡和故障转移）
+        
+        输入超过上游的 max_batch_size / max_batch_tokens 时拆分为多个分片，
+        在模型的各个上游之间并发执行，再按原始顺序组装结果
+        """
+        max_batch_size, max_batch_tokens = self._embedding_batch_limits()
+        
+        # 只拆分多条输入（List[str] 或 List[List[int]]），单条 token 数组 List[int] 不能拆开
+        normalized = normalize_inputs(request_data.get("input"))
+        if normalized is None or len(normalized[1]) <= 1 or not (max_batch_size or max_batch_tokens):
+            return await self._send_embedding_chunk(request_data, auth_result)
+        
+        kind, inputs = normalized
+        if max_batch_tokens:
+            token_counts = await count_input_tokens(kind, inputs, request_data.get("model", ""))
+        else:
+            token_counts = [0] * len(inputs)
+        
+        chunks = split_inputs(token_counts, max_batch_size, max_batch_tokens)
+        if len(chunks) <= 1:
+            return await self._send_embedding_chunk(request_data, auth_result)
+        
+        parallelism = self.model_config.get("embedding_parallelism", 4)
+        semaphore = asyncio.Semaphore(max(parallelism, 1))
+        
+        logger.info(
+            f"Embedding 请求拆分: 输入数={len(inputs)}, 分片数={len(chunks)}, 并发={parallelism}"
+        )
+        
+        async def send_chunk(start: int, end: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._send_embedding_chunk(
+                    dict(request_data, input=inputs[start:end]),
+                    auth_result,
+                )
+        
+        tasks = [asyncio.ensure_future(send_chunk(start, end)) for start, end in chunks]
+        
+        try:
+            responses = await asyncio.gather(*tasks)
+        except BaseException:
+            # 任一分片失败，取消其余分片
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        return merge_responses(responses)
+    
+    async def _send_embedding_chunk(
+        self,
+        request_data: Dict[str, Any],
+        auth_result: Optional[Dict] = None,
+    ) -> Dict[str, Any]:
+        """发送单个嵌入请求到上游"""
+        async def request_func(server: UpstreamServer):
+            url = f"{server.api_base}/embeddings"
+            return await self._do_forward(server, url, request_data)
+        
+        return await self._execute_with_retry(request_func, auth_result)
+    
+    def _embedding_batch_limits(self) -> Tuple[Optional[int], Optional[int]]:
+        """
+        获取嵌入请求的批次上限
+        
+        分片可能被发送到任意上游，因此取所有上游中最小的上限
+        """
+        sources = self.model_config.get("upstreams") or [self.model_config]
+        
+        sizes = [u["max_batch_size"] for u in sources if u.get("max_batch_size")]
+        tokens = [u["max_batch_tokens"] for u in sources if u.get("max_batch_tokens")]
+        
+        max_batch_size = min(sizes) if sizes else self.model_config.get("max_batch_size")
+        max_batch_tokens = min(tokens) if tokens else self.model_config.get("max_batch_tokens")
+        
+        return max_batch_size, max_batch_tokens
+    
     async def _record_stats(
         self,
+        endpoint: str,
         request_data: Dict,
         response_data: Dict,
         token_usage: Dict,
@@ -248,16 +436,18 @@ class NonStreamForwarder(BaseForwarder):
         auth_result: Dict,
     ):
         """记录统计信息"""
+        record_request(request_data.get("model") or "", endpoint, False, duration, token_usage)
+        
         try:
             model_name = request_data.get("model")
             
-            # 获取模型配置并提取 metadata
-            model_config = await self.plugin_manager.get_model_config(model_name)
-            metadata = model_config.get("metadata", {}) if model_config else {}
+            # 转发器创建时已获取模型配置，直接使用其中的 metadata
+            metadata = self.model_config.get("metadata") or {}
             
             stats_data = {
                 "model": model_name,
-                "endpoint": "chat" if "messages" in request_data else "completion",
+                "endpoint": endpoint,
+                "upstream": self.upstream,
                 "stream": False,
                 "user": auth_result.get("user_id"),
                 "timestamp": datetime.now().isoformat(),
@@ -271,6 +461,31 @@ class NonStreamForwarder(BaseForwarder):
             logger.warning(f"记录统计信息失败: {e}")
 
 
+def _output_tokens(result: Any) -> Optional[int]:
+    """非流式响应的输出 token 数（没有 usage.completion_tokens 时返回 None，如 embedding）"""
+    usage = result.get("usage") if isinstance(result, dict) else None
+    completion_tokens = usage.get("completion_tokens") if isinstance(usage, dict) else None
+    return completion_tokens if isinstance(completion_tokens, int) and completion_tokens > 0 else None
+
+
+def _embedding_batch_sender(model_config: Dict[str, Any], plugin_manager):
+    """
+    微批处理器使用的发送函数
+    
+    每次发送使用独立的转发器，截止时间和调度身份由批处理器传入，不继承任何调用方的状态
+    """
+    async def send(
+        request_data: Dict[str, Any],
+        deadline: Optional[Deadline],
+        auth_result: Optional[Dict],
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        forwarder = NonStreamForwarder(model_config, plugin_manager, deadline=deadline)
+        response_data = await forwarder._send_embedding(request_data, auth_result)
+        return response_data, forwarder.upstream
+    
+    return send
+
+
 class StreamForwarder(BaseForwarder):
     """流式转发器"""
     
@@ -286,7 +501,38 @@ class StreamForwarder(BaseForwarder):
         Args:
             request_data: 请求数据
             auth_result: 认证结果
-            
+        
+        Yields:
+            SSE 格式的数据块
+        """
+        async for chunk in self._forward_stream("chat", "/chat/completions", request_data, auth_result):
+            yield chunk
+    
+    async def forward_completion_stream(
+        self,
+        request_data: Dict[str, Any],
+        auth_result: Dict,
+    ) -> AsyncIterator[str]:
+        """转发文本补全请求（流式）"""
+        async for chunk in self._forward_stream("completion", "/completions", request_data, auth_result):
+            yield chunk
+    
+    async def _forward_stream(
+        self,
+        endpoint: str,
+        path: str,
+        request_data: Dict[str, Any],
+        auth_result: Dict,
+    ) -> AsyncIterator[str]:
+        """
+        转发流式请求，逐行透传 SSE 数据并提取 token 使用量
+        
+        Args:
+            endpoint: 接口类型（chat / completion）
+            path: 上游接口路径
+            request_data: 请求数据
+            auth_result: 认证结果
+        
         Yields:
             SSE 格式的数据块
         """
@@ -298,30 +544,68 @@ class StreamForwarder(BaseForwarder):
         token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
         
         # 选择一个服务器（流式不支持中途切换）
-        server = self.load_balancer.get_server()
-        
-        if not server:
-            yield 'data: {"error": "没有可用的上游服务器"}\n\n'
+        try:
+            server = await self._acquire_server(auth_result)
+        except LLMOneAPIError as e:
+            self._record_error(request_data, endpoint, e)
+            yield f"data: {json.dumps({'error': e.message}, ensure_ascii=False)}\n\n"
             return
         
-        url = f"{server.api_base}/chat/completions"
-        self.load_balancer.mark_request_start(server)
+        url = f"{server.api_base}{path}"
+        self.upstream = server.api_base
+        upstream_key = server.key_pool.acquire()
+        key_error = None
+        finished = False
+        attempt_start = time.monotonic()
+        timing = StreamTiming(attempt_start)
+        watchdog = StreamWatchdog()
+        
+        # 首 token 延迟和数据块间隔的指标标签（在循环外创建，避免每个数据块分配）
+        latency_labels = (request_data.get("model") or "", server.name) if registry.enabled else None
+        
+        timeouts = self._stream_timeouts(server)
+        
+        def step(awaitable, phase):
+            return self._stream_step(awaitable, phase, timeouts, attempt_start, watchdog)
+        
+        # 生成器可能在其他上下文中被关闭，span 不设为当前 span，在 finally 中结束
+        attempt_span = start_span(
+            "upstream.attempt", {"attempt": 1, "upstream": server.api_base}, kind=SPAN_KIND_CLIENT,
+        )
+        body_span = None
         
         try:
-            async with httpx.AsyncClient(timeout=server.timeout) as client:
-                async with client.stream(
+            async with httpx.AsyncClient(timeout=httpx.Timeout(None, connect=timeouts["connect"])) as client:
+                request = client.build_request(
                     "POST",
                     url,
                     json=request_data,
-                    headers=self._get_headers(server.api_key),
-                ) as response:
+                    headers=self._get_headers(upstream_key.value),
+                    extensions=http_trace_extensions(attempt_span),
+                )
+                
+                # 等待响应头（计入首 token 超时）
+                response = await step(client.send(request, stream=True), "first_token")
+                
+                try:
+                    upstream_key.quota.update(response.headers)
                     response.raise_for_status()
+                    body_span = start_span("stream.body", parent=attempt_span)
                     
-                    # 逐块转发
-                    async for line in response.aiter_lines():
+                    # 逐块转发，首个内容数据块之前使用首 token 超时，之后使用数据块间的空闲超时
+                    lines = response.aiter_lines()
+                    while True:
+                        phase = "first_token" if timing.first_token_at is None else "idle"
+                        try:
+                            line = await step(lines.__anext__(), phase)
+                        except StopAsyncIteration:
+                            break
+                        
                         if not line.strip():
                             continue
                         
+                        now = time.monotonic()
+                        
                         # 转发原始数据
                         yield f"{line}\n\n"
                         
@@ -331,6 +615,18 @@ class StreamForwarder(BaseForwarder):
                             if data_str != "[DONE]":
                                 try:
                                     chunk_data = json.loads(data_str)
+                                    
+                                    # 首 token 延迟和 token 间隔只按包含生成内容的数据块计算
+                                    if has_content(chunk_data):
+                                        gap = timing.on_chunk(now)
+                                        if gap is None and attempt_span:
+                                            attempt_span.add_event("first_token")
+                                        if latency_labels:
+                                            if gap is None:
+                                                TIME_TO_FIRST_TOKEN.observe(latency_labels, timing.ttft)
+                                            else:
+                                                INTER_TOKEN_LATENCY.observe(latency_labels, gap)
+                                    
                                     chunk_usage = TokenExtractor.extract_from_stream_chunk(chunk_data)
                                     if chunk_usage:
                                         # 累加 token
@@ -338,102 +634,149 @@ class StreamForwarder(BaseForwarder):
                                             token_usage[key] = max(token_usage[key], chunk_usage.get(key, 0))
                                 except json.JSONDecodeError:
                                     pass
+                finally:
+                    await response.aclose()
             
             # 成功完成
-            self.load_balancer.mark_request_success(server)
+            finished = True
+            self.load_balancer.mark_request_success(server, timing.ttft)
+            if body_span:
+                body_span.set_attribute("chunks", timing.chunks)
+                body_span.finish()
             
             # 记录统计
             duration = (datetime.now() - start_time).total_seconds()
-            await self._record_stats(request_data, token_usage, duration, auth_result)
+            await self._record_stats(endpoint, request_data, token_usage, duration, auth_result, timing=timing)
+        
+        except StreamTimeoutError as e:
+            # 上游卡住：计入上游健康状态，并把超时类型告知客户端
+            finished = True
+            key_error = e
+            self.load_balancer.mark_request_failure(server, e)
+            yield f"data: {json.dumps({'error': e.message, 'type': e.error_type}, ensure_ascii=False)}\n\n"
+            logger.warning(f"流式请求超时: {server.api_base}, {e.message}")
+            
+            duration = (datetime.now() - start_time).total_seconds()
+            await self._record_stats(
+                endpoint, request_data, token_usage, duration, auth_result, timing=timing, error=e.error_type,
+            )
         
         except httpx.HTTPStatusError as e:
+            finished = True
+            key_error = e
             self.load_balancer.mark_request_failure(server, e)
+            self._record_error(request_data, endpoint, e)
             error_message = f"data: {{\"error\": \"上游 API 错误: {e.response.status_code}\"}}\n\n"
             yield error_message
             logger.error(f"流式请求错误: {e.response.status_code}")
         
         except Exception as e:
+            finished = True
+            key_error = e
             self.load_balancer.mark_request_failure(server, e)
+            self._record_error(request_data, endpoint, e)
             error_message = f"data: {{\"error\": \"{str(e)}\"}}\n\n"
             yield error_message
             logger.exception(f"流式转发失败: {e}")
+        
+        finally:
+            watchdog.close()
+            server.key_pool.release(upstream_key, key_error)
+            
+            # 客户端断开连接（生成器被关闭或取消），归还并发名额
+            if not finished:
+                self.load_balancer.mark_request_cancelled(server)
+            
+            if attempt_span:
+                if key_error is not None:
+                    attempt_span.record_error(key_error)
+                elif not finished:
+                    attempt_span.error = "client disconnected"
+                if body_span:
+                    body_span.finish()
+                attempt_span.finish()
     
-    async def forward_completion_stream(
+    def _stream_timeouts(self, server: UpstreamServer) -> Dict[str, Optional[float]]:
+        """
+        获取流式请求的各阶段超时（秒）
+        
+        模型配置 stream_timeouts 中未设置的阶段使用上游的 timeout，total 默认不限制（仍受截止时间约束）
+        """
+        config = self.model_config.get("stream_timeouts") or {}
+        return {
+            "connect": config.get("connect", server.timeout),
+            "first_token": config.get("first_token", server.timeout),
+            "idle": config.get("idle", server.timeout),
+            "total": config.get("total"),
+        }
+    
+    async def _stream_step(
         self,
-        request_data: Dict[str, Any],
-        auth_result: Dict,
-    ) -> AsyncIterator[str]:
-        """转发文本补全请求（流式）"""
-        start_time = datetime.now()
-        request_data["stream"] = True
-        token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        awaitable,
+        phase: str,
+        timeouts: Dict[str, Optional[float]],
+        started_at: float,
+        watchdog: StreamWatchdog,
+    ):
+        """
+        等待流式响应的下一步（响应头或下一行）
         
-        # 选择一个服务器
-        server = self.load_balancer.get_server()
+        超时取当前阶段的超时、总时长剩余时间和截止时间剩余时间中最小的一个，
+        由整个响应共用的看门狗计时
         
-        if not server:
-            yield 'data: {"error": "没有可用的上游服务器"}\n\n'
-            return
+        Raises:
+            StreamTimeoutError: 超时（phase 为实际触发的阶段）
+        """
+        limits = []
+        if timeouts[phase] is not None:
+            limits.append((timeouts[phase], phase))
+        if timeouts["total"] is not None:
+            limits.append((timeouts["total"] - (time.monotonic() - started_at), "total"))
+        if self.deadline is not None:
+            limits.append((self.deadline.remaining(), "total"))
         
-        url = f"{server.api_base}/completions"
-        self.load_balancer.mark_request_start(server)
+        if not limits:
+            return await awaitable
         
-        try:
-            async with httpx.AsyncClient(timeout=server.timeout) as client:
-                async with client.stream(
-                    "POST",
-                    url,
-                    json=request_data,
-                    headers=self._get_headers(server.api_key),
-                ) as response:
-                    response.raise_for_status()
-                    
-                    async for line in response.aiter_lines():
-                        if not line.strip():
-                            continue
-                        
-                        yield f"{line}\n\n"
-                        
-                        if line.startswith("data: "):
-                            data_str = line[6:].strip()
-                            if data_str != "[DONE]":
-                                try:
-                                    chunk_data = json.loads(data_str)
-                                    chunk_usage = TokenExtractor.extract_from_stream_chunk(chunk_data)
-                                    if chunk_usage:
-                                        for key in ["prompt_tokens", "completion_tokens", "total_tokens"]:
-                                            token_usage[key] = max(token_usage[key], chunk_usage.get(key, 0))
-                                except json.JSONDecodeError:
-                                    pass
-            
-            self.load_balancer.mark_request_success(server)
-            duration = (datetime.now() - start_time).total_seconds()
-            await self._record_stats(request_data, token_usage, duration, auth_result)
+        timeout, phase = min(limits, key=lambda item: item[0])
         
-        except Exception as e:
-            self.load_balancer.mark_request_failure(server, e)
-            error_message = f"data: {{\"error\": \"{str(e)}\"}}\n\n"
-            yield error_message
-            logger.exception(f"流式转发失败: {e}")
+        try:
+            return await watchdog.wait(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise StreamTimeoutError(phase, timeouts[phase] if phase != "total" else timeouts["total"])
+        except httpx.ConnectTimeout:
+            raise StreamTimeoutError("connect", timeouts["connect"])
     
     async def _record_stats(
         self,
+        endpoint: str,
         request_data: Dict,
         token_usage: Dict,
         duration: float,
         auth_result: Dict,
+        timing: Optional[StreamTiming] = None,
+        error: Optional[str] = None,
     ):
-        """记录统计信息（流式）"""
+        """
+        记录统计信息（流式）
+        
+        除总耗时外还包含首 token 延迟（ttft）、输出速度（tokens_per_second）和 token 间隔（inter_token_latency）
+        """
+        if error:
+            record_error(request_data.get("model") or "", endpoint, error)
+        else:
+            record_request(request_data.get("model") or "", endpoint, True, duration, token_usage)
+        
         try:
             model_name = request_data.get("model")
             
-            # 获取模型配置并提取 metadata
-            model_config = await self.plugin_manager.get_model_config(model_name)
-            metadata = model_config.get("metadata", {}) if model_config else {}
+            # 转发器创建时已获取模型配置，直接使用其中的 metadata
+            metadata = self.model_config.get("metadata") or {}
             
             stats_data = {
                 "model": model_name,
-                "endpoint": "chat" if "messages" in request_data else "completion",
+                "endpoint": endpoint,
+                "upstream": self.upstream,
                 "stream": True,
                 "user": auth_result.get("user_id"),
                 "timestamp": datetime.now().isoformat(),
@@ -441,6 +784,10 @@ class StreamForwarder(BaseForwarder):
                 "token_usage": token_usage,
                 "metadata": metadata,  # 直接传递 metadata
             }
+            if timing is not None:
+                stats_data.update(timing.summary(token_usage.get("completion_tokens", 0)))
+            if error:
+                stats_data["error"] = error
             
             await self.plugin_manager.record_request_stats(stats_data)
         except Exception as e:
@@ -0,0 +1,365 @@
+"""
+异步任务管理器
+
+长时间的非流式生成可以以异步任务方式执行：
+- 请求立即返回任务 ID，生成在后台任务池中执行
+- 结果保存在有界的本地存储中，客户端通过 GET（支持长轮询）获取
+- 可选的 webhook 回调：任务结束时把结果 POST 到客户端指定的地址
+  （默认关闭；地址的协议和主机必须在 callback_allowlist 中，且不能解析到内网、回环或链路本地地址）
+
+这样客户端连接的生命周期与生成时间解耦，同时可以限制同时在途的任务数
+"""
+
+import asyncio
+import ipaddress
+import math
+import socket
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from llm_one_api.utils.exceptions import LLMOneAPIError, RateLimitError, ValidationError
+from llm_one_api.utils.logger import logger
+
+JobFunc = Callable[[], Awaitable[Dict[str, Any]]]
+
+# 回调地址允许的协议及其默认端口
+CALLBACK_SCHEMES = {"http": 80, "https": 443}
+
+
+@dataclass
+class Job:
+    """异步任务"""
+    id: str
+    owner: Optional[str]
+    created_at: float
+    status: str = "queued"  # queued, in_progress, completed, failed
+    started_at: Optional[float] = None
+    completed_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Dict[str, Any]] = None
+    callback_url: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    
+    @property
+    def finished(self) -> bool:
+        """任务是否已结束"""
+        return self.status in ("completed", "failed")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为对外返回的任务对象"""
+        return {
+            "id": self.id,
+            "object": "async_job",
+            "status": self.status,
+            "created_at": int(self.created_at),
+            "started_at": int(self.started_at) if self.started_at else None,
+            "completed_at": int(self.completed_at) if self.completed_at else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """异步任务管理器"""
+    
+    def __init__(self, config: Dict[str, Any]):
+        """
+        初始化任务管理器
+        
+        Args:
+            config: 异步任务配置
+                - max_concurrent: 同时执行的任务数
+                - max_pending: 排队 + 执行中的任务上限，超过返回 429
+                - max_jobs: 最多保存的任务数（超过时淘汰最早结束的任务）
+                - result_ttl: 结果保存时间（秒）
+                - max_wait: 长轮询最长等待时间（秒）
+                - webhook_timeout: webhook 回调超时时间（秒）
+                - webhooks_enabled: 是否允许 X-Callback-Url 回调（默认关闭）
+                - callback_allowlist: 允许的回调地址，如 https://hooks.example.com、https://*.example.com:8443
+                - allow_private_callbacks: 是否允许回调到内网、回环和链路本地地址（默认不允许）
+        """
+        self.max_concurrent = config.get("max_concurrent", 32)
+        self.max_pending = config.get("max_pending", 1000)
+        self.max_jobs = config.get("max_jobs", 10000)
+        self.result_ttl = config.get("result_ttl", 3600)
+        self.max_wait = config.get("max_wait", 60)
+        self.webhook_timeout = config.get("webhook_timeout", 10)
+        self.webhooks_enabled = config.get("webhooks_enabled", False)
+        self.callback_allowlist = _parse_allowlist(config.get("callback_allowlist") or [])
+        self.allow_private_callbacks = config.get("allow_private_callbacks", False)
+        
+        if self.webhooks_enabled and not self.callback_allowlist:
+            logger.warning("已启用异步任务回调但 callback_allowlist 为空，所有回调地址都会被拒绝")
+        
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._jobs: Dict[str, Job] = {}
+        # 已结束的任务按结束时间排序（结果保存时间相同，即按过期时间排序），淘汰时只检查队头
+        self._finished: Deque[str] = deque()
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    @property
+    def pending(self) -> int:
+        """排队 + 执行中的任务数"""
+        return len(self._tasks)
+    
+    def submit(
+        self,
+        func: JobFunc,
+        owner: Optional[str] = None,
+        callback_url: Optional[str] = None,
+    ) -> Job:
+        """
+        提交异步任务
+        
+        Args:
+            func: 执行任务的协程函数，返回响应数据
+            owner: 任务所属用户
+            callback_url: 任务结束后回调的地址
+        
+        Returns:
+            任务对象
+        
+        Raises:
+            ValidationError: 回调地址不允许
+            RateLimitError: 在途任务过多
+        """
+        if callback_url is not None:
+            self.validate_callback_url(callback_url)
+        
+        if self.pending >= self.max_pending:
+            raise RateLimitError(f"在途异步任务过多（上限 {self.max_pending}），请稍后再试")
+        
+        self._evict()
+        
+        job = Job(
+            id=f"job_{uuid.uuid4().hex}",
+            owner=owner,
+            created_at=time.time(),
+            callback_url=callback_url,
+        )
+        self._jobs[job.id] = job
+        
+        task = asyncio.ensure_future(self._run(job, func))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        
+        logger.info(f"异步任务已提交: {job.id}, 在途任务数={self.pending}")
+        return job
+    
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        """获取任务（只能获取自己的任务，匿名用户只能获取匿名提交的任务）"""
+        job = self._jobs.get(job_id)
+        
+        if job is None or job.owner != owner:
+            return None
+        
+        return job
+    
+    def validate_callback_url(self, url: str):
+        """
+        检查回调地址：必须启用回调，协议和主机在允许列表中，IP 地址不能是内网地址
+        
+        Raises:
+            ValidationError: 回调地址不允许
+        """
+        if not self.webhooks_enabled:
+            raise ValidationError("未启用异步任务回调（X-Callback-Url）")
+        
+        try:
+            parts = urlsplit(url)
+            port = parts.port or CALLBACK_SCHEMES.get(parts.scheme)
+        except ValueError:
+            raise ValidationError("无效的回调地址")
+        
+        host = (parts.hostname or "").rstrip(".")
+        if parts.scheme not in CALLBACK_SCHEMES or not host or parts.username or parts.password:
+            raise ValidationError("无效的回调地址，只支持不带认证信息的 http / https 地址")
+        
+        if not any(_match_allowlist(entry, parts.scheme, host, port) for entry in self.callback_allowlist):
+            raise ValidationError(f"回调地址不在允许列表中: {parts.scheme}://{host}:{port}")
+        
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return
+        
+        if not self.allow_private_callbacks and not _is_public_address(address):
+            raise ValidationError(f"不允许回调到内网地址: {host}")
+    
+    async def _check_callback_addresses(self, url: str):
+        """
+        发送前解析回调主机，拒绝解析到内网、回环或链路本地地址的主机
+        
+        Raises:
+            ValidationError: 主机解析到不允许的地址
+        """
+        if self.allow_private_callbacks:
+            return
+        
+        parts = urlsplit(url)
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or CALLBACK_SCHEMES[parts.scheme], type=socket.SOCK_STREAM
+        )
+        
+        for info in infos:
+            address = ipaddress.ip_address(info[4][0])
+            if not _is_public_address(address):
+                raise ValidationError(f"回调主机 {parts.hostname} 解析到内网地址: {address}")
+    
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """
+        长轮询：等待任务结束或超时
+        
+        Args:
+            job: 任务对象
+            timeout: 最长等待时间（秒），不超过 max_wait
+        
+        Raises:
+            ValidationError: 等待时间不是有限数值
+        """
+        if not math.isfinite(timeout):
+            raise ValidationError("wait 必须是有限数值")
+        
+        timeout = min(max(timeout, 0), self.max_wait)
+        
+        if timeout and not job.finished:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        
+        return job
+    
+    async def stop(self):
+        """停止所有在途任务"""
+        tasks = list(self._tasks.values())
+        
+        for task in tasks:
+            task.cancel()
+        
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        logger.info(f"异步任务管理器已停止，取消 {len(tasks)} 个在途任务")
+    
+    async def _run(self, job: Job, func: JobFunc):
+        """在任务池中执行任务"""
+        try:
+            async with self._semaphore:
+                job.status = "in_progress"
+                job.started_at = time.time()
+                
+                try:
+                    job.result = await func()
+                    job.status = "completed"
+                except LLMOneAPIError as e:
+                    job.status = "failed"
+                    job.error = {"message": e.message, "type": e.error_type, "status_code": e.status_code}
+                except Exception as e:
+                    logger.exception(f"异步任务执行失败: {job.id} - {e}")
+                    job.status = "failed"
+                    job.error = {"message": "内部服务器错误", "type": "internal_error", "status_code": 500}
+        
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = {"message": "服务关闭，任务已取消", "type": "cancelled", "status_code": 503}
+            raise
+        
+        finally:
+            job.completed_at = time.time()
+            job.done.set()
+            self._finished.append(job.id)
+        
+        logger.info(
+            f"异步任务结束: {job.id}, 状态={job.status}, "
+            f"耗时={job.completed_at - job.created_at:.2f}s"
+        )
+        
+        if job.callback_url:
+            await self._send_webhook(job)
+    
+    async def _send_webhook(self, job: Job):
+        """把任务结果 POST 到回调地址（尽力而为，失败只记录日志；不跟随重定向）"""
+        try:
+            await self._check_callback_addresses(job.callback_url)
+            async with httpx.AsyncClient(timeout=self.webhook_timeout) as client:
+                response = await client.post(job.callback_url, json=job.to_dict())
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"异步任务回调失败: {job.id} -> {job.callback_url}: {e}")
+    
+    def _evict(self):
+        """淘汰过期和超出容量的已结束任务（从最早结束的任务开始）"""
+        expire_before = time.time() - self.result_ttl
+        
+        while self._finished:
+            job = self._jobs[self._finished[0]]
+            if job.completed_at >= expire_before and len(self._jobs) < self.max_jobs:
+                break
+            self._finished.popleft()
+            del self._jobs[job.id]
+
+
+def wants_async(headers) -> bool:
+    """
+    判断请求是否要求异步执行
+    
+    支持 RFC 7240 的 `Prefer: respond-async` 和 `X-Async: true`
+    """
+    prefer = headers.get("prefer", "")
+    if "respond-async" in [item.strip().lower() for item in prefer.split(",")]:
+        return True
+    
+    return headers.get("x-async", "").lower() in ("1", "true", "yes")
+
+
+def _parse_allowlist(entries: Iterable[str]) -> List[Tuple[str, str, Optional[int]]]:
+    """
+    解析回调地址允许列表
+    
+    每一项为 协议://主机[:端口]，主机可以用 *. 前缀匹配所有子域名；未写端口时只允许协议的默认端口
+    
+    Returns:
+        [(协议, 主机, 端口), ...]
+    """
+    allowlist = []
+    
+    for entry in entries:
+        try:
+            parts = urlsplit(str(entry).strip())
+            port = parts.port or CALLBACK_SCHEMES.get(parts.scheme)
+        except ValueError:
+            parts = None
+        
+        if parts is None or parts.scheme not in CALLBACK_SCHEMES or not parts.hostname:
+            logger.warning(f"忽略无效的回调地址允许项: {entry}")
+            continue
+        
+        allowlist.append((parts.scheme, parts.hostname.rstrip("."), port))
+    
+    return allowlist
+
+
+def _match_allowlist(entry: Tuple[str, str, Optional[int]], scheme: str, host: str, port: Optional[int]) -> bool:
+    """回调地址是否匹配允许项"""
+    allowed_scheme, allowed_host, allowed_port = entry
+    
+    if scheme != allowed_scheme or port != allowed_port:
+        return False
+    
+    if allowed_host.startswith("*."):
+        return host.endswith(allowed_host[1:])
+    return host == allowed_host
+
+
+def _is_public_address(address: "ipaddress._BaseAddress") -> bool:
+    """是否为公网地址（内网、回环、链路本地、保留和组播地址都不是）"""
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
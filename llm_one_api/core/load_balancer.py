@@ -2,16 +2,42 @@
 负载均衡器
 
 支持多个上游 LLM API 的负载均衡和故障转移
+
+负载均衡器按模型缓存在模块级注册表中，健康状态和连接数在请求之间共享；
+连续失败达到 max_failures 的上游被移出轮换，health_check_interval 秒后放行一个探测请求（半开），
+探测成功则恢复，失败则重新等待；
+上游配置了 max_inflight 时，超出并发上限的请求由 FairScheduler 排队；
+启用 adaptive_concurrency 时，每个上游的并发上限由 AdaptiveLimit 根据 429 和延迟动态调整；
+上游返回的限流响应头按 API Key 记录在 UpstreamQuota 中，所有 Key 额度都用完的上游在重置之前会被避开；
+监控接口读取 get_balancer_snapshot() 返回的缓存快照，不在每次轮询时遍历所有上游
 """
 
+import asyncio
+import json
 import random
 import time
-from typing import List, Dict, Any, Optional
+from collections import deque
+from typing import Deque, List, Dict, Any, Optional, Tuple
 from enum import Enum
 from dataclasses import dataclass, field
 
+import httpx
+
+from llm_one_api.core.adaptive_limit import AdaptiveLimit
+from llm_one_api.core.api_key_pool import DEFAULT_AUTH_COOLDOWN, DEFAULT_COOLDOWN, ApiKeyPool
+from llm_one_api.core.scheduler import FairScheduler, resolve_tenant
+from llm_one_api.core.load_shedder import LoadShedder
+from llm_one_api.core.metrics import MetricFamily
+from llm_one_api.utils.exceptions import OverloadedError, StreamTimeoutError, UpstreamError
 from llm_one_api.utils.logger import logger
 
+# 计算最近错误率的请求数
+RECENT_WINDOW = 100
+# 延迟 EWMA 的平滑系数
+LATENCY_EWMA_ALPHA = 0.2
+# 监控快照的最长缓存时间（秒）
+SNAPSHOT_MAX_AGE = 1.0
+
 
 class LoadBalanceStrategy(str, Enum):
     """负载均衡策略"""
@@ -26,9 +52,13 @@ class UpstreamServer:
     """上游服务器配置"""
     api_base: str
     api_key: str
+    name: str = ""  # 上游名称（用作指标标签，默认为在 upstreams 中的序号）
     weight: int = 1  # 权重（用于加权负载均衡）
     timeout: int = 60
     max_retries: int = 3
+    max_inflight: Optional[int] = None  # 最大并发请求数（None 表示不限制）
+    adaptive_limit: Optional[AdaptiveLimit] = None  # 自适应并发上限（None 表示不启用）
+    key_pool: Optional[ApiKeyPool] = None  # API Key 池（未设置时只使用 api_key）
     
     # 健康检查相关
     healthy: bool = True
@@ -39,6 +69,72 @@ class UpstreamServer:
     active_connections: int = 0
     total_requests: int = 0
     total_failures: int = 0
+    
+    # 最近的延迟和错误率（用于监控）
+    ewma_latency: Optional[float] = None
+    recent_outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=RECENT_WINDOW))
+    recent_failures: int = 0
+    unhealthy_since: Optional[float] = None
+    retry_at: Optional[float] = None  # 不健康的上游允许发送探测请求的时间（Unix 时间戳）
+    probing: bool = False  # 是否有探测请求正在进行
+    
+    def __post_init__(self):
+        if self.key_pool is None:
+            self.key_pool = ApiKeyPool([self.api_key or ""])
+    
+    def record_outcome(self, failed: bool, latency: Optional[float] = None):
+        """
+        记录请求结果
+        
+        Args:
+            failed: 是否失败
+            latency: 请求延迟（秒，流式请求为首 token 延迟）
+        """
+        outcomes = self.recent_outcomes
+        if len(outcomes) == outcomes.maxlen and outcomes[0]:
+            self.recent_failures -= 1
+        outcomes.append(failed)
+        if failed:
+            self.recent_failures += 1
+        
+        if latency is not None:
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += LATENCY_EWMA_ALPHA * (latency - self.ewma_latency)
+    
+    @property
+    def recent_error_rate(self) -> float:
+        """最近 RECENT_WINDOW 个请求的错误率"""
+        return self.recent_failures / len(self.recent_outcomes) if self.recent_outcomes else 0.0
+    
+    @property
+    def circuit_state(self) -> str:
+        """
+        熔断状态
+        
+        - closed: 健康，正常参与轮换
+        - open: 连续失败达到 max_failures 后被移出轮换，等待冷却
+        - half_open: 冷却结束，等待或正在进行探测请求（成功后恢复为 closed）
+        """
+        if self.healthy:
+            return "closed"
+        if self.probing or (self.retry_at is not None and time.time() >= self.retry_at):
+            return "half_open"
+        return "open"
+    
+    @property
+    def has_capacity(self) -> bool:
+        """是否还能接受新的请求"""
+        limit = self.concurrency_limit
+        return limit is None or self.active_connections < limit
+    
+    @property
+    def concurrency_limit(self) -> Optional[int]:
+        """当前生效的并发上限（自适应上限不会超过 max_inflight）"""
+        if self.adaptive_limit is not None:
+            return self.adaptive_limit.limit
+        return self.max_inflight
 
 
 class LoadBalancer:
@@ -50,6 +146,10 @@ class LoadBalancer:
         strategy: str = "round_robin",
         health_check_interval: int = 30,
         max_failures: int = 3,
+        max_queue: int = 1000,
+        load_shedding: Optional[Dict[str, Any]] = None,
+        adaptive_concurrency: Optional[Dict[str, Any]] = None,
+        quota_low_watermark: float = 0.05,
     ):
         """
         初始化负载均衡器
@@ -59,25 +159,44 @@ class LoadBalancer:
             strategy: 负载均衡策略
             health_check_interval: 健康检查间隔（秒）
             max_failures: 最大连续失败次数（超过则标记为不健康）
+            max_queue: 上游均达到并发上限时最多排队的请求数
+            load_shedding: 过载保护配置（见 LoadShedder）
+            adaptive_concurrency: 自适应并发上限配置（见 AdaptiveLimit）
+            quota_low_watermark: 剩余限流额度比例低于该值的上游只在没有其他选择时使用
         """
         # 创建 UpstreamServer 对象，只提取需要的字段
         self.servers = []
-        for server in servers:
+        for index, server in enumerate(servers):
             # 只提取 UpstreamServer 需要的字段
+            api_keys = server.get("api_keys") or [server.get("api_key") or ""]
             server_config = {
                 "api_base": server.get("api_base", ""),
-                "api_key": server.get("api_key", ""),
+                "api_key": api_keys[0],
+                "name": str(server.get("name") or index),
                 "weight": server.get("weight", 1),  # 默认权重为1
                 "timeout": server.get("timeout", 60),
                 "max_retries": server.get("max_retries", 3),
+                "max_inflight": server.get("max_inflight"),
+                "key_pool": ApiKeyPool(
+                    api_keys,
+                    cooldown=server.get("key_cooldown") or DEFAULT_COOLDOWN,
+                    auth_cooldown=server.get("key_auth_cooldown") or DEFAULT_AUTH_COOLDOWN,
+                ),
             }
             self.servers.append(UpstreamServer(**server_config))
         
+        if adaptive_concurrency and adaptive_concurrency.get("enabled", False):
+            for server in self.servers:
+                server.adaptive_limit = AdaptiveLimit.from_config(adaptive_concurrency, server.max_inflight)
+        
         self.strategy = LoadBalanceStrategy(strategy)
         self.health_check_interval = health_check_interval
         self.max_failures = max_failures
+        self.quota_low_watermark = quota_low_watermark
         
         self._current_index = 0  # 用于轮询策略
+        self.scheduler = FairScheduler(max_queue=max_queue)
+        self.shedder = LoadShedder.from_config(load_shedding)
         
         # 统计权重总和（用于加权策略）
         total_weight = sum(s.weight for s in self.servers)
@@ -94,8 +213,12 @@ class LoadBalancer:
         根据负载均衡策略选择一个服务器
         
         Returns:
-            选中的服务器，如果没有可用服务器返回 None
+            选中的服务器，如果没有可用服务器或所有服务器都达到并发上限返回 None
         """
+        probe = self._probe_candidate()
+        if probe is not None:
+            return probe
+        
         healthy_servers = [s for s in self.servers if s.healthy]
         
         if not healthy_servers:
@@ -104,9 +227,19 @@ class LoadBalancer:
             self._reset_all_servers()
             healthy_servers = self.servers
         
+        # 所有 Key 的限流额度都已用完的上游在重置之前不参与选择（所有上游都用完时除外）
+        healthy_servers = [s for s in healthy_servers if not s.key_pool.exhausted] or healthy_servers
+        
+        healthy_servers = [s for s in healthy_servers if s.has_capacity]
+        
         if not healthy_servers:
             return None
         
+        # 优先选择剩余额度充足的上游
+        healthy_servers = [
+            s for s in healthy_servers if s.key_pool.headroom() >= self.quota_low_watermark
+        ] or healthy_servers
+        
         # 根据策略选择服务器
         if self.strategy == LoadBalanceStrategy.ROUND_ROBIN:
             server = self._round_robin(healthy_servers)
@@ -122,6 +255,26 @@ class LoadBalancer:
         logger.debug(f"选择服务器: {server.api_base}")
         return server
     
+    def _probe_candidate(self) -> Optional[UpstreamServer]:
+        """
+        选出一个可以发送探测请求的不健康上游（半开）
+        
+        每个上游同时只有一个探测请求，结果由 mark_request_* 处理
+        """
+        now = time.time()
+        for server in self.servers:
+            if (
+                not server.healthy
+                and not server.probing
+                and server.retry_at is not None
+                and now >= server.retry_at
+                and server.has_capacity
+            ):
+                server.probing = True
+                logger.info(f"向不健康的服务器发送探测请求: {server.api_base}")
+                return server
+        return None
+    
     def _round_robin(self, servers: List[UpstreamServer]) -> UpstreamServer:
         """轮询策略"""
         server = servers[self._current_index % len(servers)]
@@ -157,18 +310,128 @@ class LoadBalancer:
         logger.warning("重置所有服务器健康状态")
         for server in self.servers:
             server.healthy = True
+            server.unhealthy_since = None
+            server.retry_at = None
+            server.probing = False
             server.consecutive_failures = 0
     
+    async def acquire(self, auth_result: Optional[Dict[str, Any]] = None) -> UpstreamServer:
+        """
+        获取一个上游服务器并标记请求开始
+        
+        所有服务器都达到并发上限时，按租户权重和优先级排队等待
+        
+        Args:
+            auth_result: 认证结果（用于确定租户、权重和优先级）
+        
+        Returns:
+            选中的服务器，请求结束后必须调用 mark_request_* 释放
+        """
+        if not self.servers:
+            raise UpstreamError("没有可用的上游服务器")
+        
+        tenant, weight, priority = resolve_tenant(auth_result)
+        
+        if not len(self.scheduler):
+            server = self.get_server()
+            if server:
+                self.shedder.observe(priority, 0.0)
+                self.mark_request_start(server)
+                return server
+        
+        self._check_overload(priority)
+        waiter = self.scheduler.enqueue(tenant, weight, priority)
+        logger.debug(f"上游并发已满，请求排队: 租户={tenant}, 优先级={priority}, 排队数={len(self.scheduler)}")
+        self._dispatch()
+        
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已分配到服务器但调用方被取消，归还并发名额
+                self.mark_request_cancelled(waiter.future.result())
+            else:
+                # 仍在排队，立即释放排队名额
+                self.scheduler.cancel(waiter)
+            raise
+    
+    def check_admission(self, auth_result: Optional[Dict[str, Any]] = None):
+        """
+        提前检查请求是否会被过载保护拒绝
+        
+        用于流式请求：在返回响应头之前拒绝，客户端可以收到 503 而不是流中的错误
+        """
+        if len(self.scheduler) or not any(s.has_capacity for s in self.servers):
+            _, _, priority = resolve_tenant(auth_result)
+            self._check_overload(priority)
+    
+    def _check_overload(self, priority: str):
+        """排队延迟持续超过目标值时快速拒绝"""
+        if self.shedder.should_shed(priority, lambda: self.scheduler.oldest_wait(priority)):
+            raise OverloadedError(
+                f"上游排队延迟过高，{priority} 请求暂时被拒绝",
+                retry_after=self.shedder.retry_after,
+            )
+    
+    def _dispatch(self):
+        """把空闲的并发名额分配给排队中的请求"""
+        while len(self.scheduler):
+            server = self.get_server()
+            if server is None:
+                return
+            
+            waiter = self.scheduler.pop()
+            if waiter is None:
+                return
+            
+            self.shedder.observe(waiter.priority, time.monotonic() - waiter.enqueued_at)
+            self.mark_request_start(server)
+            waiter.future.set_result(server)
+    
+    def _release(self, server: UpstreamServer):
+        """释放服务器的并发名额"""
+        server.active_connections -= 1
+        self._dispatch()
+    
     def mark_request_start(self, server: UpstreamServer):
         """标记请求开始"""
         server.active_connections += 1
         server.total_requests += 1
     
-    def mark_request_success(self, server: UpstreamServer):
-        """标记请求成功"""
-        server.active_connections -= 1
+    def mark_request_cancelled(self, server: UpstreamServer):
+        """标记请求被调用方取消（不影响健康状态，探测请求被取消时允许重新探测）"""
+        server.probing = False
+        self._release(server)
+    
+    def mark_request_success(
+        self,
+        server: UpstreamServer,
+        latency: Optional[float] = None,
+        output_tokens: Optional[int] = None,
+    ):
+        """
+        标记请求成功
+        
+        Args:
+            server: 服务器
+            latency: 请求延迟（秒，流式请求为首 token 延迟），用于调整自适应并发上限
+            output_tokens: 非流式响应的输出 token 数，有值时自适应并发上限按每个输出 token 的耗时判断延迟
+        """
+        if server.adaptive_limit is not None:
+            if latency is not None and output_tokens:
+                server.adaptive_limit.on_success(server.active_connections, latency / output_tokens, "per_token")
+            else:
+                server.adaptive_limit.on_success(server.active_connections, latency)
+        
+        server.record_outcome(False, latency)
+        if not server.healthy:
+            logger.info(f"服务器恢复健康: {server.api_base}")
         server.consecutive_failures = 0
         server.healthy = True
+        server.unhealthy_since = None
+        server.retry_at = None
+        server.probing = False
+        self._release(server)
         
         logger.debug(
             f"请求成功: {server.api_base}, "
@@ -177,9 +440,16 @@ class LoadBalancer:
     
     def mark_request_failure(self, server: UpstreamServer, error: Exception = None):
         """标记请求失败"""
-        server.active_connections -= 1
         server.total_failures += 1
         server.consecutive_failures += 1
+        server.record_outcome(True)
+        
+        if server.adaptive_limit is not None and _is_overload(error):
+            server.adaptive_limit.on_overload()
+            logger.info(
+                f"上游过载，降低并发上限: {server.api_base}, "
+                f"上限={server.adaptive_limit.limit}"
+            )
         
         logger.warning(
             f"请求失败: {server.api_base}, "
@@ -187,13 +457,20 @@ class LoadBalancer:
             f"错误={error}"
         )
         
-        # 连续失败超过阈值，标记为不健康
-        if server.consecutive_failures >= self.max_failures:
+        # 连续失败超过阈值（或探测请求失败），标记为不健康，health_check_interval 秒后再探测
+        if server.consecutive_failures >= self.max_failures or server.probing:
+            now = time.time()
+            if server.healthy:
+                server.unhealthy_since = now
             server.healthy = False
+            server.retry_at = now + self.health_check_interval
+            server.probing = False
             logger.error(
                 f"服务器标记为不健康: {server.api_base}, "
                 f"连续失败={server.consecutive_failures}次"
             )
+        
+        self._release(server)
     
     def get_stats(self) -> Dict[str, Any]:
         """获取统计信息"""
@@ -201,15 +478,30 @@ class LoadBalancer:
             "strategy": self.strategy.value,
             "total_servers": len(self.servers),
             "healthy_servers": sum(1 for s in self.servers if s.healthy),
+            "scheduler": self.scheduler.get_stats(),
+            "load_shedding": self.shedder.get_stats(),
             "servers": [
                 {
+                    "name": server.name,
                     "api_base": server.api_base,
                     "healthy": server.healthy,
+                    "circuit": server.circuit_state,
+                    "unhealthy_since": server.unhealthy_since,
+                    "retry_at": server.retry_at,
                     "weight": server.weight,
+                    "max_inflight": server.max_inflight,
+                    "concurrency_limit": server.concurrency_limit,
+                    "adaptive_limit": (
+                        server.adaptive_limit.get_stats() if server.adaptive_limit else None
+                    ),
                     "active_connections": server.active_connections,
                     "total_requests": server.total_requests,
                     "total_failures": server.total_failures,
                     "consecutive_failures": server.consecutive_failures,
+                    "ewma_latency": round(server.ewma_latency, 4) if server.ewma_latency is not None else None,
+                    "recent_error_rate": round(server.recent_error_rate, 4),
+                    "recent_requests": len(server.recent_outcomes),
+                    "keys": server.key_pool.get_stats(),
                 }
                 for server in self.servers
             ],
@@ -243,44 +535,254 @@ class LoadBalancer:
         return results
 
 
-class SingleServerWrapper:
+def _is_overload(error: Optional[Exception]) -> bool:
+    """判断错误是否说明上游过载（429/503 或上游超时）"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (429, 503)
+    if isinstance(error, StreamTimeoutError):
+        # 总时长超时由客户端的时间预算决定，不说明上游过载
+        return error.phase != "total"
+    return isinstance(error, httpx.TimeoutException)
+
+
+class SingleServerWrapper(LoadBalancer):
     """单服务器包装器（兼容旧的单服务器配置）"""
     
-    def __init__(self, api_base: str, api_key: str, timeout: int = 60):
-        self.server = UpstreamServer(
+    def __init__(
+        self,
+        api_base: str,
+        api_key: str,
+        timeout: int = 60,
+        max_inflight: Optional[int] = None,
+        max_queue: int = 1000,
+        load_shedding: Optional[Dict[str, Any]] = None,
+        adaptive_concurrency: Optional[Dict[str, Any]] = None,
+        api_keys: Optional[List[str]] = None,
+        key_cooldown: Optional[float] = None,
+        key_auth_cooldown: Optional[float] = None,
+        name: Optional[str] = None,
+    ):
+        super().__init__(
+            servers=[{
+                "name": name,
+                "api_base": api_base,
+                "api_key": api_key,
+                "api_keys": api_keys,
+                "timeout": timeout,
+                "max_inflight": max_inflight,
+                "key_cooldown": key_cooldown,
+                "key_auth_cooldown": key_auth_cooldown,
+            }],
+            max_queue=max_queue,
+            load_shedding=load_shedding,
+            adaptive_concurrency=adaptive_concurrency,
+        )
+        self.server = self.servers[0]
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        stats = super().get_stats()
+        stats["strategy"] = "single"
+        return stats
+
+
+# 影响负载均衡器的模型配置字段
+_BALANCER_CONFIG_KEYS = (
+    "upstreams", "api_base", "api_key", "api_keys", "key_cooldown", "key_auth_cooldown",
+    "timeout", "max_inflight",
+    "load_balance_strategy", "health_check_interval", "max_failures", "max_queue",
+    "load_shedding", "adaptive_concurrency", "quota_low_watermark",
+)
+
+# 模型名称 -> (配置指纹, 负载均衡器)
+_balancers: Dict[str, Any] = {}
+
+# 模型名称 -> (配置字段的值, 配置指纹)
+_fingerprints: Dict[str, Tuple[Tuple[Any, ...], str]] = {}
+
+
+def config_fingerprint(model_config: Dict[str, Any]) -> str:
+    """
+    模型上游配置的指纹（影响负载均衡器的字段变化时改变）
+    
+    同一份配置每次请求构造的 model_config 中，这些字段引用的是配置中的同一批对象，
+    按对象身份比较即可复用上次的指纹，只有配置重新加载后才重新序列化
+    """
+    model_name = model_config.get("model_name", "")
+    values = tuple(model_config.get(key) for key in _BALANCER_CONFIG_KEYS)
+    
+    cached = _fingerprints.get(model_name)
+    if cached and all(old is new for old, new in zip(cached[0], values)):
+        return cached[1]
+    
+    fingerprint = json.dumps(dict(zip(_BALANCER_CONFIG_KEYS, values)), sort_keys=True, default=str)
+    _fingerprints[model_name] = (values, fingerprint)
+    return fingerprint
+
+
+def create_load_balancer(config: Dict[str, Any]) -> LoadBalancer:
+    """
+    根据模型配置创建负载均衡器
+    
+    Args:
+        config: 模型配置
+    
+    Returns:
+        负载均衡器（单个上游时为 SingleServerWrapper）
+    """
+    # 检查是否配置了多个上游服务器
+    upstreams = config.get("upstreams")
+    max_queue = config.get("max_queue", 1000)
+    load_shedding = config.get("load_shedding")
+    adaptive_concurrency = config.get("adaptive_concurrency")
+    
+    if upstreams and isinstance(upstreams, list):
+        if len(upstreams) > 1:
+            # 多服务器：使用负载均衡器
+            strategy = config.get("load_balance_strategy", "round_robin")
+            health_check_interval = config.get("health_check_interval", 30)
+            max_failures = config.get("max_failures", 3)
+            
+            logger.info(
+                f"启用负载均衡: 服务器数量={len(upstreams)}, "
+                f"策略={strategy}"
+            )
+            
+            return LoadBalancer(
+                servers=upstreams,
+                strategy=strategy,
+                health_check_interval=health_check_interval,
+                max_failures=max_failures,
+                max_queue=max_queue,
+                load_shedding=load_shedding,
+                adaptive_concurrency=adaptive_concurrency,
+                quota_low_watermark=config.get("quota_low_watermark", 0.05),
+            )
+        else:
+            # 单个 upstream：从 upstreams[0] 获取配置
+            upstream = upstreams[0]
+            api_base = upstream.get("api_base", "").rstrip("/")
+            
+            logger.info(f"使用单个上游: {api_base}")
+            
+            return SingleServerWrapper(
+                api_base=api_base,
+                api_key=upstream.get("api_key"),
+                timeout=upstream.get("timeout", 60),
+                max_inflight=upstream.get("max_inflight"),
+                max_queue=max_queue,
+                load_shedding=load_shedding,
+                adaptive_concurrency=adaptive_concurrency,
+                api_keys=upstream.get("api_keys"),
+                key_cooldown=upstream.get("key_cooldown"),
+                key_auth_cooldown=upstream.get("key_auth_cooldown"),
+                name=upstream.get("name"),
+            )
+    else:
+        # 旧格式配置：直接从顶层获取
+        api_base = config.get("api_base", "").rstrip("/")
+        
+        logger.info(f"使用传统配置: {api_base}")
+        
+        return SingleServerWrapper(
             api_base=api_base,
-            api_key=api_key,
-            timeout=timeout,
+            api_key=config.get("api_key"),
+            timeout=config.get("timeout", 60),
+            max_inflight=config.get("max_inflight"),
+            max_queue=max_queue,
+            load_shedding=load_shedding,
+            adaptive_concurrency=adaptive_concurrency,
+            api_keys=config.get("api_keys"),
+            key_cooldown=config.get("key_cooldown"),
+            key_auth_cooldown=config.get("key_auth_cooldown"),
         )
+
+
+def get_load_balancer(model_config: Dict[str, Any]) -> LoadBalancer:
+    """
+    获取模型对应的负载均衡器（同一模型的所有请求共享）
     
-    def get_server(self) -> UpstreamServer:
-        """获取服务器（始终返回同一个）"""
-        return self.server
+    模型的上游配置发生变化时重新创建
     
-    def mark_request_start(self, server: UpstreamServer):
-        """标记请求开始"""
-        pass
+    Args:
+        model_config: 模型配置
     
-    def mark_request_success(self, server: UpstreamServer):
-        """标记请求成功"""
-        pass
+    Returns:
+        负载均衡器
+    """
+    model_name = model_config.get("model_name", "")
+    fingerprint = config_fingerprint(model_config)
     
-    def mark_request_failure(self, server: UpstreamServer, error: Exception = None):
-        """标记请求失败"""
-        if error:
-            logger.warning(f"请求失败: {error}")
+    cached = _balancers.get(model_name)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
     
-    def get_stats(self) -> Dict[str, Any]:
-        """获取统计信息"""
-        return {
-            "strategy": "single",
-            "total_servers": 1,
-            "healthy_servers": 1,
-            "servers": [
-                {
-                    "api_base": self.server.api_base,
-                    "healthy": True,
-                }
-            ],
-        }
+    balancer = create_load_balancer(model_config)
+    _balancers[model_name] = (fingerprint, balancer)
+    return balancer
+
+
+def get_load_balancers() -> Dict[str, LoadBalancer]:
+    """获取所有已创建的负载均衡器（模型名称 -> 负载均衡器）"""
+    return {model_name: balancer for model_name, (_, balancer) in _balancers.items()}
+
+
+# (生成时间, 快照)
+_snapshot: Tuple[float, Dict[str, Any]] = (0.0, {})
+
+
+def get_balancer_snapshot(max_age: float = SNAPSHOT_MAX_AGE) -> Dict[str, Any]:
+    """
+    获取所有负载均衡器状态的快照
+    
+    快照最多缓存 max_age 秒，监控系统频繁轮询时不会每次都遍历所有上游和 Key；
+    负载均衡器在模型收到第一个请求时才创建，没有流量的模型不在快照中
+    
+    Returns:
+        {"generated_at": 时间戳, "models": {模型名称: LoadBalancer.get_stats()}}
+    """
+    global _snapshot
+    
+    generated_at, snapshot = _snapshot
+    now = time.time()
+    if snapshot and now - generated_at < max_age:
+        return snapshot
+    
+    snapshot = {
+        "generated_at": now,
+        "models": {model_name: balancer.get_stats() for model_name, balancer in get_load_balancers().items()},
+    }
+    _snapshot = (now, snapshot)
+    return snapshot
+
 
+def collect_upstream_metrics() -> List[MetricFamily]:
+    """
+    生成上游状态的 Prometheus 指标（抓取时读取，不在请求路径上记录）
+    
+    upstream 标签使用上游名称而不是 api_base，避免地址中的凭据或内部主机名出现在指标中
+    
+    Returns:
+        指标列表（见 core.metrics.MetricsRegistry.render）
+    """
+    gauges = {
+        "llm_upstream_active_connections": ("gauge", "上游当前的在途请求数", lambda s: s.active_connections),
+        "llm_upstream_healthy": ("gauge", "上游是否健康（1 健康，0 不健康）", lambda s: 1 if s.healthy else 0),
+        "llm_upstream_concurrency_limit": ("gauge", "上游当前生效的并发上限", lambda s: s.concurrency_limit),
+        "llm_upstream_requests_total": ("counter", "发往上游的请求数", lambda s: s.total_requests),
+        "llm_upstream_failures_total": ("counter", "上游失败的请求数", lambda s: s.total_failures),
+    }
+    samples: Dict[str, List] = {name: [] for name in gauges}
+    
+    for model_name, balancer in get_load_balancers().items():
+        for server in balancer.servers:
+            labels = {"model": model_name, "upstream": server.name}
+            for name, (_, _, getter) in gauges.items():
+                value = getter(server)
+                if value is not None:
+                    samples[name].append((labels, value))
+    
+    return [
+        (name, metric_type, documentation, samples[name])
+        for name, (metric_type, documentation, _) in gauges.items()
+    ]
@@ -0,0 +1,141 @@
+"""
+基于排队延迟的过载保护（CoDel 风格）
+
+跟踪请求等待上游并发名额的时间：
+如果一个观测区间内的最小等待时间仍高于目标值，说明排队已经持续积压，
+此后需要排队的新请求直接返回 503 和 Retry-After，而不是在事件循环中堆积到超时
+
+每个优先级独立判断，交互式请求的目标等待时间更短，会先于批处理请求被拒绝
+（交互式请求等待过久本身就已失去意义，批处理请求可以容忍更长的排队）
+
+配置示例（模型级别）：
+    load_shedding:
+      enabled: true
+      interval_ms: 5000
+      target_ms:
+        interactive: 500
+        batch: 30000
+      retry_after: 5
+"""
+
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from llm_one_api.core.metrics import record_rejection
+from llm_one_api.core.scheduler import PRIORITIES
+
+# 各优先级默认的目标等待时间（毫秒）
+DEFAULT_TARGETS_MS = {"interactive": 500, "batch": 30000}
+
+
+@dataclass
+class _CoDelState:
+    """单个优先级的观测状态"""
+    interval_start: float = 0.0
+    min_wait: float = math.inf
+    observations: int = 0
+    overloaded: bool = False
+    total_shed: int = 0
+
+
+class LoadShedder:
+    """过载保护器（每个上游池一个实例）"""
+    
+    def __init__(
+        self,
+        enabled: bool = False,
+        interval_ms: float = 5000,
+        target_ms: Optional[Dict[str, float]] = None,
+        retry_after: Optional[int] = None,
+    ):
+        """
+        初始化过载保护器
+        
+        Args:
+            enabled: 是否启用
+            interval_ms: 观测区间（毫秒）
+            target_ms: 各优先级的目标等待时间（毫秒）
+            retry_after: 拒绝时返回的 Retry-After（秒），默认为观测区间长度
+        """
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        
+        targets = dict(DEFAULT_TARGETS_MS, **(target_ms or {}))
+        self.targets = {priority: targets[priority] / 1000 for priority in PRIORITIES}
+        
+        self.retry_after = retry_after or max(1, math.ceil(self.interval))
+        
+        now = time.monotonic()
+        self._states = {priority: _CoDelState(interval_start=now) for priority in PRIORITIES}
+    
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "LoadShedder":
+        """根据模型配置创建过载保护器"""
+        config = config or {}
+        return cls(
+            enabled=config.get("enabled", False),
+            interval_ms=config.get("interval_ms", 5000),
+            target_ms=config.get("target_ms"),
+            retry_after=config.get("retry_after"),
+        )
+    
+    def observe(self, priority: str, wait: float):
+        """
+        记录一次请求获取到并发名额前的等待时间
+        
+        Args:
+            priority: 优先级
+            wait: 等待时间（秒）
+        """
+        state = self._states[priority]
+        state.min_wait = min(state.min_wait, wait)
+        state.observations += 1
+        self._roll(priority, oldest_wait=lambda: 0.0)
+    
+    def should_shed(self, priority: str, oldest_wait: Callable[[], float]) -> bool:
+        """
+        判断需要排队的新请求是否应该被拒绝
+        
+        Args:
+            priority: 优先级
+            oldest_wait: 返回该优先级排队最久的请求已等待时间（秒）的函数
+        """
+        if not self.enabled:
+            return False
+        
+        self._roll(priority, oldest_wait)
+        state = self._states[priority]
+        
+        if state.overloaded:
+            state.total_shed += 1
+            record_rejection("load_shedding")
+        
+        return state.overloaded
+    
+    def _roll(self, priority: str, oldest_wait: Callable[[], float]):
+        """观测区间结束时更新过载状态"""
+        state = self._states[priority]
+        now = time.monotonic()
+        
+        if now - state.interval_start < self.interval:
+            return
+        
+        if state.observations:
+            state.overloaded = state.min_wait > self.targets[priority]
+        else:
+            # 整个区间都没有请求获取到名额，以排队最久的请求为准
+            state.overloaded = oldest_wait() > self.targets[priority]
+        
+        state.interval_start = now
+        state.min_wait = math.inf
+        state.observations = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取过载保护统计信息"""
+        return {
+            "enabled": self.enabled,
+            "overloaded": {priority: state.overloaded for priority, state in self._states.items()},
+            "total_shed": {priority: state.total_shed for priority, state in self._states.items()},
+        }
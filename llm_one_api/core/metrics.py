@@ -0,0 +1,261 @@
+"""
+Prometheus 指标
+
+手写的最小实现（不依赖 prometheus_client），通过 GET /metrics 以文本格式导出
+
+- 热路径只做字典查找和整数累加：标签组合以元组为键，直方图用 bisect 定位桶，
+  只有第一次出现的标签组合才会分配内存；服务运行在单个事件循环中，不需要加锁
+- 标签基数有上限：每个指标最多 max_series 个标签组合，超出后记入标签值为 "other" 的序列
+- 上游连接数、健康状态等由负载均衡器维护的状态在抓取时读取，不在请求路径上重复记录
+
+配置示例：
+    metrics:
+      enabled: true
+      token: "scrape-token"     # 可选，设置后抓取时需要 Authorization: Bearer <token>
+      max_series: 1000
+"""
+
+import math
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+OVERFLOW_LABEL = "other"
+
+# (标签字典, 值)
+Sample = Tuple[Dict[str, str], float]
+# (指标名, 类型, 说明, 样本)
+MetricFamily = Tuple[str, str, str, List[Sample]]
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+INTER_TOKEN_BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+def _escape(value: str) -> str:
+    """转义标签值"""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """格式化标签"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    """格式化样本值"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类"""
+    
+    type = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], max_series: int):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._overflow_key = (OVERFLOW_LABEL,) * len(self.labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+    
+    def _admit(self, labels: Tuple[str, ...]) -> Tuple[str, ...]:
+        """新的标签组合：未超过上限时使用原标签，否则归入 other"""
+        if len(self._series) >= self.max_series:
+            return self._overflow_key
+        return labels
+    
+    def _labels(self, key: Tuple[str, ...], **extra: str) -> Dict[str, str]:
+        labels = dict(zip(self.labelnames, key))
+        labels.update(extra)
+        return labels
+
+
+class Counter(_Metric):
+    """计数器"""
+    
+    type = "counter"
+    
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        """累加"""
+        series = self._series
+        key = labels if labels in series else self._admit(labels)
+        series[key] = series.get(key, 0) + amount
+    
+    def collect(self) -> MetricFamily:
+        samples = [(self._labels(key), value) for key, value in self._series.items()]
+        return self.name, self.type, self.documentation, samples
+
+
+class _HistogramSeries:
+    """单个标签组合的直方图数据（桶计数不累积，导出时再累加）"""
+    
+    __slots__ = ("counts", "sum", "count")
+    
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """直方图"""
+    
+    type = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        max_series: int,
+        buckets: Sequence[float],
+    ):
+        super().__init__(name, documentation, labelnames, max_series)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, labels: Tuple[str, ...], value: float):
+        """记录一个观测值"""
+        series = self._series.get(labels)
+        if series is None:
+            key = self._admit(labels)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets) + 1)
+        
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+    
+    def collect(self) -> MetricFamily:
+        samples: List[Sample] = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                samples.append((self._labels(key, le=_format_value(bound)), cumulative))
+            samples.append((self._labels(key, le="+Inf"), series.count))
+            samples.append((dict(self._labels(key), __suffix__="_sum"), series.sum))
+            samples.append((dict(self._labels(key), __suffix__="_count"), series.count))
+        return self.name, self.type, self.documentation, samples
+
+
+class MetricsRegistry:
+    """指标注册表"""
+    
+    def __init__(self, max_series: int = 1000):
+        self.enabled = False
+        self.max_series = max_series
+        self._metrics: List[_Metric] = []
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames, self.max_series)
+        self._metrics.append(metric)
+        return metric
+    
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float],
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, self.max_series, buckets)
+        self._metrics.append(metric)
+        return metric
+    
+    def configure(self, config: Dict[str, Any]):
+        """应用配置"""
+        self.enabled = config.get("enabled", False)
+        self.max_series = config.get("max_series", 1000)
+        for metric in self._metrics:
+            metric.max_series = self.max_series
+    
+    def render(self, extra: Iterable[MetricFamily] = ()) -> str:
+        """
+        以 Prometheus 文本格式导出所有指标
+        
+        Args:
+            extra: 抓取时额外生成的指标（如上游状态）
+        """
+        lines: List[str] = []
+        families = [metric.collect() for metric in self._metrics] + list(extra)
+        
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                suffix = labels.pop("__suffix__", None)
+                if suffix:
+                    sample_name = name + suffix
+                elif metric_type == "histogram":
+                    sample_name = name + "_bucket"
+                else:
+                    sample_name = name
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter(
+    "llm_requests_total", "已完成的请求数", ("model", "endpoint", "stream"),
+)
+ERRORS = registry.counter(
+    "llm_request_errors_total", "失败的请求数（按错误类型）", ("model", "endpoint", "type"),
+)
+REQUEST_DURATION = registry.histogram(
+    "llm_request_duration_seconds", "请求总耗时", ("model", "endpoint"), DURATION_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN = registry.histogram(
+    "llm_time_to_first_token_seconds", "流式请求的首 token 延迟", ("model", "upstream"), TTFT_BUCKETS,
+)
+INTER_TOKEN_LATENCY = registry.histogram(
+    "llm_inter_token_latency_seconds", "流式响应相邻内容数据块的间隔", ("model", "upstream"), INTER_TOKEN_BUCKETS,
+)
+PROMPT_TOKENS = registry.counter(
+    "llm_prompt_tokens_total", "输入 token 数", ("model", "endpoint"),
+)
+COMPLETION_TOKENS = registry.counter(
+    "llm_completion_tokens_total", "输出 token 数", ("model", "endpoint"),
+)
+REJECTIONS = registry.counter(
+    "llm_rejections_total", "网关主动拒绝的请求数（限流、并发上限、过载保护、排队已满）", ("reason",),
+)
+
+
+def configure_metrics(config: Optional[Dict[str, Any]]):
+    """应用指标配置"""
+    registry.configure(config or {})
+
+
+def record_request(model: str, endpoint: str, stream: bool, duration: float, token_usage: Optional[Dict[str, int]]):
+    """记录一个已完成的请求"""
+    if not registry.enabled:
+        return
+    
+    REQUESTS.inc((model, endpoint, "true" if stream else "false"))
+    REQUEST_DURATION.observe((model, endpoint), duration)
+    
+    if token_usage:
+        PROMPT_TOKENS.inc((model, endpoint), token_usage.get("prompt_tokens", 0))
+        COMPLETION_TOKENS.inc((model, endpoint), token_usage.get("completion_tokens", 0))
+
+
+def record_error(model: str, endpoint: str, error_type: str):
+    """记录一个失败的请求"""
+    if registry.enabled:
+        ERRORS.inc((model, endpoint, error_type))
+
+
+def record_rejection(reason: str):
+    """记录一次网关主动拒绝"""
+    if registry.enabled:
+        REJECTIONS.inc((reason,))
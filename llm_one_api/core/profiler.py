@@ -0,0 +1,272 @@
+"""
+按需性能分析
+
+在处理该请求的 worker 进程内运行限时的性能分析会话，用于排查 CPU 占用异常：
+
+- sample（默认）：后台线程定期读取 sys._current_frames()，统计所有线程的调用栈，输出 collapsed stacks
+  （flamegraph.pl、speedscope 等火焰图工具可直接读取）；事件循环线程上的调用栈按当时运行的 asyncio 任务归类，
+  去掉事件循环本身的帧。开销只取决于采样间隔，与请求量无关，可以在线上流量下运行
+- cprofile：在事件循环线程上启用 cProfile 记录每次函数调用，输出 pstats（snakeviz、python -m pstats 可读取）
+  或按累计耗时排序的文本摘要；开销明显高于采样模式
+
+同一进程同时只允许一个会话
+"""
+
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from types import CodeType, FrameType
+from typing import Dict, List, Optional
+
+from llm_one_api.utils.exceptions import ProfilingInProgressError, ValidationError
+from llm_one_api.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 分析模式 -> 支持的输出格式（第一个为默认）
+FORMATS = {
+    "sample": ("collapsed",),
+    "cprofile": ("pstats", "text"),
+}
+
+# 最小采样间隔（秒）
+MIN_INTERVAL = 0.001
+
+# 文本摘要显示的函数数
+TEXT_LIMIT = 100
+
+# 是否有正在运行的会话（只在事件循环线程中读写）
+_running = False
+
+
+@dataclass
+class ProfileResult:
+    """性能分析结果"""
+    content: bytes
+    media_type: str
+    filename: str
+    samples: int = 0  # 采样次数（cprofile 模式为 0）
+
+
+class StackSampler:
+    """调用栈采样器（run() 在独立线程中运行）"""
+    
+    def __init__(self, interval: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Args:
+            interval: 采样间隔（秒）
+            loop: 事件循环（必须在事件循环线程中创建采样器）
+        """
+        self.interval = interval
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident() if loop is not None else None
+        
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        
+        self._labels: Dict[CodeType, str] = {}
+        self._stop = threading.Event()
+    
+    def run(self, duration: float):
+        """采样 duration 秒（或直到 stop()）"""
+        own_thread_id = threading.get_ident()
+        deadline = time.monotonic() + duration
+        next_sample = time.monotonic()
+        
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            self._sample(own_thread_id)
+            next_sample += self.interval
+            self._stop.wait(max(next_sample - time.monotonic(), 0))
+    
+    def stop(self):
+        """提前结束采样"""
+        self._stop.set()
+    
+    def _sample(self, own_thread_id: int):
+        """记录所有线程（采样线程除外）当前的调用栈"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            
+            frames: List[FrameType] = []
+            while frame is not None:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            
+            labels = [f"thread:{names.get(thread_id, thread_id)}"]
+            if thread_id == self.loop_thread_id:
+                frames = self._attribute_task(frames, labels)
+            labels.extend(self._label(frame.f_code) for frame in frames)
+            
+            self.stacks[";".join(labels)] += 1
+        
+        self.samples += 1
+    
+    def _attribute_task(self, frames: List[FrameType], labels: List[str]) -> List[FrameType]:
+        """
+        事件循环线程：按当前运行的 asyncio 任务归类，并去掉任务协程之下的事件循环帧
+        
+        Returns:
+            从任务协程开始的帧（没有正在运行的任务时返回全部帧）
+        """
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            labels.append("asyncio:event_loop")
+            return frames
+        
+        coro = task.get_coro()
+        labels.append(f"task:{getattr(coro, '__qualname__', type(coro).__name__)}")
+        
+        coro_frame = getattr(coro, "cr_frame", None)
+        for i, frame in enumerate(frames):
+            if frame is coro_frame:
+                return frames[i:]
+        return frames
+    
+    def _label(self, code: CodeType) -> str:
+        """帧的显示名称：函数名 (文件:行号)，按 code 对象缓存"""
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = f"{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+    
+    def collapsed(self) -> str:
+        """collapsed stacks 格式：每行 "帧1;帧2;...;帧N 次数" """
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+def _short_path(filename: str) -> str:
+    """去掉 sys.path 中最长的前缀，使路径更短且不暴露部署目录"""
+    best = ""
+    for path in sys.path:
+        if path and filename.startswith(path) and len(path) > len(best):
+            best = path
+    return filename[len(best):].lstrip(os.sep) if best else filename
+
+
+def validate_profile_request(
+    mode: str,
+    output: Optional[str],
+    duration: float,
+    interval: float,
+    max_duration: float,
+) -> str:
+    """
+    检查性能分析参数
+    
+    Returns:
+        输出格式（未指定时为该模式的默认格式）
+    
+    Raises:
+        ValidationError: 参数无效
+    """
+    if mode not in FORMATS:
+        raise ValidationError(f"不支持的分析模式: {mode}，可选值: {', '.join(FORMATS)}")
+    
+    output = output or FORMATS[mode][0]
+    if output not in FORMATS[mode]:
+        raise ValidationError(f"{mode} 模式不支持输出格式 {output}，可选值: {', '.join(FORMATS[mode])}")
+    
+    if not 0 < duration <= max_duration:
+        raise ValidationError(f"duration 必须在 0 到 {max_duration} 秒之间")
+    
+    if interval < MIN_INTERVAL:
+        raise ValidationError(f"interval 不能小于 {MIN_INTERVAL} 秒")
+    
+    return output
+
+
+async def run_profile(mode: str, output: str, duration: float, interval: float) -> ProfileResult:
+    """
+    运行一次性能分析会话（调用方先用 validate_profile_request 检查参数）
+    
+    Args:
+        mode: 分析模式（sample / cprofile）
+        output: 输出格式（collapsed / pstats / text）
+        duration: 分析时长（秒）
+        interval: 采样间隔（秒，只用于 sample 模式）
+    
+    Raises:
+        ProfilingInProgressError: 已有会话正在运行
+    """
+    global _running
+    if _running:
+        raise ProfilingInProgressError()
+    
+    _running = True
+    started = time.monotonic()
+    logger.warning(f"开始性能分析: 模式={mode}, 时长={duration}s, pid={os.getpid()}")
+    
+    try:
+        if mode == "sample":
+            result = await _run_sampler(duration, interval)
+        else:
+            result = await _run_cprofile(duration, output)
+    finally:
+        _running = False
+    
+    logger.warning(f"性能分析结束: 模式={mode}, 实际时长={time.monotonic() - started:.1f}s")
+    return result
+
+
+async def _run_sampler(duration: float, interval: float) -> ProfileResult:
+    """采样模式：在线程池中运行采样器"""
+    loop = asyncio.get_running_loop()
+    sampler = StackSampler(interval, loop)
+    
+    try:
+        await loop.run_in_executor(None, sampler.run, duration)
+    finally:
+        # 请求被取消（客户端断开）时也要结束采样线程
+        sampler.stop()
+    
+    return ProfileResult(
+        content=sampler.collapsed().encode("utf-8"),
+        media_type="text/plain; charset=utf-8",
+        filename=f"profile-{os.getpid()}.collapsed",
+        samples=sampler.samples,
+    )
+
+
+async def _run_cprofile(duration: float, output: str) -> ProfileResult:
+    """cProfile 模式：在事件循环线程上启用 cProfile，duration 秒后停止"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # 进程中已有其他 profiler（如 sys.setprofile 或另一个 cProfile）
+        raise ProfilingInProgressError(f"无法启动 cProfile: {e}")
+    
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        profiler.disable()
+    
+    if output == "pstats":
+        profiler.create_stats()
+        return ProfileResult(
+            content=marshal.dumps(profiler.stats),
+            media_type="application/octet-stream",
+            filename=f"profile-{os.getpid()}.pstats",
+        )
+    
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(TEXT_LIMIT)
+    return ProfileResult(
+        content=stream.getvalue().encode("utf-8"),
+        media_type="text/plain; charset=utf-8",
+        filename=f"profile-{os.getpid()}.txt",
+    )
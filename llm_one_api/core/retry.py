@@ -0,0 +1,207 @@
+"""
+重试策略
+
+- 错误分类：连接错误、超时、5xx、429 可以重试；其他 4xx 重试也不会成功，直接返回
+- 指数退避 + 全抖动（full jitter），避免大量请求在同一时刻重试
+- 遵循上游返回的 Retry-After
+- 全局重试预算：每个请求存入 ratio 个令牌，每次重试消耗 1 个令牌，
+  重试量不会超过总流量的固定比例，避免重试风暴放大上游过载
+
+配置示例（模型级别）：
+    retry:
+      max_attempts: 3
+      base_delay: 0.5          # 首次重试的退避上限（秒）
+      max_delay: 8             # 退避上限（秒）
+      retry_on_status: [408, 429, 500, 502, 503, 504]
+      max_retry_after: 30      # Retry-After 超过该值时不再重试（秒）
+
+全局重试预算（顶层配置）：
+    retry_budget:
+      ratio: 0.2               # 重试量最多为请求量的 20%
+      min_per_second: 1        # 低流量时每秒至少允许的重试次数
+      max_tokens: 10           # 令牌上限（允许的突发重试次数）
+"""
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from llm_one_api.utils.logger import logger
+
+DEFAULT_RETRY_ON_STATUS = (408, 429, 500, 502, 503, 504)
+
+# 可以重试的网络错误
+RETRYABLE_EXCEPTIONS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    解析响应中的重试等待时间
+    
+    支持 retry-after-ms（毫秒）和 Retry-After（秒数或 HTTP 日期）
+    
+    Returns:
+        等待时间（秒），没有时返回 None
+    """
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """重试策略（每个模型一份配置）"""
+    
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        retry_on_status=DEFAULT_RETRY_ON_STATUS,
+        max_retry_after: float = 30.0,
+    ):
+        self.max_attempts = max(int(max_attempts), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on_status = set(retry_on_status)
+        self.max_retry_after = max_retry_after
+    
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "RetryPolicy":
+        """根据模型配置创建重试策略"""
+        config = config or {}
+        return cls(
+            max_attempts=config.get("max_attempts", 3),
+            base_delay=config.get("base_delay", 0.5),
+            max_delay=config.get("max_delay", 8.0),
+            retry_on_status=config.get("retry_on_status", DEFAULT_RETRY_ON_STATUS),
+            max_retry_after=config.get("max_retry_after", 30.0),
+        )
+    
+    def is_retryable(self, error: Exception) -> bool:
+        """判断错误是否值得重试"""
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.retry_on_status
+        return isinstance(error, RETRYABLE_EXCEPTIONS)
+    
+    def get_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """
+        计算下一次重试前的等待时间
+        
+        Args:
+            attempt: 已完成的尝试次数（从 1 开始）
+            error: 上一次尝试的错误
+        
+        Returns:
+            等待时间（秒），上游要求的等待时间过长时返回 None（不再重试）
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = parse_retry_after(error.response)
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    return None
+                delay = max(delay, retry_after)
+        
+        return delay
+
+
+class RetryBudget:
+    """全局重试预算（令牌桶）"""
+    
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_tokens: float = 10.0):
+        """
+        初始化重试预算
+        
+        Args:
+            ratio: 每个请求存入的令牌数（重试量占请求量的比例上限）
+            min_per_second: 每秒补充的令牌数（保证低流量时也能重试）
+            max_tokens: 令牌上限
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        
+        self._tokens = max_tokens
+        self._updated_at = time.monotonic()
+        
+        self.total_requests = 0
+        self.total_retries = 0
+        self.total_rejected = 0
+    
+    def _refill(self, amount: float = 0.0):
+        """按时间补充令牌"""
+        now = time.monotonic()
+        amount += (now - self._updated_at) * self.min_per_second
+        self._updated_at = now
+        self._tokens = min(self._tokens + amount, self.max_tokens)
+    
+    def record_request(self):
+        """记录一个新请求"""
+        self.total_requests += 1
+        self._refill(self.ratio)
+    
+    def try_acquire(self) -> bool:
+        """尝试消耗一个令牌用于重试"""
+        self._refill()
+        
+        if self._tokens >= 1:
+            self._tokens -= 1
+            self.total_retries += 1
+            return True
+        
+        self.total_rejected += 1
+        return False
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取重试预算统计信息"""
+        self._refill()
+        return {
+            "tokens": round(self._tokens, 2),
+            "total_requests": self.total_requests,
+            "total_retries": self.total_retries,
+            "total_rejected": self.total_rejected,
+        }
+
+
+_retry_budget = RetryBudget()
+
+
+def configure_retry_budget(config: Dict[str, Any]):
+    """应用全局重试预算配置"""
+    global _retry_budget
+    
+    _retry_budget = RetryBudget(
+        ratio=config.get("ratio", 0.2),
+        min_per_second=config.get("min_per_second", 1.0),
+        max_tokens=config.get("max_tokens", 10.0),
+    )
+    logger.info(
+        f"重试预算: 比例={_retry_budget.ratio}, "
+        f"每秒最少={_retry_budget.min_per_second}"
+    )
+
+
+def get_retry_budget() -> RetryBudget:
+    """获取全局重试预算"""
+    return _retry_budget
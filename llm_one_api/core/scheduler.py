@@ -0,0 +1,219 @@
+"""
+请求调度器
+
+上游达到并发上限（max_inflight）时，请求在模型的上游池前排队等待：
+- 优先级：interactive 严格优先于 batch
+- 同一优先级内按租户（user_id）做加权公平排队（WFQ），
+  每个请求的完成标签 = max(虚拟时间, 租户上一个完成标签) + 1 / 权重，
+  按完成标签从小到大出队，重度租户不会挤占其他租户的份额
+
+租户的权重和优先级来自认证结果：
+    metadata:
+      weight: 2             # 默认 1
+      priority: batch       # interactive（默认）或 batch
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from llm_one_api.core.metrics import record_rejection
+from llm_one_api.utils.exceptions import UpstreamError
+
+# 优先级从高到低
+PRIORITIES = ("interactive", "batch")
+DEFAULT_PRIORITY = "interactive"
+
+# 租户完成标签数量超过该值时清理已经过期的标签
+_PRUNE_THRESHOLD = 4096
+
+# 队列中不再排队的条目超过该值且多于排队中的请求时重建队列
+_COMPACT_THRESHOLD = 64
+
+
+@dataclass(order=True)
+class Waiter:
+    """排队中的请求"""
+    finish_tag: float
+    seq: int
+    start_tag: float = field(compare=False)
+    tenant: str = field(compare=False)
+    priority: str = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    future: "asyncio.Future[Any]" = field(compare=False)
+    # 仍在排队（未出队、未取消）
+    waiting: bool = field(default=True, compare=False)
+
+
+def resolve_tenant(auth_result: Optional[Dict[str, Any]]) -> Tuple[str, float, str]:
+    """
+    从认证结果中解析调度参数
+    
+    Returns:
+        (租户, 权重, 优先级)
+    """
+    auth_result = auth_result or {}
+    metadata = auth_result.get("metadata") or {}
+    
+    tenant = str(auth_result.get("user_id") or "anonymous")
+    
+    try:
+        weight = float(metadata.get("weight", 1))
+    except (TypeError, ValueError):
+        weight = 1.0
+    
+    priority = auth_result.get("priority") or metadata.get("priority") or DEFAULT_PRIORITY
+    if priority not in PRIORITIES:
+        priority = DEFAULT_PRIORITY
+    
+    return tenant, max(weight, 0.01), priority
+
+
+class FairScheduler:
+    """加权公平排队调度器（每个上游池一个实例）"""
+    
+    def __init__(self, max_queue: int = 1000):
+        """
+        初始化调度器
+        
+        Args:
+            max_queue: 最多排队请求数，超过后直接拒绝
+        """
+        self.max_queue = max_queue
+        
+        self._queues: Dict[str, List[Waiter]] = {priority: [] for priority in PRIORITIES}
+        # 按入队顺序排列，用于找出排队最久的请求（队首已出队或已取消的请求延迟清理）
+        self._arrivals: Dict[str, Deque[Waiter]] = {priority: deque() for priority in PRIORITIES}
+        # 排队中（未出队、未取消）的请求数
+        self._waiting: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._finish_tags: Dict[Tuple[str, str], float] = {}
+        self._seq = itertools.count()
+        
+        self.total_queued = 0
+        self.total_rejected = 0
+    
+    def __len__(self) -> int:
+        """排队中的请求数（不包括已取消的请求）"""
+        return sum(self._waiting.values())
+    
+    def oldest_wait(self, priority: str) -> float:
+        """指定优先级排队最久的请求已等待的时间（秒）"""
+        arrivals = self._arrivals[priority]
+        while arrivals and not arrivals[0].waiting:
+            arrivals.popleft()
+        
+        return time.monotonic() - arrivals[0].enqueued_at if arrivals else 0.0
+    
+    def enqueue(self, tenant: str, weight: float = 1.0, priority: str = DEFAULT_PRIORITY) -> Waiter:
+        """
+        请求入队
+        
+        Args:
+            tenant: 租户
+            weight: 租户权重
+            priority: 优先级
+        
+        Returns:
+            排队对象，分配到上游后 future 返回服务器
+        """
+        if len(self) >= self.max_queue:
+            self.total_rejected += 1
+            record_rejection("queue_full")
+            raise UpstreamError(f"上游繁忙，排队请求过多（上限 {self.max_queue}）", status_code=503)
+        
+        if len(self._finish_tags) > _PRUNE_THRESHOLD:
+            self._prune()
+        
+        key = (priority, tenant)
+        start_tag = max(self._virtual_time[priority], self._finish_tags.get(key, 0.0))
+        finish_tag = start_tag + 1.0 / weight
+        self._finish_tags[key] = finish_tag
+        
+        waiter = Waiter(
+            finish_tag=finish_tag,
+            seq=next(self._seq),
+            start_tag=start_tag,
+            tenant=tenant,
+            priority=priority,
+            enqueued_at=time.monotonic(),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._queues[priority], waiter)
+        self._arrivals[priority].append(waiter)
+        self._waiting[priority] += 1
+        self.total_queued += 1
+        
+        return waiter
+    
+    def cancel(self, waiter: Waiter):
+        """
+        调用方放弃排队（取消或超时）时调用，立即释放排队名额
+        
+        堆中的条目延迟删除，不再排队的条目过多时重建队列
+        """
+        if not waiter.waiting:
+            return
+        
+        waiter.waiting = False
+        self._waiting[waiter.priority] -= 1
+        
+        if not waiter.future.done():
+            waiter.future.cancel()
+        
+        self._compact(waiter.priority)
+    
+    def pop(self) -> Optional[Waiter]:
+        """按优先级和完成标签取出下一个请求（跳过已取消的请求）"""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            
+            while queue:
+                waiter = heapq.heappop(queue)
+                if not waiter.waiting:
+                    continue
+                
+                waiter.waiting = False
+                self._waiting[priority] -= 1
+                if waiter.future.done():
+                    continue
+                
+                self._virtual_time[priority] = max(self._virtual_time[priority], waiter.start_tag)
+                self._compact(priority)
+                return waiter
+        
+        return None
+    
+    def _compact(self, priority: str):
+        """不再排队的条目多于排队中的请求时重建队列（均摊 O(1)）"""
+        waiting = self._waiting[priority]
+        
+        queue = self._queues[priority]
+        dead = len(queue) - waiting
+        if dead > _COMPACT_THRESHOLD and dead > waiting:
+            queue[:] = [w for w in queue if w.waiting]
+            heapq.heapify(queue)
+        
+        arrivals = self._arrivals[priority]
+        dead = len(arrivals) - waiting
+        if dead > _COMPACT_THRESHOLD and dead > waiting:
+            self._arrivals[priority] = deque(w for w in arrivals if w.waiting)
+    
+    def _prune(self):
+        """清理不再影响排队顺序的租户完成标签"""
+        self._finish_tags = {
+            key: tag for key, tag in self._finish_tags.items()
+            if tag > self._virtual_time[key[0]]
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计信息"""
+        return {
+            "queued": dict(self._waiting),
+            "total_queued": self.total_queued,
+            "total_rejected": self.total_rejected,
+        }
@@ -0,0 +1,204 @@
+"""
+流式响应计时
+
+记录流式响应的首 token 延迟（TTFT）、内容数据块之间的间隔和输出速度（token/s）
+
+只统计包含生成内容的数据块（role、usage 等空数据块不计入）；
+数据块间隔用 Welford 算法增量计算均值和标准差，内存占用与响应长度无关
+
+StreamWatchdog 用一个定时器实现流式响应的首 token / 空闲 / 总时长超时
+"""
+
+import asyncio
+import math
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def has_content(chunk: Dict[str, Any]) -> bool:
+    """判断流式数据块是否包含生成的内容（文本或工具调用）"""
+    for choice in chunk.get("choices") or []:
+        delta = choice.get("delta") or {}
+        if delta.get("content") or delta.get("tool_calls") or delta.get("function_call") or choice.get("text"):
+            return True
+    return False
+
+
+class StreamTiming:
+    """单个流式响应的计时"""
+    
+    __slots__ = (
+        "started_at", "first_token_at", "last_chunk_at", "chunks",
+        "gap_count", "gap_mean", "gap_m2", "gap_max",
+    )
+    
+    def __init__(self, started_at: float):
+        """
+        Args:
+            started_at: 请求开始时间（time.monotonic()）
+        """
+        self.started_at = started_at
+        self.first_token_at: Optional[float] = None
+        self.last_chunk_at: Optional[float] = None
+        self.chunks = 0
+        
+        self.gap_count = 0
+        self.gap_mean = 0.0
+        self.gap_m2 = 0.0
+        self.gap_max = 0.0
+    
+    def on_chunk(self, now: float) -> Optional[float]:
+        """
+        记录一个内容数据块
+        
+        Args:
+            now: 收到数据块的时间（time.monotonic()）
+        
+        Returns:
+            与上一个内容数据块的间隔（秒），首个数据块返回 None
+        """
+        self.chunks += 1
+        last, self.last_chunk_at = self.last_chunk_at, now
+        
+        if last is None:
+            self.first_token_at = now
+            return None
+        
+        gap = now - last
+        self.gap_count += 1
+        delta = gap - self.gap_mean
+        self.gap_mean += delta / self.gap_count
+        self.gap_m2 += delta * (gap - self.gap_mean)
+        if gap > self.gap_max:
+            self.gap_max = gap
+        return gap
+    
+    @property
+    def ttft(self) -> Optional[float]:
+        """首 token 延迟（秒）"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+    
+    def tokens_per_second(self, completion_tokens: int) -> Optional[float]:
+        """
+        输出速度：首个到最后一个内容数据块之间每秒生成的 token 数
+        
+        Args:
+            completion_tokens: 输出 token 数（上游未返回时按内容数据块数估算，通常一个数据块一个 token）
+        """
+        if self.gap_count == 0:
+            return None
+        
+        elapsed = self.last_chunk_at - self.first_token_at
+        if elapsed <= 0:
+            return None
+        
+        # 首个数据块的 token 计入 TTFT，不计入生成速度
+        tokens = (completion_tokens or self.chunks) - 1
+        return max(tokens, 0) / elapsed
+    
+    def summary(self, completion_tokens: int = 0) -> Dict[str, Any]:
+        """
+        生成统计字段（加入统计数据）
+        
+        Args:
+            completion_tokens: 输出 token 数
+        """
+        ttft = self.ttft
+        tokens_per_second = self.tokens_per_second(completion_tokens)
+        
+        inter_token_latency = None
+        if self.gap_count:
+            inter_token_latency = {
+                "count": self.gap_count,
+                "mean": round(self.gap_mean, 6),
+                "max": round(self.gap_max, 6),
+                "stddev": round(math.sqrt(self.gap_m2 / self.gap_count), 6),
+            }
+        
+        return {
+            "ttft": round(ttft, 6) if ttft is not None else None,
+            "tokens_per_second": round(tokens_per_second, 2) if tokens_per_second is not None else None,
+            "inter_token_latency": inter_token_latency,
+        }
+
+
+class StreamWatchdog:
+    """
+    流式响应超时看门狗
+    
+    整个响应只使用一个定时器：等待上游时设置到期时间，定时器触发时如果到期时间已被推后则重新调度，
+    每个数据块只更新一个时间戳，不会像 asyncio.wait_for 那样为每次等待创建 Task 和定时器。
+    到期时取消正在等待的任务，wait() 把取消转换为 asyncio.TimeoutError
+    """
+    
+    __slots__ = ("_loop", "_task", "_handle", "_expires_at", "_fired")
+    
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._task: "Optional[asyncio.Task[Any]]" = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._expires_at: Optional[float] = None
+        self._fired = False
+    
+    async def wait(self, awaitable: Awaitable[T], timeout: Optional[float]) -> T:
+        """
+        等待 awaitable 完成
+        
+        Args:
+            awaitable: 要等待的对象
+            timeout: 超时时间（秒），None 表示不限制
+        
+        Raises:
+            asyncio.TimeoutError: 超时
+        """
+        if timeout is None:
+            return await awaitable
+        
+        self._arm(timeout)
+        try:
+            return await awaitable
+        except asyncio.CancelledError:
+            if not self._fired:
+                raise
+            self._fired = False
+            
+            # Python 3.11+：撤销看门狗发出的取消，调用方同时被取消时继续传播
+            uncancel = getattr(self._task, "uncancel", None)
+            if uncancel is not None and uncancel() > 0:
+                raise
+            raise asyncio.TimeoutError()
+        finally:
+            self._expires_at = None
+    
+    def close(self):
+        """取消定时器"""
+        self._expires_at = None
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+    
+    def _arm(self, timeout: float):
+        """设置到期时间，已有定时器不晚于到期时间时沿用"""
+        self._task = asyncio.current_task()
+        self._expires_at = self._loop.time() + max(timeout, 0)
+        
+        if self._handle is None or self._handle.when() > self._expires_at:
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle = self._loop.call_at(self._expires_at, self._on_timer)
+    
+    def _on_timer(self):
+        self._handle = None
+        if self._expires_at is None:
+            return
+        
+        if self._loop.time() < self._expires_at:
+            self._handle = self._loop.call_at(self._expires_at, self._on_timer)
+            return
+        
+        self._expires_at = None
+        self._fired = True
+        self._task.cancel()
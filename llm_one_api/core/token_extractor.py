@@ -8,6 +8,7 @@ Token 提取器
 from typing import Dict, Any, Optional
 
 from llm_one_api.utils.logger import setup_logger
+from llm_one_api.utils.token_counter import count_tokens, acount_tokens
 
 logger = setup_logger(__name__)
 
@@ -74,6 +75,7 @@ class TokenExtractor:
         估算文本的 token 数量（使用 tiktoken）
         
         当无法从响应中获取准确的 token 数量时使用
+        编码器由 token_counter 模块统一缓存，未安装 tiktoken 时使用粗略估算
         
         Args:
             text: 文本内容
@@ -83,24 +85,29 @@ class TokenExtractor:
             估算的 token 数量
         """
         try:
-            import tiktoken
-            
-            # 获取对应模型的编码器
-            try:
-                encoding = tiktoken.encoding_for_model(model)
-            except KeyError:
-                # 如果模型不支持，使用默认编码器
-                encoding = tiktoken.get_encoding("cl100k_base")
-            
-            tokens = encoding.encode(text)
-            return len(tokens)
+            return count_tokens(text, model)
+        
+        except Exception as e:
+            logger.error(f"估算 token 失败: {e}")
+            return 0
+    
+    @staticmethod
+    async def aestimate_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+        """
+        异步估算文本的 token 数量
         
-        except ImportError:
-            # 如果没有安装 tiktoken，使用粗略估算（1 token ≈ 4 字符）
-            logger.warning("tiktoken 未安装，使用粗略估算")
-            return len(text) // 4
+        大文本会放到线程池中编码，不阻塞事件循环
+        
+        Args:
+            text: 文本内容
+            model: 模型名称
+            
+        Returns:
+            估算的 token 数量
+        """
+        try:
+            return await acount_tokens(text, model)
         
         except Exception as e:
             logger.error(f"估算 token 失败: {e}")
             return 0
-
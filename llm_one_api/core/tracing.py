@@ -0,0 +1,452 @@
+"""
+请求链路追踪
+
+按阶段记录每个请求的 span（认证、路由查找、排队、每次上游尝试、连接、首字节、流式传输、统计记录），
+被采样的请求导出为 OTLP JSON（每行一个 ExportTraceServiceRequest），
+可以直接被 OpenTelemetry Collector 的 otlpjsonfile receiver 等工具读取
+
+- 当前 span 保存在 contextvars 中，请求内创建的子任务自动继承
+- 导出在后台线程中进行，请求处理只把结束的 trace 放入队列
+- 请求头带有 W3C traceparent 时沿用其 trace id 和父 span；
+  采样标记只在 trust_incoming_sampling 开启时沿用（否则客户端可以强制采样每个请求），默认按 sample_rate 采样
+- 启用 server_timing 时，未被采样的请求也会计时，用于生成 Server-Timing 响应头
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from llm_one_api import __version__
+from llm_one_api.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# OTLP span 类型
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# OTLP 状态码
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+# httpcore 追踪事件 -> span 名称
+HTTP_PHASES = {
+    "connection.connect_tcp": "upstream.connect",
+    "connection.start_tls": "upstream.tls",
+    "http11.receive_response_headers": "upstream.ttfb",
+    "http2.receive_response_headers": "upstream.ttfb",
+}
+
+# 导出线程每次最多写入的 trace 数
+EXPORT_BATCH_SIZE = 500
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "llm_one_api_current_span", default=None,
+)
+
+
+class Span:
+    """一个阶段的计时（时间使用 perf_counter_ns，导出时换算为 Unix 时间）"""
+    
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start", "end", "attributes", "events", "error")
+    
+    def __init__(
+        self,
+        trace: "Trace",
+        name: str,
+        parent_id: Optional[str],
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.perf_counter_ns()
+        self.end: Optional[int] = None
+        self.attributes = attributes or {}
+        self.events: List[Tuple[str, int]] = []
+        self.error: Optional[str] = None
+    
+    def set_attribute(self, key: str, value: Any):
+        """设置属性"""
+        self.attributes[key] = value
+    
+    def add_event(self, name: str):
+        """记录一个时间点事件（如首 token）"""
+        self.events.append((name, time.perf_counter_ns()))
+    
+    def record_error(self, error: BaseException):
+        """把 span 标记为失败"""
+        self.error = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+    
+    def finish(self):
+        """结束计时（重复调用无效）"""
+        if self.end is None:
+            self.end = time.perf_counter_ns()
+            self.trace.add(self)
+    
+    @property
+    def duration_ms(self) -> float:
+        """耗时（毫秒），未结束时计算到当前"""
+        return ((self.end or time.perf_counter_ns()) - self.start) / 1e6
+
+
+class Trace:
+    """一个请求的所有 span"""
+    
+    __slots__ = ("trace_id", "sampled", "root", "spans", "finished", "_wall_start", "_perf_start")
+    
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.root: Optional[Span] = None
+        self.spans: List[Span] = []
+        self.finished = False
+        self._wall_start = time.time_ns()
+        self._perf_start = time.perf_counter_ns()
+    
+    def add(self, span: Span):
+        """记录已结束的 span（trace 结束后才结束的 span 丢弃，如请求返回后仍在运行的后台任务）"""
+        if not self.finished:
+            self.spans.append(span)
+    
+    def unix_nano(self, perf_ns: int) -> int:
+        """把 perf_counter_ns 换算为 Unix 时间（纳秒）"""
+        return self._wall_start + perf_ns - self._perf_start
+    
+    def server_timing(self) -> str:
+        """生成 Server-Timing 响应头：已结束的阶段和到目前为止的总耗时"""
+        entries = [f"{span.name};dur={span.duration_ms:.3f}" for span in self.spans if span is not self.root]
+        entries.append(f"total;dur={self.root.duration_ms:.3f}")
+        return ", ".join(entries)
+    
+    def to_otlp(self, resource: Dict[str, Any]) -> Dict[str, Any]:
+        """转换为 OTLP JSON（ExportTraceServiceRequest）"""
+        spans = []
+        for span in self.spans:
+            item = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(self.unix_nano(span.start)),
+                "endTimeUnixNano": str(self.unix_nano(span.end)),
+                "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+                "status": {"code": STATUS_ERROR, "message": span.error} if span.error else {"code": STATUS_UNSET},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            if span.events:
+                item["events"] = [
+                    {"timeUnixNano": str(self.unix_nano(at)), "name": name} for name, at in span.events
+                ]
+            spans.append(item)
+        
+        return {
+            "resourceSpans": [{
+                "resource": resource,
+                "scopeSpans": [{
+                    "scope": {"name": "llm_one_api", "version": __version__},
+                    "spans": spans,
+                }],
+            }],
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """转换为 OTLP KeyValue"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """
+    解析 W3C traceparent 请求头
+    
+    Returns:
+        (trace id, 父 span id, 是否采样)，格式无效时返回 None
+    """
+    if not header:
+        return None
+    
+    parts = header.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    
+    try:
+        if int(parts[1], 16) == 0 or int(parts[2], 16) == 0:
+            return None
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Tracer:
+    """追踪配置和 OTLP 导出线程"""
+    
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.trust_incoming_sampling = False
+        self.server_timing = True
+        self.export_path: Optional[str] = None
+        self.max_queue = 10000
+        self.service_name = "llm-one-api"
+        
+        self._resource: Dict[str, Any] = {}
+        self._queue: Optional["queue.Queue[Optional[Trace]]"] = None
+        self._thread: Optional[threading.Thread] = None
+        
+        self.exported = 0
+        self.dropped = 0
+    
+    def configure(self, config: Dict[str, Any]):
+        """应用配置，需要导出时启动导出线程"""
+        self.enabled = config.get("enabled", False)
+        self.sample_rate = config.get("sample_rate", 0.01)
+        self.trust_incoming_sampling = config.get("trust_incoming_sampling", False)
+        self.server_timing = config.get("server_timing", True)
+        self.export_path = config.get("export_path", "logs/traces.jsonl")
+        self.max_queue = config.get("max_queue", 10000)
+        self.service_name = config.get("service_name", "llm-one-api")
+        
+        self._resource = {
+            "attributes": [
+                _otlp_attribute("service.name", self.service_name),
+                _otlp_attribute("service.version", __version__),
+            ],
+        }
+        
+        if self.enabled and self.export_path and self._thread is None:
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._thread.start()
+        
+        if self.enabled:
+            logger.info(
+                f"🔍 链路追踪已启用: 采样率={self.sample_rate}, "
+                f"导出={self.export_path or '不导出'}, Server-Timing={self.server_timing}"
+            )
+    
+    def start_trace(
+        self,
+        name: str,
+        traceparent: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Trace]:
+        """
+        为请求创建 trace（根 span 为 SERVER 类型）
+        
+        Returns:
+            Trace，追踪未启用或请求既不采样也不需要 Server-Timing 时返回 None
+        """
+        if not self.enabled:
+            return None
+        
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, parent_sampled = parent
+        else:
+            trace_id, parent_id, parent_sampled = f"{random.getrandbits(128):032x}", None, None
+        
+        if parent_sampled is not None and self.trust_incoming_sampling:
+            sampled = parent_sampled
+        else:
+            sampled = random.random() < self.sample_rate
+        
+        sampled = sampled and self._queue is not None
+        if not sampled and not self.server_timing:
+            return None
+        
+        trace = Trace(trace_id, sampled)
+        trace.root = Span(trace, name, parent_id, SPAN_KIND_SERVER, attributes)
+        return trace
+    
+    def finish_trace(self, trace: Trace):
+        """结束 trace，被采样的放入导出队列（队列满时丢弃）"""
+        trace.root.finish()
+        trace.finished = True
+        
+        if not trace.sampled:
+            return
+        
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"追踪导出队列已满，已丢弃 {self.dropped} 个 trace")
+    
+    def _export_loop(self):
+        """导出线程：按批写入 JSON Lines 文件，收到 None 时写完剩余 trace 后退出"""
+        directory = os.path.dirname(os.path.abspath(self.export_path))
+        os.makedirs(directory, exist_ok=True)
+        closing = False
+        
+        with open(self.export_path, "a", encoding="utf-8") as f:
+            while not closing:
+                batch = [self._queue.get()]
+                while len(batch) < EXPORT_BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                
+                if None in batch:
+                    closing = True
+                    batch = [trace for trace in batch if trace is not None]
+                
+                try:
+                    for trace in batch:
+                        f.write(json.dumps(trace.to_otlp(self._resource), ensure_ascii=False))
+                        f.write("\n")
+                    f.flush()
+                    self.exported += len(batch)
+                except Exception as e:
+                    logger.error(f"导出追踪数据失败，丢弃 {len(batch)} 个 trace: {e}")
+    
+    def stop(self, timeout: float = 10):
+        """写完队列中剩余的 trace 后停止导出线程"""
+        if self._thread is None:
+            return
+        
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"追踪导出线程未能在 {timeout} 秒内退出，剩余 {self._queue.qsize()} 个 trace 未导出")
+        else:
+            logger.info(f"链路追踪已关闭，共导出 {self.exported} 个 trace，丢弃 {self.dropped} 个")
+        
+        self._thread = None
+        self._queue = None
+
+
+# 全局追踪器
+tracer = Tracer()
+
+
+def configure_tracing(config: Optional[Dict[str, Any]]):
+    """应用追踪配置"""
+    tracer.configure(config or {})
+
+
+async def shutdown_tracing():
+    """关闭导出线程（在线程池中等待，不阻塞事件循环）"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, tracer.stop)
+
+
+@contextmanager
+def activate(trace: Trace) -> Iterator[Span]:
+    """把 trace 的根 span 设为当前 span"""
+    token = _current_span.set(trace.root)
+    try:
+        yield trace.root
+    finally:
+        _current_span.reset(token)
+
+
+def current_span() -> Optional[Span]:
+    """当前 span，没有正在追踪的请求时返回 None"""
+    return _current_span.get()
+
+
+def start_span(
+    name: str,
+    attributes: Optional[Dict[str, Any]] = None,
+    kind: int = SPAN_KIND_INTERNAL,
+    parent: Optional[Span] = None,
+) -> Optional[Span]:
+    """
+    开始一个子 span，但不设为当前 span（调用方负责 finish()）
+    
+    用于跨越 yield 的阶段（如流式传输）：生成器可能在其他上下文中被关闭，不能在其中修改 contextvars
+    
+    Returns:
+        Span，没有正在追踪的请求时返回 None
+    """
+    parent = parent or _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+@contextmanager
+def span(
+    name: str,
+    attributes: Optional[Dict[str, Any]] = None,
+    kind: int = SPAN_KIND_INTERNAL,
+) -> Iterator[Optional[Span]]:
+    """
+    在 with 块内记录一个子 span 并设为当前 span，块内抛出的异常记录为失败
+    
+    没有正在追踪的请求时不做任何事（返回 None）
+    """
+    child = start_span(name, attributes, kind)
+    if child is None:
+        yield None
+        return
+    
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish()
+
+
+def http_trace_extensions(parent: Optional[Span] = None) -> Dict[str, Any]:
+    """
+    httpx 请求的 extensions：把建立连接、TLS 握手和等待响应头（首字节）记录为子 span
+    
+    复用连接池中的连接时没有 upstream.connect / upstream.tls
+    
+    Args:
+        parent: 父 span，默认为当前 span
+    
+    Returns:
+        传给 httpx 的 extensions，没有正在追踪的请求时返回空字典
+    """
+    parent = parent or _current_span.get()
+    if parent is None:
+        return {}
+    
+    open_spans: Dict[str, Span] = {}
+    
+    async def trace(event_name: str, info: Dict[str, Any]):
+        phase, _, stage = event_name.rpartition(".")
+        name = HTTP_PHASES.get(phase)
+        if name is None:
+            return
+        
+        if stage == "started":
+            open_spans[phase] = Span(parent.trace, name, parent.span_id)
+            return
+        
+        child = open_spans.pop(phase, None)
+        if child is not None:
+            if stage == "failed" and info.get("exception") is not None:
+                child.record_error(info["exception"])
+            child.finish()
+    
+    return {"trace": trace}
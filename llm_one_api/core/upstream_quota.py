@@ -0,0 +1,152 @@
+"""
+上游限流额度
+
+OpenAI 及兼容服务会在响应头中返回当前 Key 的剩余额度：
+    x-ratelimit-limit-requests: 500
+    x-ratelimit-remaining-requests: 499
+    x-ratelimit-reset-requests: 120ms
+    x-ratelimit-limit-tokens: 30000
+    x-ratelimit-remaining-tokens: 29000
+    x-ratelimit-reset-tokens: 6m0s
+
+转发器把这些响应头记录到上游的额度状态中，负载均衡时：
+- 额度已用完的上游在重置时间之前不会被选中（除非所有上游都已用完）
+- 优先选择剩余额度比例高于 quota_low_watermark 的上游
+"""
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional
+
+HEADER_PREFIX = "x-ratelimit-"
+
+# 剩余额度为 0 但没有返回重置时间时，默认避开的时间（秒）
+DEFAULT_RESET = 1.0
+
+# 还有剩余额度但没有返回重置时间时，额度信息的有效期（秒），过期后视为额度未知
+DEFAULT_WINDOW = 60.0
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    解析重置时间
+    
+    支持 "1s"、"120ms"、"6m0s"、"1h2m3.5s" 等格式，以及纯数字（秒）
+    
+    Returns:
+        距离重置的时间（秒），无法解析时返回 None
+    """
+    if not value:
+        return None
+    
+    value = value.strip()
+    
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    """解析整数响应头"""
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+@dataclass
+class _QuotaWindow:
+    """单类额度（请求数或 token 数）"""
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    reset_at: float = 0.0
+    
+    def update(self, headers: Mapping[str, str], kind: str, now: float) -> bool:
+        """从响应头更新，返回是否包含该类额度"""
+        remaining = _parse_int(headers.get(f"{HEADER_PREFIX}remaining-{kind}"))
+        if remaining is None:
+            return False
+        
+        self.remaining = remaining
+        self.limit = _parse_int(headers.get(f"{HEADER_PREFIX}limit-{kind}")) or self.limit
+        
+        reset = parse_reset(headers.get(f"{HEADER_PREFIX}reset-{kind}"))
+        if reset is None:
+            reset = DEFAULT_RESET if remaining <= 0 else DEFAULT_WINDOW
+        self.reset_at = now + reset
+        return True
+    
+    def headroom(self, now: float) -> float:
+        """剩余额度比例（未知或已过重置时间时视为 1）"""
+        if self.remaining is None or (self.reset_at and now >= self.reset_at):
+            return 1.0
+        if self.remaining <= 0:
+            return 0.0
+        if not self.limit:
+            return 1.0
+        return min(self.remaining / self.limit, 1.0)
+    
+    def get_stats(self, now: float) -> Dict[str, Any]:
+        """获取额度状态"""
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_in": round(max(self.reset_at - now, 0.0), 3) if self.reset_at else None,
+        }
+
+
+class UpstreamQuota:
+    """上游（API Key）的限流额度状态"""
+    
+    def __init__(self):
+        self.requests = _QuotaWindow()
+        self.tokens = _QuotaWindow()
+        self.updated_at: Optional[float] = None
+    
+    def update(self, headers: Mapping[str, str]):
+        """
+        根据响应头更新额度（没有限流响应头时不做任何修改）
+        
+        Args:
+            headers: 上游响应头（大小写不敏感的映射，如 httpx.Headers）
+        """
+        now = time.monotonic()
+        updated = self.requests.update(headers, "requests", now)
+        updated = self.tokens.update(headers, "tokens", now) or updated
+        if updated:
+            self.updated_at = now
+    
+    def headroom(self) -> float:
+        """剩余额度比例（请求数和 token 数中较小的一个）"""
+        now = time.monotonic()
+        return min(self.requests.headroom(now), self.tokens.headroom(now))
+    
+    @property
+    def exhausted(self) -> bool:
+        """额度是否已用完且尚未重置"""
+        return self.headroom() <= 0
+    
+    def get_stats(self) -> Optional[Dict[str, Any]]:
+        """获取额度状态（从未收到限流响应头时返回 None）"""
+        if self.updated_at is None:
+            return None
+        
+        now = time.monotonic()
+        return {
+            "headroom": round(self.headroom(), 4),
+            "requests": self.requests.get_stats(now),
+            "tokens": self.tokens.get_stats(now),
+        }
@@ -8,6 +8,8 @@ from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 
+from llm_one_api.core.tracing import span
+from llm_one_api.plugins.auth_cache import AuthCache
 from llm_one_api.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -23,6 +25,9 @@ class AuthMiddleware(BaseHTTPMiddleware):
         "/docs",
         "/redoc",
         "/openapi.json",
+        "/metrics",
+        "/v1/health/detailed",
+        "/admin/profile",  # 使用管理 Token 认证
     }
     
     async def dispatch(self, request: Request, call_next):
@@ -70,7 +75,8 @@ class AuthMiddleware(BaseHTTPMiddleware):
         # 调用插件进行认证
         try:
             plugin_manager = request.app.state.plugin_manager
-            auth_result = await plugin_manager.authenticate(api_key)
+            with span("auth"):
+                auth_result = await plugin_manager.authenticate(api_key)
             
             if not auth_result.success:
                 logger.warning(f"认证失败: {auth_result.message}")
@@ -88,6 +94,8 @@ class AuthMiddleware(BaseHTTPMiddleware):
             request.state.auth_result = {
                 "success": True,
                 "user_id": auth_result.user_id,
+                # API Key 的摘要，用于按 Key 统计（不保存明文）
+                "key_id": AuthCache.hash_key(api_key)[:16],
                 "metadata": auth_result.metadata,
             }
             
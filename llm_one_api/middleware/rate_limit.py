@@ -10,6 +10,7 @@ from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 
+from llm_one_api.core.metrics import record_rejection
 from llm_one_api.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -47,6 +48,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         # 检查是否超过限制
         if len(self.requests[user_id]) >= self.requests_per_minute:
             logger.warning(f"用户 {user_id} 超过请求频率限制")
+            record_rejection("requests_per_minute")
             return JSONResponse(
                 status_code=429,
                 content={
@@ -0,0 +1,61 @@
+"""
+链路追踪中间件
+
+为每个请求创建 trace，并在响应头中添加 Server-Timing
+
+使用纯 ASGI 中间件并放在最外层，使认证、限流等中间件的耗时也包含在 trace 中；
+根 span 在响应体最后一个数据块发送后结束，流式响应包含整个传输过程
+"""
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from llm_one_api.core.tracing import activate, tracer
+
+
+class TracingMiddleware:
+    """链路追踪中间件"""
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        trace = tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent=Headers(scope=scope).get("traceparent"),
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        )
+        if trace is None:
+            return await self.app(scope, receive, send)
+        
+        root = trace.root
+        
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                root.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    root.error = f"HTTP {status}"
+                
+                # 流式响应的响应头在转发开始前发送，只包含此前已结束的阶段
+                if tracer.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            
+            await send(message)
+            
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                root.finish()
+        
+        try:
+            with activate(trace):
+                await self.app(scope, receive, send_with_timing)
+        except BaseException as e:
+            root.record_error(e)
+            raise
+        finally:
+            tracer.finish_trace(trace)
@@ -67,7 +67,9 @@ class CompletionRequest(BaseModel):
 class EmbeddingRequest(BaseModel):
     """嵌入请求"""
     model: str = Field(..., description="模型名称")
-    input: Union[str, List[str]] = Field(..., description="输入文本")
+    input: Union[str, List[str], List[int], List[List[int]]] = Field(
+        ..., description="输入文本，或已经分词的 token 数组"
+    )
     user: Optional[str] = Field(None, description="用户标识")
     encoding_format: Optional[str] = Field("float", description="编码格式")
 
@@ -0,0 +1,186 @@
+"""
+认证结果缓存
+
+为认证插件提供通用的缓存层：
+- 成功 / 失败结果分别使用不同的 TTL（负缓存）
+- 有界 LRU，超出容量时淘汰最久未使用的条目
+- 缓存键只保存 API Key 的哈希值，不在内存中保留明文
+- 同一个 Key 的并发认证请求合并为一次后端调用
+
+插件可以通过 AuthResult.metadata 声明缓存策略：
+    - cacheable: False    不缓存该结果
+    - cache_ttl: 30       覆盖默认 TTL（秒），0 表示不缓存
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from llm_one_api.plugins.interfaces.auth import AuthResult
+from llm_one_api.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class AuthCache:
+    """认证结果缓存（LRU + TTL + 请求合并）"""
+    
+    def __init__(
+        self,
+        ttl: float = 60,
+        negative_ttl: float = 5,
+        max_entries: int = 10000,
+    ):
+        """
+        初始化认证缓存
+        
+        Args:
+            ttl: 认证成功结果的缓存时间（秒）
+            negative_ttl: 认证失败结果的缓存时间（秒），0 表示不缓存失败结果
+            max_entries: 最大缓存条目数
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        
+        # key_hash -> (过期时间, 认证结果)
+        self._entries: "OrderedDict[str, Tuple[float, AuthResult]]" = OrderedDict()
+        # key_hash -> 正在进行的认证调用
+        self._inflight: Dict[str, "asyncio.Future[AuthResult]"] = {}
+        
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+    
+    @staticmethod
+    def hash_key(api_key: str) -> str:
+        """计算 API Key 的哈希值（缓存中不保存明文）"""
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    
+    async def get_or_authenticate(
+        self,
+        api_key: str,
+        authenticate: Callable[[str], Awaitable[AuthResult]],
+    ) -> AuthResult:
+        """
+        从缓存获取认证结果，未命中时调用认证函数
+        
+        Args:
+            api_key: API 密钥
+            authenticate: 实际的认证函数
+        
+        Returns:
+            认证结果
+        """
+        key_hash = self.hash_key(api_key)
+        
+        while True:
+            cached = self._get(key_hash)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            
+            # 同一个 Key 已有认证在进行中，等待其结果
+            inflight = self._inflight.get(key_hash)
+            if inflight is None:
+                break
+            
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # 发起认证的请求被取消（如客户端断开）时 inflight 被取消，
+                # 重新查找，由其中一个等待者重新发起认证；否则是本请求自身被取消
+                if not inflight.cancelled():
+                    raise
+        
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key_hash] = future
+        
+        try:
+            result = await authenticate(api_key)
+        except asyncio.CancelledError:
+            # 取消只属于当前请求，不传给等待者
+            future.cancel()
+            raise
+        except BaseException as e:
+            # 异常视为临时错误，不缓存
+            if not future.done():
+                future.set_exception(e)
+                # 避免没有等待者时出现 "exception was never retrieved"
+                future.exception()
+            raise
+        else:
+            self._put(key_hash, result)
+            if not future.done():
+                future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key_hash) is future:
+                del self._inflight[key_hash]
+    
+    def _get(self, key_hash: str) -> Optional[AuthResult]:
+        """读取未过期的缓存条目"""
+        entry = self._entries.get(key_hash)
+        if entry is None:
+            return None
+        
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key_hash]
+            return None
+        
+        self._entries.move_to_end(key_hash)
+        return result
+    
+    def _put(self, key_hash: str, result: AuthResult):
+        """写入缓存条目"""
+        ttl = self._resolve_ttl(result)
+        if ttl <= 0:
+            return
+        
+        self._entries[key_hash] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key_hash)
+        
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _resolve_ttl(self, result: AuthResult) -> float:
+        """根据认证结果和插件声明确定 TTL"""
+        metadata = result.metadata or {}
+        
+        if metadata.get("cacheable") is False:
+            return 0
+        
+        if "cache_ttl" in metadata:
+            try:
+                return float(metadata["cache_ttl"])
+            except (TypeError, ValueError):
+                logger.warning(f"无效的 cache_ttl: {metadata['cache_ttl']}")
+        
+        return self.ttl if result.success else self.negative_ttl
+    
+    def invalidate(self, api_key: Optional[str] = None):
+        """
+        使缓存失效
+        
+        Args:
+            api_key: 指定的 API Key，为 None 时清空全部缓存
+        """
+        if api_key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(self.hash_key(api_key), None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,539 @@
+"""
+列式统计插件
+
+把请求统计按 (分钟, 模型, 用户, 上游) 汇总为计数器，按列保存在内存映射的 NumPy 数组中，
+适合 "最近 30 天每个用户每小时的 token 和成本" 这类大时间范围的账单查询
+
+- 模型、用户、上游名称做字典编码，数组中只保存整数 id（名称表保存在 meta.json）
+- 每列一个文件（<path>/<列名>.bin），通过 np.memmap 映射到内存，容量不足时按倍数扩展
+- 记录先放入写入队列（事件循环上不等待锁），由后台线程累加为当前分钟的计数，
+  分钟结束后追加到数组，每个 (分钟, 模型, 用户, 上游) 通常只占一行，行数与请求数无关
+- 只有写线程修改数组，追加行、扩容和落盘都在锁外进行，锁只保护内存计数和行数的交换
+- 用量查询（query_usage）的时间过滤、分组和求和都是向量化运算，不逐行循环
+- 进程异常退出时，最近 1～2 分钟尚未写入数组的计数会丢失
+
+需要安装 numpy: pip install "llm-one-api[columnar]"
+
+配置示例：
+    plugins:
+      stats: ["columnar"]
+    
+    stats:
+      columnar:
+        path: "data/columnar"
+        retention_days: 400
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llm_one_api.plugins.builtin.sqlite_stats import (
+    BUCKETS,
+    DIMENSIONS,
+    calculate_cost,
+    validate_usage_query,
+)
+from llm_one_api.plugins.interfaces.stats import StatsPlugin, RequestInfo
+from llm_one_api.utils.logger import setup_logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = setup_logger(__name__)
+
+# 列名 -> 数据类型（维度列保存字典编码后的 id）
+COLUMNS = {
+    "minute": "int64",
+    "model": "int32",
+    "user": "int32",
+    "upstream": "int32",
+    "requests": "int64",
+    "errors": "int64",
+    "prompt_tokens": "int64",
+    "completion_tokens": "int64",
+    "total_tokens": "int64",
+    "cost": "float64",
+    "total_duration": "float64",
+    "max_duration": "float64",
+    "total_ttft": "float64",
+    "ttft_count": "int64",
+}
+
+# 键列（分钟 + 维度）和计数器列
+KEY_COLUMNS = ("minute",) + DIMENSIONS
+COUNTERS = tuple(name for name in COLUMNS if name not in KEY_COLUMNS)
+
+META_FILE = "meta.json"
+
+# 写线程清理过期数据的间隔（秒）
+PRUNE_INTERVAL = 3600
+
+# 内存中尚未写入数组的计数：(分钟, 模型 id, 用户 id, 上游 id) -> 计数器（顺序同 COUNTERS）
+PendingKey = Tuple[int, int, int, int]
+
+# 取最大值（而不是求和）的计数器
+_MAX_COUNTER = COUNTERS.index("max_duration")
+
+
+def _merge(counters: Dict[PendingKey, List[float]], key: PendingKey, values: List[float]):
+    """把一组计数器累加到 counters[key]（max_duration 取最大值）"""
+    current = counters.get(key)
+    if current is None:
+        counters[key] = list(values)
+        return
+    
+    for i, value in enumerate(values):
+        if i == _MAX_COUNTER:
+            current[i] = max(current[i], value)
+        else:
+            current[i] += value
+
+
+class ColumnarStatsPlugin(StatsPlugin):
+    """列式统计插件（NumPy 内存映射数组）"""
+    
+    def __init__(self, config: Dict[str, Any]):
+        if np is None:
+            raise ImportError('列式统计插件需要 numpy，请安装: pip install "llm-one-api[columnar]"')
+        
+        super().__init__(config)
+        self.path = config.get("path", "data/columnar")
+        self.flush_interval = config.get("flush_interval", 5.0)  # 检查并写入已结束分钟的间隔（秒）
+        self.seal_delay = config.get("seal_delay", 10.0)  # 分钟结束后等待迟到记录的时间（秒）
+        self.retention_days = config.get("retention_days", 400)  # 数据保留天数
+        self.initial_capacity = config.get("initial_capacity", 65536)  # 数组初始行数
+        self.max_queue = config.get("max_queue", 100000)  # 等待累加的最大记录数
+        
+        # _lock 保护内存计数、名称表和数组的行数/映射（只做内存操作，不在持有时进行文件 I/O）；
+        # _query_lock 保证查询读取数组时不会同时进行过期数据清理（清理会移动数组中的行）
+        self._lock = threading.Lock()
+        self._query_lock = threading.Lock()
+        
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=self.max_queue)
+        self._columns: Dict[str, "np.memmap"] = {}
+        self._rows = 0
+        self._capacity = 0
+        self._names: Dict[str, List[str]] = {dimension: [] for dimension in DIMENSIONS}
+        self._ids: Dict[str, Dict[str, int]] = {dimension: {} for dimension in DIMENSIONS}
+        self._pending: Dict[PendingKey, List[float]] = {}
+        # 正在追加到数组的计数（查询时与 _pending 一起统计，追加完成后与行数一起更新）
+        self._sealing: Dict[PendingKey, List[float]] = {}
+        
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        self.total_records = 0
+        self.total_dropped = 0
+        self.write_errors = 0
+    
+    async def initialize(self):
+        """打开（或创建）数组文件并启动写线程"""
+        os.makedirs(self.path, exist_ok=True)
+        
+        meta_path = os.path.join(self.path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self._rows = meta.get("rows", 0)
+            for dimension in DIMENSIONS:
+                self._names[dimension] = list(meta.get(dimension, []))
+                self._ids[dimension] = {name: i for i, name in enumerate(self._names[dimension])}
+        
+        minute_file = os.path.join(self.path, "minute.bin")
+        existing = os.path.getsize(minute_file) // 8 if os.path.exists(minute_file) else 0
+        self._capacity = max(self._rows, existing, self.initial_capacity)
+        self._columns = self._map_columns(self._capacity)
+        
+        self._thread = threading.Thread(target=self._writer, name="columnar-stats-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"列式统计插件初始化: {self.path}, 已有 {self._rows} 行")
+    
+    def _map_columns(self, capacity: int) -> Dict[str, "np.memmap"]:
+        """按指定容量映射各列文件（文件不存在时创建，容量不足时扩展）"""
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            file = os.path.join(self.path, f"{name}.bin")
+            size = capacity * np.dtype(dtype).itemsize
+            with open(file, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            columns[name] = np.memmap(file, dtype=dtype, mode="r+", shape=(capacity,))
+        return columns
+    
+    def _encode(self, dimension: str, name: str) -> int:
+        """把名称编码为 id（新名称追加到名称表）"""
+        ids = self._ids[dimension]
+        value = ids.get(name)
+        if value is None:
+            value = ids[name] = len(self._names[dimension])
+            self._names[dimension].append(name)
+        return value
+    
+    async def record_request(self, request_info: RequestInfo):
+        """请求信息不单独记录（响应统计中已包含）"""
+        pass
+    
+    async def record_response(self, response_info: Dict[str, Any]):
+        """
+        记录响应信息（累加到当前分钟的计数）
+        
+        Args:
+            response_info: 响应信息字典
+        """
+        await self.record_batch([response_info])
+    
+    async def record_batch(self, records: List[Dict[str, Any]]):
+        """
+        批量记录响应信息（放入写入队列，不等待锁）
+        
+        Args:
+            records: 响应信息列表
+        """
+        for record in records:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.total_dropped += 1
+                if self.total_dropped == 1 or self.total_dropped % 1000 == 0:
+                    logger.warning(f"列式统计写入队列已满，已丢弃 {self.total_dropped} 条记录")
+    
+    def _drain(self):
+        """把写入队列中的记录累加到内存计数（写线程和查询线程调用）"""
+        entries = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            entries.append(self._to_counters(record))
+        
+        if not entries:
+            return
+        
+        with self._lock:
+            for (minute, model, user, upstream), values in entries:
+                key = (
+                    minute,
+                    self._encode("model", model),
+                    self._encode("user", user),
+                    self._encode("upstream", upstream),
+                )
+                _merge(self._pending, key, values)
+            self.total_records += len(entries)
+    
+    @staticmethod
+    def _to_counters(record: Dict[str, Any]) -> Tuple[Tuple[int, str, str, str], List[float]]:
+        """把一条统计转换为 (分钟, 模型, 用户, 上游) 和计数器（顺序同 COUNTERS）"""
+        token_usage = record.get("token_usage") or {}
+        timestamp = record.get("timestamp")
+        ts = datetime.fromisoformat(timestamp).timestamp() if timestamp else time.time()
+        duration = record.get("duration") or 0.0
+        ttft = record.get("ttft")
+        
+        key = (
+            int(ts // 60) * 60,
+            record.get("model") or "unknown",
+            record.get("user") or "",
+            record.get("upstream") or "",
+        )
+        return key, [
+            1,
+            1 if record.get("error") else 0,
+            token_usage.get("prompt_tokens", 0),
+            token_usage.get("completion_tokens", 0),
+            token_usage.get("total_tokens", 0),
+            calculate_cost(token_usage, record.get("metadata") or {}),
+            duration,
+            duration,
+            ttft if ttft is not None else 0.0,
+            1 if ttft is not None else 0,
+        ]
+    
+    def _writer(self):
+        """写线程：定期累加队列中的记录，把已结束的分钟写入数组，并清理过期数据"""
+        last_prune = 0.0
+        
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._drain()
+                
+                # 分钟开始时间早于该值的分钟已经结束超过 seal_delay 秒
+                self._seal(time.time() - 60 - self.seal_delay)
+                
+                if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                    self._prune()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"写入列式统计失败: {e}")
+    
+    def _seal(self, before: Optional[float]):
+        """
+        把内存中的计数追加到数组（在写线程中调用，写线程退出后由 cleanup 调用）
+        
+        新行写在 _rows 之后，查询看不到，因此扩容和写入都不需要持有 _lock；
+        写入完成后在锁内同时更新行数和清空 _sealing，查询不会重复或遗漏计数
+        
+        Args:
+            before: 只写入开始时间早于该值的分钟，None 表示全部写入
+        """
+        with self._lock:
+            keys = [key for key in self._pending if before is None or key[0] < before]
+            if not keys:
+                return
+            
+            self._sealing = {key: self._pending.pop(key) for key in keys}
+            start, end = self._rows, self._rows + len(keys)
+            columns, capacity = self._columns, self._capacity
+        
+        try:
+            if end > capacity:
+                capacity = max(capacity * 2, end)
+                columns = self._map_columns(capacity)
+            
+            key_array = np.array(list(self._sealing), dtype=np.int64)
+            value_array = np.array(list(self._sealing.values()), dtype=np.float64)
+            for i, name in enumerate(KEY_COLUMNS):
+                columns[name][start:end] = key_array[:, i]
+            for i, name in enumerate(COUNTERS):
+                columns[name][start:end] = value_array[:, i]
+        except Exception:
+            # 写入失败：计数放回内存，下次重试
+            with self._lock:
+                for key, values in self._sealing.items():
+                    _merge(self._pending, key, values)
+                self._sealing = {}
+            raise
+        
+        # 整体替换映射：正在进行的查询继续使用旧的映射
+        with self._lock:
+            self._columns, self._capacity = columns, capacity
+            self._rows = end
+            self._sealing = {}
+            meta = self._meta()
+        
+        self._flush(columns, meta)
+    
+    def _prune(self):
+        """
+        删除超过保留天数的行（把保留的行移到数组前部，只在写线程中调用）
+        
+        移动行时只阻塞查询（_query_lock），不阻塞记录；落盘在锁外进行
+        """
+        cutoff = time.time() - self.retention_days * 86400
+        
+        with self._query_lock:
+            with self._lock:
+                rows, columns = self._rows, self._columns
+            
+            keep = columns["minute"][:rows] >= cutoff
+            kept = int(np.count_nonzero(keep))
+            if kept == rows:
+                return
+            
+            for column in columns.values():
+                column[:kept] = column[:rows][keep]
+            
+            with self._lock:
+                self._rows = kept
+                meta = self._meta()
+        
+        self._flush(columns, meta)
+        logger.info(f"列式统计清理了 {rows - kept} 行过期数据")
+    
+    def _meta(self) -> Dict[str, Any]:
+        """当前的行数和名称表（调用方持有 _lock）"""
+        meta: Dict[str, Any] = {"rows": self._rows}
+        for dimension in DIMENSIONS:
+            meta[dimension] = list(self._names[dimension])
+        return meta
+    
+    def _flush(self, columns: Dict[str, "np.memmap"], meta: Dict[str, Any]):
+        """先把数组写回磁盘，再原子替换 meta.json（meta 中的行数不会超过已落盘的数据）"""
+        for column in columns.values():
+            column.flush()
+        
+        meta_path = os.path.join(self.path, META_FILE)
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+    
+    async def query_usage(
+        self,
+        start: float,
+        end: float,
+        group_by: Sequence[str] = ("model",),
+        bucket: Optional[str] = None,
+        user: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        查询时间范围内的用量（包括尚未写入数组的当前分钟）
+        
+        Args:
+            start: 开始时间（Unix 时间戳，包含）
+            end: 结束时间（Unix 时间戳，不包含）
+            group_by: 分组维度（model / user / upstream）
+            bucket: 时间粒度（minute / hour / day），None 表示整个范围汇总为一组
+            user: 只查询指定用户，None 表示所有用户
+        
+        Returns:
+            每组的请求数、错误数、token 数、成本和平均/最大耗时
+        """
+        validate_usage_query(group_by, bucket)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._query_usage, start, end, list(group_by), bucket, user)
+    
+    def _query_usage(
+        self,
+        start: float,
+        end: float,
+        group_by: List[str],
+        bucket: Optional[str],
+        user: Optional[str],
+    ) -> List[Dict[str, Any]]:
+        """在线程池中执行用量查询"""
+        start_minute = int(start // 60) * 60
+        
+        # 包括刚刚记录、写线程还没有累加的记录
+        self._drain()
+        
+        with self._query_lock:
+            with self._lock:
+                rows, columns = self._rows, self._columns
+                names = {dimension: list(self._names[dimension]) for dimension in DIMENSIONS}
+                pending_keys = list(self._pending) + list(self._sealing)
+                pending_values = [list(values) for values in self._pending.values()]
+                pending_values += [list(values) for values in self._sealing.values()]
+                user_id = self._ids["user"].get(user) if user is not None else None
+            
+            if user is not None and user_id is None:
+                return []
+            
+            minute = columns["minute"][:rows]
+            mask = (minute >= start_minute) & (minute < end)
+            if user_id is not None:
+                mask &= columns["user"][:rows] == user_id
+            selected = np.flatnonzero(mask)
+            data = {name: np.asarray(columns[name][selected]) for name in COLUMNS}
+        
+        if pending_keys:
+            key_array = np.array(pending_keys, dtype=np.int64)
+            value_array = np.array(pending_values, dtype=np.float64)
+            in_range = (key_array[:, 0] >= start_minute) & (key_array[:, 0] < end)
+            if user_id is not None:
+                in_range &= key_array[:, KEY_COLUMNS.index("user")] == user_id
+            for i, name in enumerate(KEY_COLUMNS):
+                data[name] = np.concatenate([data[name], key_array[in_range, i]])
+            for i, name in enumerate(COUNTERS):
+                data[name] = np.concatenate([data[name], value_array[in_range, i]])
+        
+        if len(data["minute"]) == 0:
+            return []
+        
+        # 分组：各分组键按混合进制合成一个 int64 键后取唯一值，inverse 是每行所属的组号
+        keys = (["bucket"] if bucket else []) + group_by
+        codes, radices = [], []
+        if bucket is not None:
+            bucket_index = data["minute"].astype(np.int64) // BUCKETS[bucket]
+            first_bucket = int(bucket_index.min())
+            codes.append(bucket_index - first_bucket)
+            radices.append(int(bucket_index.max()) - first_bucket + 1)
+        for dimension in group_by:
+            codes.append(data[dimension].astype(np.int64))
+            radices.append(len(names[dimension]))
+        
+        composite = np.zeros(len(data["minute"]), dtype=np.int64)
+        for code, radix in zip(codes, radices):
+            composite = composite * radix + code
+        unique, inverse = np.unique(composite, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        
+        # 把合成键拆回各分组键
+        groups = np.empty((len(unique), len(keys)), dtype=np.int64)
+        for j in range(len(keys) - 1, -1, -1):
+            unique, groups[:, j] = np.divmod(unique, radices[j])
+        if bucket is not None:
+            groups[:, 0] = (groups[:, 0] + first_bucket) * BUCKETS[bucket]
+        
+        count = len(groups)
+        sums = {
+            name: np.bincount(inverse, weights=data[name], minlength=count)
+            for name in COUNTERS
+            if name != "max_duration"
+        }
+        max_duration = np.zeros(count)
+        np.maximum.at(max_duration, inverse, data["max_duration"])
+        
+        # 排序：按时间段，再按总 token 数从大到小
+        if bucket is not None:
+            order = np.lexsort((-sums["total_tokens"], groups[:, 0]))
+        else:
+            order = np.argsort(-sums["total_tokens"], kind="stable")
+        
+        results = []
+        for i in order:
+            requests = int(sums["requests"][i])
+            if not requests:
+                continue
+            
+            item: Dict[str, Any] = {}
+            for j, key in enumerate(keys):
+                value = int(groups[i, j])
+                item[key] = value if key == "bucket" else names[key][value]
+            
+            ttft_count = int(sums["ttft_count"][i])
+            item.update({
+                "requests": requests,
+                "errors": int(sums["errors"][i]),
+                "prompt_tokens": int(sums["prompt_tokens"][i]),
+                "completion_tokens": int(sums["completion_tokens"][i]),
+                "total_tokens": int(sums["total_tokens"][i]),
+                "cost": round(float(sums["cost"][i]), 6),
+                "avg_duration": round(float(sums["total_duration"][i]) / requests, 4),
+                "max_duration": round(float(max_duration[i]), 4),
+                "avg_ttft": round(float(sums["total_ttft"][i]) / ttft_count, 4) if ttft_count else None,
+            })
+            results.append(item)
+        
+        return results
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储状态"""
+        with self._lock:
+            return {
+                "path": self.path,
+                "rows": self._rows,
+                "capacity": self._capacity,
+                "pending": len(self._pending),
+                "queued": self._queue.qsize(),
+                "total_dropped": self.total_dropped,
+                "models": len(self._names["model"]),
+                "users": len(self._names["user"]),
+                "upstreams": len(self._names["upstream"]),
+                "total_records": self.total_records,
+                "write_errors": self.write_errors,
+            }
+    
+    async def cleanup(self):
+        """停止写线程，把内存中的计数全部写入数组"""
+        if self._thread is None:
+            return
+        
+        self._stop.set()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._thread.join, 30)
+        await loop.run_in_executor(None, self._drain)
+        await loop.run_in_executor(None, self._seal, None)
+        self._thread = None
+        
+        logger.info(f"列式统计插件已关闭，共 {self._rows} 行")
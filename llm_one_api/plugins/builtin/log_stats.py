@@ -73,6 +73,12 @@ class LogStatsPlugin(StatsPlugin):
                 }
             }
             
+            # 流式响应计时
+            if response_info.get("ttft") is not None:
+                log_data["ttft"] = response_info["ttft"]
+                log_data["tokens_per_second"] = response_info.get("tokens_per_second")
+                log_data["inter_token_latency"] = response_info.get("inter_token_latency")
+            
             # 添加模型限制信息
             if metadata:
                 log_data["metadata"] = metadata
@@ -96,6 +102,12 @@ class LogStatsPlugin(StatsPlugin):
                 f"流式={response_info.get('stream')}"
             )
             
+            # 流式响应计时
+            if response_info.get("ttft") is not None:
+                msg += f" | 首Token={response_info['ttft']:.3f}s"
+            if response_info.get("tokens_per_second") is not None:
+                msg += f" | 速度={response_info['tokens_per_second']:.1f} token/s"
+            
             logger.info(msg)
     
     async def initialize(self):
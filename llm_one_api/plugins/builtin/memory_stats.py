@@ -2,17 +2,123 @@
 内存统计插件
 
 将统计数据保存在内存中，适合开发和测试
+
+内存占用固定：
+- 最近的请求和响应保存在固定大小的环形缓冲区中
+- 耗时、首 token 延迟按模型和上游记录在 DDSketch 中，按时间分片保存最近 1 小时，
+  查询时合并成 1m/5m/1h 窗口，报告 p50/p95/p99
 """
 
-from typing import Dict, Any, List
-from collections import defaultdict
+import math
+import time
+from typing import Dict, Any, Deque, Optional
+from collections import defaultdict, deque
 from datetime import datetime
 
 from llm_one_api.plugins.interfaces.stats import StatsPlugin, RequestInfo, ResponseInfo
 from llm_one_api.utils.logger import setup_logger
+from llm_one_api.utils.sketch import DDSketch
 
 logger = setup_logger(__name__)
 
+# 滚动窗口（名称 -> 秒）
+WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+
+
+class _Slot:
+    """一个时间分片内的统计"""
+    
+    __slots__ = ("start", "requests", "errors", "prompt_tokens", "completion_tokens", "duration", "ttft")
+    
+    def __init__(self, start: float, relative_accuracy: float):
+        self.start = start
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.duration = DDSketch(relative_accuracy)
+        self.ttft = DDSketch(relative_accuracy)
+
+
+class LatencyStats:
+    """
+    一个模型或上游的延迟统计
+    
+    按 slot_seconds 分片保存最近 1 小时的计数和 sketch，查询时合并成各个窗口；
+    另外保存全部时间的 sketch
+    """
+    
+    def __init__(self, slot_seconds: float = 10, relative_accuracy: float = 0.01):
+        self.slot_seconds = slot_seconds
+        self.relative_accuracy = relative_accuracy
+        self._slots: Deque[_Slot] = deque(maxlen=math.ceil(max(WINDOWS.values()) / slot_seconds) + 1)
+        
+        # 全部时间
+        self.duration = DDSketch(relative_accuracy)
+        self.ttft = DDSketch(relative_accuracy)
+    
+    def add(self, response_info: Dict[str, Any], now: float):
+        """记录一条响应"""
+        start = now - now % self.slot_seconds
+        if not self._slots or self._slots[-1].start != start:
+            self._slots.append(_Slot(start, self.relative_accuracy))
+        slot = self._slots[-1]
+        
+        token_usage = response_info.get("token_usage") or {}
+        slot.requests += 1
+        slot.prompt_tokens += token_usage.get("prompt_tokens", 0)
+        slot.completion_tokens += token_usage.get("completion_tokens", 0)
+        
+        if response_info.get("error"):
+            slot.errors += 1
+            return
+        
+        duration = response_info.get("duration")
+        if duration is not None:
+            slot.duration.add(duration)
+            self.duration.add(duration)
+        
+        ttft = response_info.get("ttft")
+        if ttft is not None:
+            slot.ttft.add(ttft)
+            self.ttft.add(ttft)
+    
+    def window(self, seconds: float, now: float) -> Dict[str, Any]:
+        """合并最近 seconds 秒内（与窗口有重叠）的分片"""
+        duration = DDSketch(self.relative_accuracy)
+        ttft = DDSketch(self.relative_accuracy)
+        requests = errors = prompt_tokens = completion_tokens = 0
+        
+        cutoff = now - seconds
+        for slot in reversed(self._slots):
+            if slot.start + self.slot_seconds <= cutoff:
+                break
+            requests += slot.requests
+            errors += slot.errors
+            prompt_tokens += slot.prompt_tokens
+            completion_tokens += slot.completion_tokens
+            duration.merge(slot.duration)
+            ttft.merge(slot.ttft)
+        
+        return {
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "requests_per_second": round(requests / seconds, 4),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "duration": duration.quantiles(),
+            "ttft": ttft.quantiles(),
+        }
+    
+    def summary(self, now: float) -> Dict[str, Any]:
+        """全部时间的分位数和各窗口统计"""
+        return {
+            "duration": self.duration.quantiles(),
+            "ttft": self.ttft.quantiles(),
+            "windows": {name: self.window(seconds, now) for name, seconds in WINDOWS.items()},
+        }
+
 
 class MemoryStatsPlugin(StatsPlugin):
     """内存统计插件"""
@@ -20,8 +126,13 @@ class MemoryStatsPlugin(StatsPlugin):
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.max_records = config.get("max_records", 1000)  # 最多保存的记录数
-        self.requests: List[Dict] = []
-        self.responses: List[Dict] = []
+        self.slot_seconds = config.get("slot_seconds", 10)  # 滚动窗口的分片长度（秒）
+        self.relative_accuracy = config.get("relative_accuracy", 0.01)  # 分位数的相对误差
+        
+        self.requests: Deque[Dict] = deque(maxlen=self.max_records)
+        self.responses: Deque[Dict] = deque(maxlen=self.max_records)
+        self.total_responses = 0
+        
         self.stats_by_model = defaultdict(lambda: {
             "total_requests": 0,
             "prompt_tokens": 0,
@@ -29,7 +140,14 @@ class MemoryStatsPlugin(StatsPlugin):
             "total_tokens": 0,
             "total_duration": 0.0,
             "total_cost": 0.0,
+            "total_errors": 0,
+            # 流式响应输出速度
+            "rated_streams": 0,
+            "total_tokens_per_second": 0.0,
+            "max_inter_token_latency": 0.0,
         })
+        self.latency_by_model: Dict[str, LatencyStats] = {}
+        self.latency_by_upstream: Dict[str, LatencyStats] = {}
     
     async def record_request(self, request_info: RequestInfo):
         """
@@ -47,11 +165,8 @@ class MemoryStatsPlugin(StatsPlugin):
             "timestamp": request_info.timestamp.isoformat(),
         }
         
+        # 环形缓冲区，超出 max_records 时自动丢弃最旧的记录
         self.requests.append(record)
-        
-        # 限制记录数量
-        if len(self.requests) > self.max_records:
-            self.requests.pop(0)
     
     async def record_response(self, response_info: Dict[str, Any]):
         """
@@ -61,16 +176,32 @@ class MemoryStatsPlugin(StatsPlugin):
             response_info: 响应信息字典
         """
         model = response_info.get("model", "unknown")
+        upstream = response_info.get("upstream")
         token_usage = response_info.get("token_usage", {})
         duration = response_info.get("duration", 0)
         metadata = response_info.get("metadata", {})  # 直接获取传递的 metadata
         
-        # 记录详细响应
-        self.responses.append(response_info)
+        # 记录响应摘要（不保存 metadata 等大字段）
+        self.total_responses += 1
+        self.responses.append({
+            "model": model,
+            "upstream": upstream,
+            "endpoint": response_info.get("endpoint"),
+            "stream": response_info.get("stream", False),
+            "user": response_info.get("user"),
+            "timestamp": response_info.get("timestamp"),
+            "duration": duration,
+            "token_usage": token_usage,
+            "ttft": response_info.get("ttft"),
+            "tokens_per_second": response_info.get("tokens_per_second"),
+            "error": response_info.get("error"),
+        })
         
-        # 限制记录数量
-        if len(self.responses) > self.max_records:
-            self.responses.pop(0)
+        # 按模型和上游记录延迟分布
+        now = time.monotonic()
+        self._latency(self.latency_by_model, model).add(response_info, now)
+        if upstream:
+            self._latency(self.latency_by_upstream, upstream).add(response_info, now)
         
         # 更新模型统计
         stats = self.stats_by_model[model]
@@ -79,6 +210,16 @@ class MemoryStatsPlugin(StatsPlugin):
         stats["prompt_tokens"] = stats.get("prompt_tokens", 0) + token_usage.get("prompt_tokens", 0)
         stats["completion_tokens"] = stats.get("completion_tokens", 0) + token_usage.get("completion_tokens", 0)
         stats["total_duration"] += duration
+        if response_info.get("error"):
+            stats["total_errors"] += 1
+        
+        # 流式响应的输出速度
+        if response_info.get("tokens_per_second") is not None:
+            stats["rated_streams"] += 1
+            stats["total_tokens_per_second"] += response_info["tokens_per_second"]
+        inter_token_latency = response_info.get("inter_token_latency")
+        if inter_token_latency:
+            stats["max_inter_token_latency"] = max(stats["max_inter_token_latency"], inter_token_latency["max"])
         
         # 计算并累计成本
         cost = self._calculate_cost(token_usage, metadata)
@@ -91,23 +232,47 @@ class MemoryStatsPlugin(StatsPlugin):
             if model_info:
                 stats["model_info"] = model_info
     
+    def _latency(self, registry: Dict[str, LatencyStats], name: str) -> LatencyStats:
+        """获取（或创建）模型或上游的延迟统计"""
+        latency = registry.get(name)
+        if latency is None:
+            latency = registry[name] = LatencyStats(self.slot_seconds, self.relative_accuracy)
+        return latency
+    
     def get_stats(self) -> Dict[str, Any]:
         """
         获取统计数据
         
         Returns:
-            统计数据字典
+            统计数据字典（包含按模型和上游的 p50/p95/p99 及 1m/5m/1h 窗口统计）
         """
+        now = time.monotonic()
+        
+        by_model = {}
+        for model, stats in self.stats_by_model.items():
+            summary = dict(stats)
+            latency = self.latency_by_model.get(model)
+            summary["avg_ttft"] = round(latency.ttft.avg, 4) if latency and latency.ttft.count else None
+            summary["avg_tokens_per_second"] = (
+                round(stats["total_tokens_per_second"] / stats["rated_streams"], 2) if stats["rated_streams"] else None
+            )
+            if latency:
+                summary.update(latency.summary(now))
+            by_model[model] = summary
+        
         return {
-            "total_requests": len(self.responses),
-            "by_model": dict(self.stats_by_model),
-            "recent_requests": self.requests[-10:],  # 最近10条请求
-            "recent_responses": self.responses[-10:],  # 最近10条响应
+            "total_requests": self.total_responses,
+            "by_model": by_model,
+            "by_upstream": {
+                upstream: latency.summary(now) for upstream, latency in self.latency_by_upstream.items()
+            },
+            "recent_requests": list(self.requests)[-10:],  # 最近10条请求
+            "recent_responses": list(self.responses)[-10:],  # 最近10条响应
         }
     
     async def initialize(self):
         """初始化插件"""
-        logger.info(f"内存统计插件初始化，最大记录数: {self.max_records}")
+        logger.info(f"内存统计插件初始化，最大记录数: {self.max_records}, 窗口分片: {self.slot_seconds}s")
     
     def _calculate_cost(self, token_usage: Dict[str, int], metadata: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -169,7 +334,7 @@ class MemoryStatsPlugin(StatsPlugin):
         logger.info("=" * 60)
         logger.info("📊 内存统计插件 - 最终统计数据")
         logger.info("=" * 60)
-        logger.info(f"总请求数: {len(self.responses)}")
+        logger.info(f"总请求数: {self.total_responses}")
         logger.info("")
         
         total_cost = 0.0
@@ -188,6 +353,22 @@ class MemoryStatsPlugin(StatsPlugin):
                 logger.info(f"  ├─ 平均 Token/请求: {avg_tokens:.1f}")
                 logger.info(f"  ├─ 平均耗时/请求: {avg_duration:.2f}s")
             
+            # 显示延迟分位数
+            latency = self.latency_by_model.get(model)
+            if latency and latency.duration.count:
+                q = latency.duration.quantiles()
+                logger.info(f"  ├─ 耗时 P50/P95/P99: {q['p50']:.2f}s / {q['p95']:.2f}s / {q['p99']:.2f}s")
+            
+            # 显示流式响应计时
+            if latency and latency.ttft.count:
+                q = latency.ttft.quantiles()
+                logger.info(f"  ├─ 平均首 Token 延迟: {latency.ttft.avg:.3f}s")
+                logger.info(f"  ├─ 首 Token P50/P95/P99: {q['p50']:.3f}s / {q['p95']:.3f}s / {q['p99']:.3f}s")
+            if stats['rated_streams'] > 0:
+                avg_tps = stats['total_tokens_per_second'] / stats['rated_streams']
+                logger.info(f"  ├─ 平均输出速度: {avg_tps:.1f} token/s")
+                logger.info(f"  ├─ 最大 Token 间隔: {stats['max_inter_token_latency']:.3f}s")
+            
             # 显示成本信息
             model_cost = stats.get('total_cost', 0)
             if model_cost > 0:
@@ -0,0 +1,405 @@
+"""
+SQLite 统计插件
+
+把请求统计持久化到本地 SQLite 文件，服务重启后数据不丢失，不需要单独部署数据库
+
+- 统计记录放入内存队列后立即返回，由后台写线程按批次写入（一个批次一个事务）
+- 数据库使用 WAL 模式，查询与写入互不阻塞
+- 写入原始记录的同时，按 (分钟, 模型, 用户, 上游) 预先汇总到 usage_minute 表；
+  用量查询（query_usage）只读取汇总表，查询速度与请求数无关
+- 原始记录保留 raw_retention_days 天，汇总数据保留 rollup_retention_days 天
+
+配置示例：
+    plugins:
+      stats: ["sqlite"]
+    
+    stats:
+      sqlite:
+        path: "data/stats.db"
+        batch_size: 500
+        flush_interval: 1.0
+"""
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llm_one_api.plugins.interfaces.stats import StatsPlugin, RequestInfo
+from llm_one_api.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 可以分组的维度
+DIMENSIONS = ("model", "user", "upstream")
+
+# 时间粒度（名称 -> 秒）
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    ts REAL NOT NULL,
+    model TEXT NOT NULL,
+    user TEXT NOT NULL,
+    upstream TEXT NOT NULL,
+    endpoint TEXT,
+    stream INTEGER NOT NULL,
+    duration REAL,
+    ttft REAL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_requests_ts ON requests (ts);
+
+CREATE TABLE IF NOT EXISTS usage_minute (
+    minute INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    user TEXT NOT NULL,
+    upstream TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    total_duration REAL NOT NULL,
+    max_duration REAL NOT NULL,
+    total_ttft REAL NOT NULL,
+    ttft_count INTEGER NOT NULL,
+    PRIMARY KEY (minute, model, user, upstream)
+);
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO usage_minute (
+    minute, model, user, upstream, requests, errors,
+    prompt_tokens, completion_tokens, total_tokens, cost,
+    total_duration, max_duration, total_ttft, ttft_count
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (minute, model, user, upstream) DO UPDATE SET
+    requests = requests + excluded.requests,
+    errors = errors + excluded.errors,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    total_tokens = total_tokens + excluded.total_tokens,
+    cost = cost + excluded.cost,
+    total_duration = total_duration + excluded.total_duration,
+    max_duration = MAX(max_duration, excluded.max_duration),
+    total_ttft = total_ttft + excluded.total_ttft,
+    ttft_count = ttft_count + excluded.ttft_count
+"""
+
+INSERT_RAW = "INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+# 写线程清理过期数据的间隔（秒）
+PRUNE_INTERVAL = 3600
+
+# 原始记录的字段顺序（与 requests 表一致）
+Row = Tuple[
+    float, str, str, str, Optional[str], int,
+    Optional[float], Optional[float], int, int, int, float, Optional[str],
+]
+
+
+def calculate_cost(token_usage: Dict[str, int], metadata: Dict[str, Any]) -> float:
+    """按模型元数据中的价格计算请求成本（USD），未配置价格时为 0"""
+    prompt_price = metadata.get("price_per_1k_prompt_tokens")
+    completion_price = metadata.get("price_per_1k_completion_tokens")
+    
+    if prompt_price is None or completion_price is None:
+        return 0.0
+    
+    return (
+        token_usage.get("prompt_tokens", 0) / 1000 * prompt_price
+        + token_usage.get("completion_tokens", 0) / 1000 * completion_price
+    )
+
+
+def validate_usage_query(group_by: Sequence[str], bucket: Optional[str]):
+    """检查用量查询的分组维度和时间粒度，不支持时抛出 ValueError"""
+    for dimension in group_by:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"不支持的分组维度: {dimension}，可选值: {', '.join(DIMENSIONS)}")
+    if bucket is not None and bucket not in BUCKETS:
+        raise ValueError(f"不支持的时间粒度: {bucket}，可选值: {', '.join(BUCKETS)}")
+
+
+class SQLiteStatsPlugin(StatsPlugin):
+    """SQLite 统计插件"""
+    
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.path = config.get("path", "data/stats.db")
+        self.batch_size = config.get("batch_size", 500)  # 每个事务最多写入的记录数
+        self.flush_interval = config.get("flush_interval", 1.0)  # 不足一批时的最长等待时间（秒）
+        self.max_queue = config.get("max_queue", 100000)  # 等待写入的最大记录数
+        # 原始记录保留天数（0 表示不保存原始记录）
+        self.raw_retention_days = config.get("raw_retention_days", 7)
+        self.rollup_retention_days = config.get("rollup_retention_days", 400)  # 汇总数据保留天数
+        
+        self._queue: "queue.Queue[Optional[Row]]" = queue.Queue(maxsize=self.max_queue)
+        self._thread: Optional[threading.Thread] = None
+        
+        self.total_written = 0
+        self.total_dropped = 0
+        self.write_errors = 0
+    
+    async def initialize(self):
+        """创建数据库并启动写线程"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        
+        self._thread = threading.Thread(target=self._writer, name="sqlite-stats-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"SQLite 统计插件初始化: {self.path}, 批大小={self.batch_size}")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接（每个线程使用自己的连接）"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    async def record_request(self, request_info: RequestInfo):
+        """请求信息不单独记录（响应统计中已包含）"""
+        pass
+    
+    async def record_response(self, response_info: Dict[str, Any]):
+        """
+        记录响应信息（放入写入队列）
+        
+        Args:
+            response_info: 响应信息字典
+        """
+        await self.record_batch([response_info])
+    
+    async def record_batch(self, records: List[Dict[str, Any]]):
+        """
+        批量记录响应信息（放入写入队列，不等待写入）
+        
+        Args:
+            records: 响应信息列表
+        """
+        for record in records:
+            try:
+                self._queue.put_nowait(self._to_row(record))
+            except queue.Full:
+                self.total_dropped += 1
+                if self.total_dropped == 1 or self.total_dropped % 1000 == 0:
+                    logger.warning(f"SQLite 统计写入队列已满，已丢弃 {self.total_dropped} 条记录")
+    
+    def _to_row(self, record: Dict[str, Any]) -> Row:
+        """把统计数据转换为 requests 表的一行"""
+        token_usage = record.get("token_usage") or {}
+        metadata = record.get("metadata") or {}
+        timestamp = record.get("timestamp")
+        return (
+            datetime.fromisoformat(timestamp).timestamp() if timestamp else time.time(),
+            record.get("model") or "unknown",
+            record.get("user") or "",
+            record.get("upstream") or "",
+            record.get("endpoint"),
+            1 if record.get("stream") else 0,
+            record.get("duration"),
+            record.get("ttft"),
+            token_usage.get("prompt_tokens", 0),
+            token_usage.get("completion_tokens", 0),
+            token_usage.get("total_tokens", 0),
+            calculate_cost(token_usage, metadata),
+            record.get("error"),
+        )
+    
+    def _writer(self):
+        """写线程：按批次写入，收到 None 时写完剩余记录后退出"""
+        conn = self._connect()
+        last_prune = 0.0
+        closing = False
+        
+        try:
+            while not closing:
+                rows: List[Row] = []
+                deadline = time.monotonic() + self.flush_interval
+                
+                while len(rows) < self.batch_size:
+                    try:
+                        row = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                    except queue.Empty:
+                        break
+                    if row is None:
+                        closing = True
+                        break
+                    rows.append(row)
+                
+                if rows:
+                    self._write(conn, rows)
+                
+                if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                    self._prune(conn)
+                    last_prune = time.monotonic()
+        finally:
+            conn.close()
+    
+    def _write(self, conn: sqlite3.Connection, rows: List[Row]):
+        """在一个事务中写入原始记录并更新分钟汇总"""
+        rollups: Dict[Tuple[int, str, str, str], List[Any]] = {}
+        for ts, model, user, upstream, _, _, duration, ttft, prompt, completion, total, cost, error in rows:
+            key = (int(ts // 60) * 60, model, user, upstream)
+            agg = rollups.get(key)
+            if agg is None:
+                agg = rollups[key] = [0, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0]
+            agg[0] += 1
+            agg[1] += 1 if error else 0
+            agg[2] += prompt
+            agg[3] += completion
+            agg[4] += total
+            agg[5] += cost
+            agg[6] += duration or 0.0
+            agg[7] = max(agg[7], duration or 0.0)
+            if ttft is not None:
+                agg[8] += ttft
+                agg[9] += 1
+        
+        try:
+            with conn:
+                if self.raw_retention_days > 0:
+                    conn.executemany(INSERT_RAW, rows)
+                conn.executemany(UPSERT_ROLLUP, [key + tuple(agg) for key, agg in rollups.items()])
+            self.total_written += len(rows)
+        except sqlite3.Error as e:
+            self.write_errors += 1
+            logger.error(f"写入 SQLite 统计失败，丢弃 {len(rows)} 条记录: {e}")
+    
+    def _prune(self, conn: sqlite3.Connection):
+        """清理过期的原始记录和汇总数据"""
+        now = time.time()
+        try:
+            with conn:
+                conn.execute("DELETE FROM requests WHERE ts < ?", (now - self.raw_retention_days * 86400,))
+                conn.execute("DELETE FROM usage_minute WHERE minute < ?", (now - self.rollup_retention_days * 86400,))
+        except sqlite3.Error as e:
+            logger.error(f"清理过期 SQLite 统计失败: {e}")
+    
+    async def query_usage(
+        self,
+        start: float,
+        end: float,
+        group_by: Sequence[str] = ("model",),
+        bucket: Optional[str] = None,
+        user: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        查询时间范围内的用量（从分钟汇总表读取）
+        
+        Args:
+            start: 开始时间（Unix 时间戳，包含）
+            end: 结束时间（Unix 时间戳，不包含）
+            group_by: 分组维度（model / user / upstream）
+            bucket: 时间粒度（minute / hour / day），None 表示整个范围汇总为一组
+            user: 只查询指定用户，None 表示所有用户
+        
+        Returns:
+            每组的请求数、错误数、token 数、成本和平均/最大耗时
+        """
+        validate_usage_query(group_by, bucket)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._query_usage, start, end, list(group_by), bucket, user)
+    
+    def _query_usage(
+        self,
+        start: float,
+        end: float,
+        group_by: List[str],
+        bucket: Optional[str],
+        user: Optional[str],
+    ) -> List[Dict[str, Any]]:
+        """在线程池中执行用量查询"""
+        keys = (["bucket"] if bucket else []) + group_by
+        columns = list(group_by)
+        if bucket is not None:
+            # minute 是整数秒，整数除法即按粒度取整
+            columns.insert(0, f"(minute / {BUCKETS[bucket]}) * {BUCKETS[bucket]} AS bucket")
+        
+        params: List[Any] = [int(start // 60) * 60, end]
+        user_clause = ""
+        if user is not None:
+            user_clause = "AND user = ?"
+            params.append(user)
+        
+        group_clause = f"GROUP BY {', '.join(keys)}" if keys else ""
+        sql = f"""
+            SELECT {''.join(column + ', ' for column in columns)}
+                SUM(requests), SUM(errors),
+                SUM(prompt_tokens), SUM(completion_tokens), SUM(total_tokens), SUM(cost),
+                SUM(total_duration), MAX(max_duration), SUM(total_ttft), SUM(ttft_count)
+            FROM usage_minute
+            WHERE minute >= ? AND minute < ? {user_clause}
+            {group_clause}
+            ORDER BY {"bucket, " if bucket else ""}SUM(total_tokens) DESC
+        """
+        
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        
+        results = []
+        for row in rows:
+            requests, errors, prompt, completion, total, cost, duration, max_duration, ttft, ttft_count = row[len(keys):]
+            if not requests:
+                continue
+            item = dict(zip(keys, row[:len(keys)]))
+            item.update({
+                "requests": requests,
+                "errors": errors,
+                "prompt_tokens": prompt,
+                "completion_tokens": completion,
+                "total_tokens": total,
+                "cost": round(cost, 6),
+                "avg_duration": round(duration / requests, 4),
+                "max_duration": round(max_duration, 4),
+                "avg_ttft": round(ttft / ttft_count, 4) if ttft_count else None,
+            })
+            results.append(item)
+        
+        return results
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入状态"""
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "total_written": self.total_written,
+            "total_dropped": self.total_dropped,
+            "write_errors": self.write_errors,
+        }
+    
+    async def cleanup(self):
+        """写完队列中剩余的记录后关闭写线程"""
+        if self._thread is None:
+            return
+        
+        # 队列满时也要能放入结束标记
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._queue.put, None)
+        await loop.run_in_executor(None, self._thread.join, 30)
+        
+        if self._thread.is_alive():
+            logger.error(f"SQLite 统计写线程未能在 30 秒内退出，剩余 {self._queue.qsize()} 条记录未写入")
+        else:
+            logger.info(f"SQLite 统计插件已关闭，共写入 {self.total_written} 条记录")
+        self._thread = None
@@ -3,7 +3,7 @@
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
 from datetime import datetime
 
@@ -67,6 +67,19 @@ class StatsPlugin(ABC):
         """
         pass
     
+    async def record_batch(self, records: List[Dict[str, Any]]):
+        """
+        批量记录响应信息（可选）
+        
+        统计管道按批次调用该方法，默认逐条调用 record_response；
+        需要批量写入（如数据库、远程服务）的插件可以覆盖该方法
+        
+        Args:
+            records: 响应信息列表
+        """
+        for record in records:
+            await self.record_response(record)
+    
     async def initialize(self):
         """插件初始化（可选）"""
         pass
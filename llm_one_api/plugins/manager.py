@@ -15,6 +15,9 @@ from llm_one_api.plugins.interfaces import (
     AuthResult,
     ModelConfig,
 )
+from llm_one_api.plugins.auth_cache import AuthCache
+from llm_one_api.plugins.stats_pipeline import StatsPipeline
+from llm_one_api.core.tracing import span
 from llm_one_api.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -34,6 +37,39 @@ class PluginManager:
         self.auth_plugin: Optional[AuthPlugin] = None
         self.model_route_plugin: Optional[ModelRoutePlugin] = None
         self.stats_plugins: List[StatsPlugin] = []
+        self.auth_cache: Optional[AuthCache] = self._create_auth_cache()
+        self.stats_pipeline: Optional[StatsPipeline] = None
+    
+    def _create_auth_cache(self) -> Optional[AuthCache]:
+        """根据配置创建认证缓存"""
+        cache_config = getattr(self.settings, "auth_cache", None) or {}
+        
+        if not cache_config.get("enabled", True):
+            logger.info("认证缓存已禁用")
+            return None
+        
+        return AuthCache(
+            ttl=cache_config.get("ttl", 60),
+            negative_ttl=cache_config.get("negative_ttl", 5),
+            max_entries=cache_config.get("max_entries", 10000),
+        )
+    
+    def _create_stats_pipeline(self) -> Optional[StatsPipeline]:
+        """根据配置创建异步统计管道"""
+        pipeline_config = getattr(self.settings, "stats_pipeline", None) or {}
+        
+        if not pipeline_config.get("enabled", True):
+            logger.info("异步统计管道已禁用，统计插件将在请求处理过程中同步调用")
+            return None
+        
+        return StatsPipeline(
+            self.stats_plugins,
+            max_queue=pipeline_config.get("max_queue", 10000),
+            batch_size=pipeline_config.get("batch_size", 100),
+            flush_interval=pipeline_config.get("flush_interval", 0.5),
+            overflow=pipeline_config.get("overflow", "drop_oldest"),
+            shutdown_timeout=pipeline_config.get("shutdown_timeout", 10),
+        )
     
     async def load_plugins(self):
         """加载所有插件"""
@@ -48,6 +84,11 @@ class PluginManager:
         # 加载统计插件
         await self._load_stats_plugins()
         
+        # 启动异步统计管道
+        self.stats_pipeline = self._create_stats_pipeline()
+        if self.stats_pipeline:
+            self.stats_pipeline.start()
+        
         logger.info("插件加载完成")
     
     async def _load_auth_plugin(self):
@@ -185,6 +226,20 @@ class PluginManager:
                 await plugin.initialize()
                 self.stats_plugins.append(plugin)
                 logger.info(f"✅ 内置统计插件加载成功: {plugin_name}")
+            elif plugin_name == "sqlite":
+                from llm_one_api.plugins.builtin.sqlite_stats import SQLiteStatsPlugin
+                config = self.settings.stats.get("sqlite", {})
+                plugin = SQLiteStatsPlugin(config)
+                await plugin.initialize()
+                self.stats_plugins.append(plugin)
+                logger.info(f"✅ 内置统计插件加载成功: {plugin_name}")
+            elif plugin_name == "columnar":
+                from llm_one_api.plugins.builtin.columnar_stats import ColumnarStatsPlugin
+                config = self.settings.stats.get("columnar", {})
+                plugin = ColumnarStatsPlugin(config)
+                await plugin.initialize()
+                self.stats_plugins.append(plugin)
+                logger.info(f"✅ 内置统计插件加载成功: {plugin_name}")
         except Exception as e:
             logger.error(f"❌ 加载内置统计插件失败: {plugin_name} - {e}")
     
@@ -194,7 +249,7 @@ class PluginManager:
         
         Args:
             api_key: API 密钥
-            
+        
         Returns:
             认证结果
         """
@@ -202,6 +257,11 @@ class PluginManager:
             return AuthResult(success=False, message="认证插件未加载")
         
         try:
+            if self.auth_cache:
+                return await self.auth_cache.get_or_authenticate(
+                    api_key, self.auth_plugin.authenticate
+                )
+            
             result = await self.auth_plugin.authenticate(api_key)
             return result
         except Exception as e:
@@ -214,39 +274,44 @@ class PluginManager:
         
         Args:
             model_name: 模型名称
-            
+        
         Returns:
             模型配置字典
         """
-        if not self.model_route_plugin:
-            logger.error("❌ 模型路由插件未加载！可能是插件初始化失败")
-            return None
-        
-        try:
-            logger.debug(f"尝试获取模型配置: {model_name}")
-            model_config = await self.model_route_plugin.get_model_config(model_name)
+        with span("route_lookup", {"model": model_name}):
+            if not self.model_route_plugin:
+                logger.error("❌ 模型路由插件未加载！可能是插件初始化失败")
+                return None
             
-            if model_config:
-                # 将 dataclass 转换为字典
-                if hasattr(model_config, "__dict__"):
-                    config_dict = vars(model_config)
-                    
-                    # 如果原始配置有 upstreams，添加到返回的字典中（用于负载均衡）
-                    if hasattr(self.model_route_plugin, 'models') and model_name in self.model_route_plugin.models:
-                        original_config = self.model_route_plugin.models[model_name]
-                        if "upstreams" in original_config:
-                            config_dict["upstreams"] = original_config["upstreams"]
-                            logger.debug(f"添加负载均衡配置: {len(original_config['upstreams'])} 个上游")
-                    
-                    logger.debug(f"模型配置获取成功: {model_name} -> {config_dict.get('api_base')}")
-                    return config_dict
-                return model_config
-            
-            logger.warning(f"⚠️  模型 {model_name} 未在配置中找到")
-            return None
-        except Exception as e:
-            logger.exception(f"❌ 获取模型配置失败: {e}")
-            return None
+            try:
+                logger.debug(f"尝试获取模型配置: {model_name}")
+                model_config = await self.model_route_plugin.get_model_config(model_name)
+                
+                if model_config:
+                    # 将 dataclass 转换为字典
+                    if hasattr(model_config, "__dict__"):
+                        config_dict = vars(model_config)
+                        
+                        # 如果原始配置有 upstreams，添加到返回的字典中（用于负载均衡）
+                        if hasattr(self.model_route_plugin, 'models') and model_name in self.model_route_plugin.models:
+                            original_config = self.model_route_plugin.models[model_name]
+                            if "upstreams" in original_config:
+                                config_dict["upstreams"] = original_config["upstreams"]
+                                logger.debug(f"添加负载均衡配置: {len(original_config['upstreams'])} 个上游")
+                            
+                            # 转发器使用的其他模型级配置（负载均衡策略、微批处理等）
+                            for key, value in original_config.items():
+                                config_dict.setdefault(key, value)
+                        
+                        logger.debug(f"模型配置获取成功: {model_name} -> {config_dict.get('api_base')}")
+                        return config_dict
+                    return model_config
+                
+                logger.warning(f"⚠️  模型 {model_name} 未在配置中找到")
+                return None
+            except Exception as e:
+                logger.exception(f"❌ 获取模型配置失败: {e}")
+                return None
     
     async def list_models(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -268,20 +333,31 @@ class PluginManager:
         """
         记录请求统计
         
+        启用统计管道时只放入队列，不等待统计插件
+        
         Args:
             stats_data: 统计数据
         """
-        for plugin in self.stats_plugins:
-            try:
-                # 简化版本：直接传递字典，不使用 dataclass
-                await plugin.record_response(stats_data)
-            except Exception as e:
-                logger.error(f"记录统计失败 ({plugin.__class__.__name__}): {e}")
+        with span("stats.record"):
+            if self.stats_pipeline:
+                self.stats_pipeline.submit(stats_data)
+                return
+            
+            for plugin in self.stats_plugins:
+                try:
+                    # 简化版本：直接传递字典，不使用 dataclass
+                    await plugin.record_response(stats_data)
+                except Exception as e:
+                    logger.error(f"记录统计失败 ({plugin.__class__.__name__}): {e}")
     
     async def cleanup(self):
         """清理所有插件"""
         logger.info("开始清理插件...")
         
+        # 先交付队列中剩余的统计记录，再清理统计插件
+        if self.stats_pipeline:
+            await self.stats_pipeline.stop()
+        
         if self.auth_plugin:
             try:
                 await self.auth_plugin.cleanup()
@@ -0,0 +1,174 @@
+"""
+异步统计管道
+
+请求处理路径只把统计记录放入有界的内存队列，立即返回；
+后台任务按批次取出记录，通过 StatsPlugin.record_batch 交给各统计插件，
+慢速的统计插件不会再增加请求延迟
+
+队列满时的处理策略（overflow）：
+    - drop_oldest: 丢弃最旧的记录，保留最新数据（默认）
+    - drop_newest: 丢弃新记录
+
+关闭时（PluginManager.cleanup）会把队列中剩余的记录全部交付后再清理插件
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from llm_one_api.plugins.interfaces import StatsPlugin
+from llm_one_api.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class StatsPipeline:
+    """异步统计管道（有界队列 + 后台批量交付）"""
+    
+    def __init__(
+        self,
+        plugins: List[StatsPlugin],
+        max_queue: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        overflow: str = "drop_oldest",
+        shutdown_timeout: float = 10.0,
+    ):
+        """
+        初始化统计管道
+        
+        Args:
+            plugins: 统计插件列表
+            max_queue: 队列最大记录数
+            batch_size: 每批交付的最大记录数
+            flush_interval: 记录不足一批时的最长等待时间（秒）
+            overflow: 队列满时的处理策略（drop_oldest / drop_newest）
+            shutdown_timeout: 关闭时交付剩余记录的最长时间（秒）
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"无效的统计队列溢出策略: {overflow}，可选值: {', '.join(OVERFLOW_POLICIES)}")
+        
+        self.plugins = plugins
+        self.max_queue = max_queue
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.shutdown_timeout = shutdown_timeout
+        
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # 正在交付的批次记录数（关闭超时被取消时计入丢弃）
+        self._delivering = 0
+        
+        self.total_submitted = 0
+        self.total_delivered = 0
+        self.total_dropped = 0
+        self.plugin_errors: Dict[str, int] = {}
+    
+    def start(self):
+        """启动后台交付任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"统计管道已启动: 队列上限={self.max_queue}, 批大小={self.batch_size}, "
+                f"溢出策略={self.overflow}"
+            )
+    
+    def submit(self, record: Dict[str, Any]):
+        """
+        提交一条统计记录（不阻塞）
+        
+        Args:
+            record: 统计数据
+        """
+        self.total_submitted += 1
+        
+        if len(self._queue) >= self.max_queue:
+            self.total_dropped += 1
+            if self.total_dropped == 1 or self.total_dropped % 1000 == 0:
+                logger.warning(f"统计队列已满，已丢弃 {self.total_dropped} 条记录")
+            
+            if self.overflow == "drop_newest":
+                return
+            self._queue.popleft()
+        
+        self._queue.append(record)
+        
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+    
+    async def _run(self):
+        """后台任务：按批次交付记录"""
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            while self._queue and not self._closing:
+                await self._deliver(self._take_batch())
+    
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        """从队列中取出一批记录"""
+        count = min(len(self._queue), self.batch_size)
+        return [self._queue.popleft() for _ in range(count)]
+    
+    async def _deliver(self, batch: List[Dict[str, Any]]):
+        """把一批记录交给所有统计插件（单个插件失败不影响其他插件）"""
+        self._delivering = len(batch)
+        for plugin in self.plugins:
+            try:
+                await plugin.record_batch(batch)
+            except Exception as e:
+                name = plugin.__class__.__name__
+                self.plugin_errors[name] = self.plugin_errors.get(name, 0) + 1
+                logger.error(f"记录统计失败 ({name}): {e}")
+        
+        self.total_delivered += len(batch)
+        self._delivering = 0
+    
+    async def stop(self):
+        """停止后台任务，并交付队列中剩余的记录"""
+        self._closing = True
+        self._wakeup.set()
+        
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception as e:
+                logger.error(f"统计管道后台任务异常退出: {e}")
+            self._task = None
+        
+        async def drain():
+            while self._queue:
+                await self._deliver(self._take_batch())
+        
+        remaining = len(self._queue)
+        try:
+            await asyncio.wait_for(drain(), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            dropped = len(self._queue) + self._delivering
+            self.total_dropped += dropped
+            logger.error(f"关闭时交付统计记录超时，丢弃 {dropped} 条记录")
+            self._queue.clear()
+            self._delivering = 0
+            return
+        
+        logger.info(f"统计管道已关闭，关闭时交付了 {remaining} 条记录")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计管道状态"""
+        return {
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "overflow": self.overflow,
+            "total_submitted": self.total_submitted,
+            "total_delivered": self.total_delivered,
+            "total_dropped": self.total_dropped,
+            "plugin_errors": dict(self.plugin_errors),
+        }
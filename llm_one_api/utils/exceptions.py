@@ -2,14 +2,23 @@
 自定义异常类
 """
 
+from typing import Dict, Optional
+
 
 class LLMOneAPIError(Exception):
     """LLM One API 基础异常"""
     
-    def __init__(self, message: str, status_code: int = 500, error_type: str = "api_error"):
+    def __init__(
+        self,
+        message: str,
+        status_code: int = 500,
+        error_type: str = "api_error",
+        headers: Optional[Dict[str, str]] = None,
+    ):
         self.message = message
         self.status_code = status_code
         self.error_type = error_type
+        self.headers = headers or {}  # 需要附加到错误响应上的 HTTP 头
         super().__init__(self.message)
 
 
@@ -45,6 +54,32 @@ class UpstreamError(LLMOneAPIError):
         super().__init__(message, status_code=status_code, error_type="upstream_error")
 
 
+class DeadlineExceededError(LLMOneAPIError):
+    """请求时间预算耗尽"""
+    
+    def __init__(self, message: str = "请求超时：时间预算已用完"):
+        super().__init__(message, status_code=504, error_type="timeout")
+
+
+class StreamTimeoutError(LLMOneAPIError):
+    """流式请求超时（phase: connect / first_token / idle / total）"""
+    
+    PHASE_MESSAGES = {
+        "connect": "连接上游超时",
+        "first_token": "等待首个 token 超时",
+        "idle": "等待下一个数据块超时",
+        "total": "流式响应总时长超时",
+    }
+    
+    def __init__(self, phase: str, timeout: Optional[float] = None):
+        self.phase = phase
+        self.timeout = timeout
+        message = self.PHASE_MESSAGES.get(phase, "流式请求超时")
+        if timeout is not None:
+            message = f"{message} ({timeout:.1f}s)"
+        super().__init__(message, status_code=504, error_type=f"stream_{phase}_timeout")
+
+
 class RateLimitError(LLMOneAPIError):
     """限流错误"""
     
@@ -58,3 +93,22 @@ class ValidationError(LLMOneAPIError):
     def __init__(self, message: str):
         super().__init__(message, status_code=400, error_type="validation_error")
 
+
+class OverloadedError(LLMOneAPIError):
+    """服务过载错误（请求被快速拒绝，客户端应在 Retry-After 秒后重试）"""
+    
+    def __init__(self, message: str = "服务繁忙，请稍后重试", retry_after: int = 1):
+        self.retry_after = retry_after
+        super().__init__(
+            message,
+            status_code=503,
+            error_type="overloaded",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class ProfilingInProgressError(LLMOneAPIError):
+    """已有性能分析会话正在运行"""
+    
+    def __init__(self, message: str = "已有性能分析会话正在运行，请稍后重试"):
+        super().__init__(message, status_code=409, error_type="profiling_in_progress")
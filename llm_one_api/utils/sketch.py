@@ -0,0 +1,128 @@
+"""
+分位数 sketch（DDSketch）
+
+用对数分桶近似记录数值分布，分位数的相对误差不超过 relative_accuracy；
+桶数有上限（超出时合并最小的桶，只影响最低分位数的精度），内存占用与样本数无关；
+同参数的 sketch 可以直接合并，用于把按时间分片的统计合并成任意窗口
+
+参考: Masson et al., "DDSketch: A Fast and Fully-Mergeable Quantile Sketch with Relative-Error Guarantees" (VLDB 2019)
+"""
+
+import math
+from typing import Dict, Iterable, Optional
+
+# 小于该值的样本记入零值桶
+MIN_INDEXABLE = 1e-9
+
+
+class DDSketch:
+    """DDSketch 分位数 sketch（只记录非负数）"""
+    
+    __slots__ = (
+        "relative_accuracy", "max_bins", "gamma", "_log_gamma",
+        "bins", "zero_count", "count", "sum", "min", "max",
+    )
+    
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        """
+        Args:
+            relative_accuracy: 分位数的相对误差上限
+            max_bins: 最大桶数
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy 必须在 0 和 1 之间: {relative_accuracy}")
+        
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    
+    def add(self, value: float):
+        """记录一个样本"""
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        
+        if value < MIN_INDEXABLE:
+            self.zero_count += 1
+            return
+        
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+    
+    def merge(self, other: "DDSketch"):
+        """合并另一个 sketch（必须使用相同的 relative_accuracy）"""
+        if other.gamma != self.gamma:
+            raise ValueError("只能合并 relative_accuracy 相同的 sketch")
+        if other.count == 0:
+            return
+        
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+    
+    def _collapse(self):
+        """桶数超过上限时，把最小的桶合并到一起"""
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins + 1
+        target = keys[excess]
+        self.bins[target] += sum(self.bins.pop(key) for key in keys[:excess])
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        计算分位数
+        
+        Args:
+            q: 分位（0 到 1）
+        
+        Returns:
+            分位数的近似值，没有样本时返回 None
+        """
+        if self.count == 0:
+            return None
+        
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return max(self.min, 0.0)
+        
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        
+        return self.max
+    
+    def quantiles(self, qs: Iterable[float] = (0.5, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+        """计算多个分位数，返回 {"p50": ..., "p95": ..., ...}"""
+        result = {}
+        for q in qs:
+            value = self.quantile(q)
+            result[f"p{q * 100:g}"] = round(value, 6) if value is not None else None
+        return result
+    
+    @property
+    def avg(self) -> Optional[float]:
+        """平均值"""
+        return self.sum / self.count if self.count else None
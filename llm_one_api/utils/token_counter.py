@@ -2,39 +2,278 @@
 Token 计数工具
 
 使用 tiktoken 库计算文本的 token 数量
+
+编码器按模型解析一次后缓存在模块级注册表中；
+超过阈值的大文本会被放到线程池中编码，避免阻塞事件循环
+
+离线环境下可以将 tiktoken 的 BPE 文件预先下载到本地目录：
+    python -m llm_one_api.utils.token_counter --output_dir ./tokenizers
+然后在配置中通过 tokenizer.assets_dir 引用该目录
 """
 
-from typing import List, Dict, Any, Optional
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Set
 
+from llm_one_api.utils.logger import logger
 
-def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+# 默认编码器名称
+DEFAULT_ENCODING = "cl100k_base"
+
+# 超过该字符数的文本在异步接口中放到线程池编码
+OFFLOAD_THRESHOLD_CHARS = 16384
+
+# 模型名称 -> 编码器（None 表示 tiktoken 不可用）
+_encoders: Dict[str, Any] = {}
+# 模型名称 -> 加载失败后允许重试的时间（monotonic）
+_encoder_failures: Dict[str, float] = {}
+# 正在其他线程中加载的模型
+_encoders_loading: Set[str] = set()
+# 只保护上面三个注册表，加载（可能需要下载 BPE 文件）时不持有
+_encoders_lock = threading.Lock()
+
+# 编码器加载失败后，多久之后再次尝试（秒）
+ENCODER_RETRY_INTERVAL = 60
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_encoder(model: str = "gpt-3.5-turbo"):
     """
-    计算文本的 token 数量
+    获取模型对应的 tiktoken 编码器（每个模型只解析一次）
+    
+    加载失败（例如下载 BPE 文件超时）时不永久缓存，ENCODER_RETRY_INTERVAL 秒后再次尝试；
+    其他线程正在加载同一模型时不等待，直接返回 None
     
     Args:
-        text: 文本内容
         model: 模型名称
-        
+    
     Returns:
-        token 数量
+        编码器，如果 tiktoken 不可用或暂时无法加载返回 None
     """
+    encoder = _encoders.get(model)
+    if encoder is not None or model in _encoders:
+        return encoder
+    
+    with _encoders_lock:
+        if model in _encoders:
+            return _encoders[model]
+        if model in _encoders_loading or _encoder_failures.get(model, 0) > time.monotonic():
+            # 正在加载或最近加载失败，本次使用粗略估算，不阻塞调用方（可能是事件循环）
+            return None
+        _encoders_loading.add(model)
+    
+    try:
+        encoder = _load_encoder(model)
+    except Exception as e:
+        # BPE 文件无法加载（例如离线环境下无法下载），一段时间内使用粗略估算
+        logger.warning(
+            f"加载 {model} 的 tokenizer 失败，{ENCODER_RETRY_INTERVAL}s 内将使用粗略估算: {e}"
+        )
+        with _encoders_lock:
+            _encoder_failures[model] = time.monotonic() + ENCODER_RETRY_INTERVAL
+        return None
+    else:
+        with _encoders_lock:
+            _encoder_failures.pop(model, None)
+            _encoders[model] = encoder
+        return encoder
+    finally:
+        with _encoders_lock:
+            _encoders_loading.discard(model)
+
+
+def _load_encoder(model: str):
+    """加载编码器，tiktoken 未安装时返回 None"""
     try:
         import tiktoken
+    except ImportError:
+        return None
+    
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # 如果模型不支持，使用默认编码器
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def configure_tokenizer(config: Dict[str, Any]):
+    """
+    应用 tokenizer 配置
+    
+    必须在第一次加载编码器之前调用
+    
+    Args:
+        config: tokenizer 配置
+            - assets_dir: 本地 BPE 文件目录（tiktoken 缓存格式）
+            - offline: 是否禁止从网络下载 BPE 文件
+    """
+    assets_dir = config.get("assets_dir")
+    
+    if assets_dir:
+        assets_dir = os.path.abspath(os.path.expanduser(assets_dir))
+        if not os.path.isdir(assets_dir):
+            logger.warning(f"tokenizer 资源目录不存在: {assets_dir}")
+        # tiktoken 每次读取 BPE 文件时都会检查该环境变量
+        os.environ["TIKTOKEN_CACHE_DIR"] = assets_dir
+        logger.info(f"使用本地 tokenizer 资源目录: {assets_dir}")
+    
+    if config.get("offline", False):
+        _disable_remote_downloads()
+
+
+def _disable_remote_downloads():
+    """禁止 tiktoken 从网络下载 BPE 文件，缺失时立即失败而不是等待网络超时"""
+    try:
+        import tiktoken.load as tiktoken_load
+    except ImportError:
+        return
+    
+    read_file = tiktoken_load.read_file
+    
+    if getattr(read_file, "_offline", False):
+        return
+    
+    def read_file_offline(blobpath: str) -> bytes:
+        if "://" in blobpath:
+            raise RuntimeError(
+                f"tokenizer 离线模式下本地缺少 BPE 文件: {blobpath}，"
+                f"请使用 `python -m llm_one_api.utils.token_counter` 预先下载"
+            )
+        return read_file(blobpath)
+    
+    read_file_offline._offline = True
+    tiktoken_load.read_file = read_file_offline
+    logger.info("tokenizer 离线模式已启用")
+
+
+def preload_encoders(models: Iterable[str]) -> Dict[str, bool]:
+    """
+    预加载模型对应的编码器
+    
+    Args:
+        models: 模型名称列表
+        
+    Returns:
+        模型名称 -> 是否加载成功
+    """
+    return {model: get_encoder(model) is not None for model in models}
+
+
+async def warmup_tokenizers(models: Iterable[str], timeout: float = 30) -> Dict[str, bool]:
+    """
+    在线程池中预加载编码器，避免第一个请求承担初始化开销
+    
+    Args:
+        models: 模型名称列表
+        timeout: 超时时间（秒），超时后不再等待，后台线程继续加载，完成前的请求使用粗略估算
+        
+    Returns:
+        模型名称 -> 是否加载成功
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_get_executor(), preload_encoders, list(models))
+    
+    try:
+        return await asyncio.wait_for(future, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"tokenizer 预加载超时（{timeout}s），将在后台继续加载")
+        return {}
+
+
+def download_tokenizer_assets(
+    output_dir: str = "tokenizers",
+    encodings: Optional[List[str]] = None,
+    models: Optional[List[str]] = None,
+) -> List[str]:
+    """
+    下载 tiktoken 的 BPE 文件到本地目录，供离线环境使用
+    
+    Args:
+        output_dir: 输出目录，配置到 tokenizer.assets_dir
+        encodings: 编码名称列表，默认下载所有内置编码
+        models: 模型名称列表，会下载这些模型对应的编码
         
+    Returns:
+        已下载的编码名称列表
+    """
+    import tiktoken
+    
+    os.makedirs(output_dir, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = os.path.abspath(output_dir)
+    
+    names = set(encodings or [])
+    for model in models or []:
         try:
-            encoding = tiktoken.encoding_for_model(model)
+            names.add(tiktoken.encoding_name_for_model(model))
         except KeyError:
-            # 如果模型不支持，使用默认编码器
-            encoding = tiktoken.get_encoding("cl100k_base")
-        
-        tokens = encoding.encode(text)
-        return len(tokens)
+            names.add(DEFAULT_ENCODING)
     
-    except ImportError:
-        # 如果没有安装 tiktoken，使用粗略估算
-        # 英文：1 token ≈ 4 字符
-        # 中文：1 token ≈ 1.5-2 字符
-        return max(len(text) // 4, 1)
+    if not names:
+        names = set(tiktoken.list_encoding_names())
+    
+    for name in sorted(names):
+        tiktoken.get_encoding(name)
+        print(f"✅ {name}")
+    
+    print(f"tokenizer 资源已保存到: {os.path.abspath(output_dir)}")
+    return sorted(names)
+
+
+def _estimate(text: str) -> int:
+    """
+    粗略估算 token 数量
+    
+    英文：1 token ≈ 4 字符
+    中文：1 token ≈ 1.5-2 字符
+    """
+    return max(len(text) // 4, 1)
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    计算文本的 token 数量
+    
+    Args:
+        text: 文本内容
+        model: 模型名称
+    
+    Returns:
+        token 数量
+    """
+    encoder = get_encoder(model)
+    
+    if encoder is None:
+        return _estimate(text)
+    
+    return len(encoder.encode_ordinary(text))
+
+
+def count_tokens_batch(texts: List[str], model: str = "gpt-3.5-turbo") -> List[int]:
+    """
+    批量计算多个文本的 token 数量
+    
+    Args:
+        texts: 文本列表
+        model: 模型名称
+    
+    Returns:
+        与 texts 一一对应的 token 数量列表
+    """
+    if not texts:
+        return []
+    
+    encoder = get_encoder(model)
+    
+    if encoder is None:
+        return [_estimate(text) for text in texts]
+    
+    # 不使用 encode_ordinary_batch：它每次调用都会新建线程池，对聊天消息这类短文本反而慢得多；
+    # 大文本由异步接口整体放到 _executor 中编码
+    return [len(encoder.encode_ordinary(text)) for text in texts]
 
 
 def count_chat_tokens(messages: List[Dict[str, str]], model: str = "gpt-3.5-turbo") -> int:
@@ -44,35 +283,74 @@ def count_chat_tokens(messages: List[Dict[str, str]], model: str = "gpt-3.5-turb
     Args:
         messages: 消息列表
         model: 模型名称
-        
+    
     Returns:
         token 数量
     """
-    try:
-        import tiktoken
-        
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-        
-        # 根据 OpenAI 的计算方式
-        # 每条消息有固定开销：4 tokens (role, content, name)
-        # 整个对话有固定开销：3 tokens
-        num_tokens = 3
-        
-        for message in messages:
-            num_tokens += 4  # 每条消息的固定开销
-            for key, value in message.items():
-                if value:
-                    num_tokens += len(encoding.encode(str(value)))
-        
-        return num_tokens
+    encoder = get_encoder(model)
     
-    except ImportError:
+    if encoder is None:
         # 粗略估算
         total_chars = sum(len(msg.get("content", "")) for msg in messages)
         return max(total_chars // 4, 1)
+    
+    # 根据 OpenAI 的计算方式
+    # 每条消息有固定开销：4 tokens (role, content, name)
+    # 整个对话有固定开销：3 tokens
+    texts = [str(value) for message in messages for value in message.values() if value]
+    
+    return 3 + 4 * len(messages) + sum(count_tokens_batch(texts, model))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """获取 token 计数专用线程池"""
+    global _executor
+    
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="token-counter")
+    
+    return _executor
+
+
+async def acount_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    异步计算文本的 token 数量
+    
+    大文本放到线程池中编码，小文本直接在当前线程计算
+    """
+    if len(text) < OFFLOAD_THRESHOLD_CHARS:
+        return count_tokens(text, model)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), count_tokens, text, model)
+
+
+async def acount_tokens_batch(texts: List[str], model: str = "gpt-3.5-turbo") -> List[int]:
+    """
+    异步批量计算 token 数量
+    
+    文本总长度超过阈值时放到线程池中编码
+    """
+    if sum(len(text) for text in texts) < OFFLOAD_THRESHOLD_CHARS:
+        return count_tokens_batch(texts, model)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), count_tokens_batch, texts, model)
+
+
+async def acount_chat_tokens(messages: List[Dict[str, str]], model: str = "gpt-3.5-turbo") -> int:
+    """
+    异步计算聊天消息的 token 数量
+    
+    消息总长度超过阈值时放到线程池中编码
+    """
+    total_chars = sum(len(str(value)) for message in messages for value in message.values() if value)
+    
+    if total_chars < OFFLOAD_THRESHOLD_CHARS:
+        return count_chat_tokens(messages, model)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), count_chat_tokens, messages, model)
 
 
 def estimate_cost(
@@ -87,7 +365,7 @@ def estimate_cost(
         prompt_tokens: 提示 token 数
         completion_tokens: 补全 token 数
         model: 模型名称
-        
+    
     Returns:
         成本（美元）
     """
@@ -116,3 +394,8 @@ def estimate_cost(
     
     return prompt_cost + completion_cost
 
+
+if __name__ == "__main__":
+    import fire
+    
+    fire.Fire(download_tokenizer_assets)
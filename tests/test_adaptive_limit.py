@@ -0,0 +1,70 @@
+"""
+自适应并发上限测试
+"""
+
+from llm_one_api.core.adaptive_limit import AdaptiveLimit
+from llm_one_api.core.forwarder import _output_tokens
+from llm_one_api.core.load_balancer import SingleServerWrapper
+
+
+def make_server():
+    balancer = SingleServerWrapper(
+        "http://upstream",
+        "k",
+        adaptive_concurrency={"enabled": True, "initial_limit": 10},
+    )
+    return balancer, balancer.servers[0]
+
+
+def complete(balancer, server, latency, output_tokens=None):
+    balancer.mark_request_start(server)
+    balancer.mark_request_success(server, latency, output_tokens)
+
+
+def test_long_healthy_response_leaves_limit_unchanged():
+    balancer, server = make_server()
+    limit = server.adaptive_limit
+    
+    # 空闲时（在途请求数远低于上限）不增长，只观察延迟是否误判
+    for _ in range(50):
+        complete(balancer, server, 2.0, output_tokens=100)
+    assert limit.limit == 10
+    
+    # 输出长 20 倍的响应完整耗时也长 20 倍，但每个输出 token 的耗时不变
+    for _ in range(5):
+        complete(balancer, server, 40.0, output_tokens=2000)
+    assert limit.limit == 10
+    assert limit.total_decreases == 0
+
+
+def test_slower_tokens_decrease_limit():
+    balancer, server = make_server()
+    
+    for _ in range(50):
+        complete(balancer, server, 2.0, output_tokens=100)
+    for _ in range(5):
+        complete(balancer, server, 10.0, output_tokens=100)
+    
+    assert server.adaptive_limit.total_decreases > 0
+    assert server.adaptive_limit.limit < 10
+
+
+def test_latency_signals_have_separate_baselines():
+    limit = AdaptiveLimit(initial_limit=10)
+    
+    for _ in range(50):
+        limit.on_success(1, 0.02, "per_token")
+    # 首 token 延迟比每个 token 的耗时大得多，但不与其比较
+    for _ in range(20):
+        limit.on_success(1, 0.5)
+    
+    assert limit.total_decreases == 0
+    assert set(limit.get_stats()["latency"]) == {"per_token", "latency"}
+
+
+def test_output_tokens():
+    assert _output_tokens({"usage": {"prompt_tokens": 5, "completion_tokens": 7}}) == 7
+    assert _output_tokens({"usage": {"prompt_tokens": 5, "total_tokens": 5}}) is None
+    assert _output_tokens({"usage": {"completion_tokens": 0}}) is None
+    assert _output_tokens({"data": []}) is None
+    assert _output_tokens(None) is None
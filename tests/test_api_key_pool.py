@@ -0,0 +1,98 @@
+"""
+上游 API Key 池测试
+"""
+
+import httpx
+import pytest
+
+from llm_one_api.core import api_key_pool as api_key_pool_module
+from llm_one_api.core.api_key_pool import ApiKeyPool, is_key_error
+
+
+def status_error(status_code: int, headers=None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status_code}", request=request, response=response)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(api_key_pool_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def use(pool: ApiKeyPool, error=None) -> str:
+    key = pool.acquire()
+    pool.release(key, error)
+    return key.value
+
+
+def test_is_key_error():
+    assert is_key_error(status_error(429))
+    assert is_key_error(status_error(401))
+    assert is_key_error(status_error(403))
+    assert not is_key_error(status_error(500))
+    assert not is_key_error(httpx.ConnectError("refused"))
+
+
+def test_keys_rotate():
+    pool = ApiKeyPool(["sk-a", "sk-b", "sk-c"])
+    assert [use(pool) for _ in range(6)] == ["sk-a", "sk-b", "sk-c"] * 2
+
+
+def test_throttled_key_is_benched_for_retry_after(clock):
+    pool = ApiKeyPool(["sk-a", "sk-b", "sk-c"], cooldown=10)
+    
+    key = pool.acquire()
+    pool.release(key, status_error(429, {"retry-after": "2"}))
+    assert key.benched and key.bench_reason == "throttled"
+    assert "sk-a" not in [use(pool) for _ in range(10)]
+    
+    clock[0] += 2
+    assert "sk-a" in [use(pool) for _ in range(3)]
+
+
+def test_throttled_key_without_retry_after_uses_cooldown(clock):
+    pool = ApiKeyPool(["sk-a", "sk-b"], cooldown=10)
+    
+    key = pool.acquire()
+    pool.release(key, status_error(429))
+    
+    clock[0] += 9
+    assert {use(pool) for _ in range(4)} == {"sk-b"}
+    clock[0] += 1
+    assert "sk-a" in {use(pool) for _ in range(4)}
+
+
+def test_auth_error_benches_key_for_auth_cooldown(clock):
+    pool = ApiKeyPool(["sk-a", "sk-b"], auth_cooldown=300)
+    
+    key = pool.acquire()
+    pool.release(key, status_error(401))
+    assert key.bench_reason == "http_401"
+    
+    clock[0] += 299
+    assert {use(pool) for _ in range(4)} == {"sk-b"}
+    assert pool.get_stats()[0]["total_auth_errors"] == 1
+
+
+def test_server_errors_do_not_bench_key():
+    pool = ApiKeyPool(["sk-a", "sk-b"])
+    
+    key = pool.acquire()
+    pool.release(key, status_error(500))
+    assert not key.benched
+    assert key.total_failures == 1
+
+
+def test_all_keys_benched_falls_back_to_first_to_recover(clock):
+    pool = ApiKeyPool(["sk-a", "sk-b"])
+    
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first, status_error(429, {"retry-after": "30"}))
+    pool.release(second, status_error(429, {"retry-after": "5"}))
+    
+    assert not pool.has_available
+    assert pool.exhausted
+    assert use(pool) == "sk-b"
@@ -0,0 +1,151 @@
+"""
+AuthCache 测试
+"""
+
+import asyncio
+
+import pytest
+
+from llm_one_api.plugins.auth_cache import AuthCache
+from llm_one_api.plugins.interfaces.auth import AuthResult
+
+
+class SlowBackend:
+    """可控的认证后端：每次调用等待 release 后返回"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+    
+    async def authenticate(self, api_key: str) -> AuthResult:
+        self.calls += 1
+        await self.release.wait()
+        return AuthResult(success=True, user_id=f"user-{api_key}")
+
+
+async def test_hit_after_first_call():
+    cache = AuthCache()
+    backend = SlowBackend()
+    backend.release.set()
+    
+    first = await cache.get_or_authenticate("k", backend.authenticate)
+    second = await cache.get_or_authenticate("k", backend.authenticate)
+    
+    assert first.user_id == second.user_id == "user-k"
+    assert backend.calls == 1
+    assert cache.get_stats()["hits"] == 1
+
+
+async def test_concurrent_requests_are_coalesced():
+    cache = AuthCache()
+    backend = SlowBackend()
+    
+    tasks = [asyncio.ensure_future(cache.get_or_authenticate("k", backend.authenticate)) for _ in range(5)]
+    await asyncio.sleep(0)
+    backend.release.set()
+    results = await asyncio.gather(*tasks)
+    
+    assert {r.user_id for r in results} == {"user-k"}
+    assert backend.calls == 1
+    assert cache.get_stats()["coalesced"] == 4
+
+
+async def test_leader_cancellation_does_not_fail_followers():
+    cache = AuthCache()
+    backend = SlowBackend()
+    
+    leader = asyncio.ensure_future(cache.get_or_authenticate("k", backend.authenticate))
+    await asyncio.sleep(0)
+    followers = [asyncio.ensure_future(cache.get_or_authenticate("k", backend.authenticate)) for _ in range(3)]
+    await asyncio.sleep(0)
+    
+    leader.cancel()
+    await asyncio.sleep(0)
+    backend.release.set()
+    results = await asyncio.gather(*followers)
+    
+    assert leader.cancelled()
+    assert {r.user_id for r in results} == {"user-k"}
+    # 其中一个等待者重新发起了认证
+    assert backend.calls == 2
+
+
+async def test_follower_cancellation_does_not_affect_leader():
+    cache = AuthCache()
+    backend = SlowBackend()
+    
+    leader = asyncio.ensure_future(cache.get_or_authenticate("k", backend.authenticate))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(cache.get_or_authenticate("k", backend.authenticate))
+    await asyncio.sleep(0)
+    
+    follower.cancel()
+    await asyncio.sleep(0)
+    backend.release.set()
+    
+    assert (await leader).user_id == "user-k"
+    assert follower.cancelled()
+
+
+async def test_backend_error_is_shared_and_not_cached():
+    cache = AuthCache()
+    calls = 0
+    
+    async def failing(api_key: str) -> AuthResult:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        raise RuntimeError("backend down")
+    
+    tasks = [asyncio.ensure_future(cache.get_or_authenticate("k", failing)) for _ in range(3)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert calls == 1
+    
+    with pytest.raises(RuntimeError):
+        await cache.get_or_authenticate("k", failing)
+    assert calls == 2
+
+
+async def test_negative_ttl_and_metadata_overrides():
+    cache = AuthCache(negative_ttl=0)
+    calls = 0
+    
+    async def deny(api_key: str) -> AuthResult:
+        nonlocal calls
+        calls += 1
+        return AuthResult(success=False, message="denied")
+    
+    await cache.get_or_authenticate("k", deny)
+    await cache.get_or_authenticate("k", deny)
+    assert calls == 2
+    
+    async def uncacheable(api_key: str) -> AuthResult:
+        nonlocal calls
+        calls += 1
+        return AuthResult(success=True, metadata={"cacheable": False})
+    
+    calls = 0
+    await cache.get_or_authenticate("u", uncacheable)
+    await cache.get_or_authenticate("u", uncacheable)
+    assert calls == 2
+
+
+async def test_lru_eviction():
+    cache = AuthCache(max_entries=2)
+    backend = SlowBackend()
+    backend.release.set()
+    
+    for key in ("a", "b", "c"):
+        await cache.get_or_authenticate(key, backend.authenticate)
+    
+    assert cache.get_stats()["entries"] == 2
+    await cache.get_or_authenticate("a", backend.authenticate)
+    assert backend.calls == 4
+
+
+def test_hash_key_does_not_contain_plaintext():
+    digest = AuthCache.hash_key("sk-secret")
+    assert "sk-secret" not in digest
+    assert len(digest) == 64
@@ -0,0 +1,147 @@
+"""
+批处理执行器测试
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from llm_one_api.api.dependencies import get_batch_executor, verify_api_key
+from llm_one_api.api.routes import files as files_route
+from llm_one_api.core import batch_executor as batch_module
+from llm_one_api.core.batch_executor import BatchExecutor, _load_progress, _ResultWriter
+from llm_one_api.core.file_store import FileStore
+from llm_one_api.core.forwarder import NonStreamForwarder
+from llm_one_api.utils.exceptions import LLMOneAPIError, OverloadedError
+
+
+class FakePluginManager:
+    async def get_model_config(self, model_name):
+        return {"model_name": model_name, "api_base": "http://upstream", "api_key": "k"}
+
+
+@pytest.fixture
+def executor(tmp_path):
+    return BatchExecutor({"storage_dir": str(tmp_path)}, FakePluginManager())
+
+
+def test_load_progress_truncates_partial_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    path.write_bytes(b'{"custom_id": "a"}\n\n{"custom_id": "b"}\n{"custom_id": "c"')
+    
+    assert _load_progress(path) == {"a", "b"}
+    assert path.read_bytes() == b'{"custom_id": "a"}\n\n{"custom_id": "b"}\n'
+    assert _load_progress(tmp_path / "missing.jsonl") == set()
+
+
+async def test_result_writer_buffers_and_keeps_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_module, "WRITE_BUFFER_RECORDS", 3)
+    monkeypatch.setattr(batch_module, "WRITE_BUFFER_SECONDS", 3600)
+    path = tmp_path / "out.jsonl"
+    writer = _ResultWriter(path)
+    
+    for i in range(5):
+        await writer.write(f"{i}\n".encode())
+    
+    # 前 3 条已经写入，其余仍在缓冲中
+    assert path.read_bytes() == b"0\n1\n2\n"
+    
+    writer.close()
+    assert path.read_bytes() == b"0\n1\n2\n3\n4\n"
+
+
+async def test_create_batch_rejects_non_generated_file_ids(executor):
+    for file_id in ("../../etc/passwd", "..", "file-xyz"):
+        with pytest.raises(LLMOneAPIError) as excinfo:
+            executor.create_batch(file_id, "/v1/chat/completions", "24h", {"user_id": "u"})
+        assert excinfo.value.status_code == 404
+    
+    assert executor.get_batch("..") is None
+    assert not FileStore.is_valid_id("file-../x")
+    assert FileStore.is_valid_id(FileStore.new_file_id())
+
+
+async def test_overloaded_retries_are_bounded_by_expiry(executor, monkeypatch):
+    calls = []
+    
+    async def overloaded(self, request_data, auth_result):
+        calls.append(time.monotonic())
+        raise OverloadedError(retry_after=1)
+    
+    monkeypatch.setattr(NonStreamForwarder, "forward_chat", overloaded)
+    batch = {
+        "endpoint": "/v1/chat/completions",
+        "status": "in_progress",
+        "expires_at": time.time() + 1.5,
+        "_auth": {"user_id": "u"},
+    }
+    body = {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}]}
+    
+    with pytest.raises(OverloadedError):
+        await asyncio.wait_for(executor._forward(batch, body), timeout=5)
+    assert len(calls) == 2
+    
+    # 已取消的批处理不再重试
+    calls.clear()
+    batch.update(status="cancelling", expires_at=time.time() + 3600)
+    with pytest.raises(OverloadedError):
+        await executor._forward(batch, body)
+    assert len(calls) == 1
+
+
+async def test_batch_runs_to_completion(executor, monkeypatch):
+    async def echo(self, request_data, auth_result):
+        return {"id": "cmpl", "echo": request_data["messages"][0]["content"]}
+    
+    monkeypatch.setattr(NonStreamForwarder, "forward_chat", echo)
+    
+    file_id, writer = executor.file_store.create_writer()
+    with writer:
+        for i in range(10):
+            request = {
+                "custom_id": f"r{i}",
+                "url": "/v1/chat/completions",
+                "body": {"model": "gpt-4", "messages": [{"role": "user", "content": str(i)}]},
+            }
+            writer.write((json.dumps(request) + "\n").encode())
+    executor.file_store.register(file_id, "in.jsonl", "batch", "u")
+    
+    batch = executor.create_batch(file_id, "/v1/chat/completions", "24h", {"user_id": "u"})
+    await asyncio.wait_for(executor._runners[batch["id"]], timeout=5)
+    
+    batch = executor.get_batch(batch["id"])
+    assert batch["status"] == "completed"
+    assert batch["request_counts"] == {"total": 10, "completed": 10, "failed": 0}
+    
+    output = executor.file_store.content_path(batch["output_file_id"]).read_text().splitlines()
+    assert sorted(json.loads(line)["custom_id"] for line in output) == sorted(f"r{i}" for i in range(10))
+    
+    listed = await executor.list_batches(owner="u")
+    assert [item["id"] for item in listed] == [batch["id"]]
+    assert await executor.list_batches(owner="other") == []
+
+
+def make_files_client(executor) -> TestClient:
+    app = FastAPI()
+    app.include_router(files_route.router, prefix="/v1")
+    app.dependency_overrides[get_batch_executor] = lambda: executor
+    app.dependency_overrides[verify_api_key] = lambda: {"success": True, "user_id": "u"}
+    return TestClient(app)
+
+
+def test_upload_rejects_files_over_max_file_bytes(tmp_path):
+    executor = BatchExecutor({"storage_dir": str(tmp_path), "max_file_bytes": 10}, FakePluginManager())
+    client = make_files_client(executor)
+    
+    response = client.post("/v1/files", data={"purpose": "batch"}, files={"file": ("in.jsonl", b"x" * 11)})
+    assert response.status_code == 413
+    assert list(executor.file_store.root.iterdir()) == []
+    
+    response = client.post("/v1/files", data={"purpose": "batch"}, files={"file": ("in.jsonl", b"x" * 10)})
+    assert response.status_code == 200
+    assert response.json()["bytes"] == 10
+    assert [item["id"] for item in client.get("/v1/files").json()["data"]] == [response.json()["id"]]
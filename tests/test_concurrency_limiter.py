@@ -0,0 +1,83 @@
+"""
+API Key 并发限制测试
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from llm_one_api.api.dependencies import get_current_settings, verify_api_key
+from llm_one_api.api.routes import stats as stats_route
+from llm_one_api.config.settings import Settings
+from llm_one_api.core.concurrency_limiter import ConcurrencyLimiter
+from llm_one_api.utils.exceptions import RateLimitError
+
+ALICE = {"key_id": "alice", "metadata": {"max_concurrent_streams": 1}}
+
+
+async def test_slot_released_when_stream_errors():
+    limiter = ConcurrencyLimiter({})
+    slot = limiter.acquire(ALICE, "gpt-4", stream=True)
+    
+    async def stream():
+        yield "data: 1\n\n"
+        raise RuntimeError("upstream reset")
+    
+    with pytest.raises(RuntimeError):
+        async for _ in slot.wrap_stream(stream()):
+            pass
+    
+    assert limiter.get_stats()["in_flight_streams"] == 0
+    limiter.acquire(ALICE, "gpt-4", stream=True).release()
+
+
+async def test_slot_released_when_client_disconnects():
+    limiter = ConcurrencyLimiter({})
+    slot = limiter.acquire(ALICE, "gpt-4", stream=True)
+    with pytest.raises(RateLimitError):
+        limiter.acquire(ALICE, "gpt-4", stream=True)
+    
+    async def stream():
+        yield "data: 1\n\n"
+        await asyncio.sleep(10)
+        yield "data: 2\n\n"
+    
+    async def send():
+        async for _ in slot.wrap_stream(stream()):
+            pass
+    
+    # 客户端断开时服务器取消发送响应的任务
+    task = asyncio.ensure_future(send())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    
+    assert limiter.get_stats()["in_flight_streams"] == 0
+    # 响应结束后的 BackgroundTask 会再次释放，不能重复扣减计数
+    slot.release()
+    assert limiter.get_stats()["keys"] == {}
+
+
+def test_concurrency_stats_are_scoped_to_caller():
+    limiter = ConcurrencyLimiter({})
+    limiter.acquire(ALICE, "gpt-4", stream=True)
+    limiter.acquire({"key_id": "bob"}, "gpt-4")
+    
+    app = FastAPI()
+    app.include_router(stats_route.router, prefix="/v1")
+    app.state.concurrency_limiter = limiter
+    app.dependency_overrides[verify_api_key] = lambda: {"success": True, "key_id": "alice", "user_id": "alice"}
+    app.dependency_overrides[get_current_settings] = lambda: Settings(profiling={"admin_token": "admin-secret"})
+    client = TestClient(app)
+    
+    stats = client.get("/v1/stats/concurrency").json()
+    assert list(stats["keys"]) == ["alice"]
+    assert stats["in_flight_requests"] == 1 and stats["in_flight_streams"] == 1
+    assert "total_rejected" not in stats
+    
+    stats = client.get("/v1/stats/concurrency", headers={"X-Admin-Token": "admin-secret"}).json()
+    assert sorted(stats["keys"]) == ["alice", "bob"]
+    assert stats["in_flight_requests"] == 2
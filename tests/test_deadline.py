@@ -0,0 +1,37 @@
+"""
+请求截止时间测试
+"""
+
+import pytest
+
+from llm_one_api.core.deadline import Deadline
+from llm_one_api.utils.exceptions import ValidationError
+
+
+def test_header_overrides_model_timeout():
+    deadline = Deadline.from_request({"x-request-timeout": "2.5"}, {"request_timeout": 60})
+    
+    assert deadline.timeout == 2.5
+    assert 0 < deadline.remaining() <= 2.5
+    assert deadline.cap(10) <= 2.5
+    assert not deadline.expired
+
+
+def test_model_timeout_and_default():
+    assert Deadline.from_request({}, {"request_timeout": 30}).timeout == 30.0
+    assert Deadline.from_request({}, {}) is None
+
+
+@pytest.mark.parametrize("value", ["abc", "", "0", "-1", "nan", "NaN", "inf", "-inf", "Infinity", "1e400"])
+def test_invalid_header_is_rejected(value):
+    with pytest.raises(ValidationError) as excinfo:
+        Deadline.from_request({"x-request-timeout": value}, {"request_timeout": 30})
+    assert excinfo.value.status_code == 400
+
+
+def test_expired_deadline():
+    deadline = Deadline(0)
+    
+    assert deadline.expired
+    assert deadline.remaining() == 0.0
+    assert deadline.cap(5) == 0.0
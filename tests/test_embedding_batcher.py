@@ -0,0 +1,293 @@
+"""
+Embedding 微批处理与拆分测试
+"""
+
+import asyncio
+
+import pytest
+
+from llm_one_api.core import embedding_batcher as embedding_batcher_module
+from llm_one_api.core.deadline import Deadline
+from llm_one_api.core.embedding_batcher import (
+    EmbeddingBatcher,
+    get_embedding_batcher,
+    merge_responses,
+    normalize_inputs,
+    split_inputs,
+)
+from llm_one_api.utils import token_counter
+from llm_one_api.utils.exceptions import DeadlineExceededError, UpstreamError
+
+MODEL = "emb"
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # 不加载真实的 tokenizer，使用粗略估算
+    monkeypatch.setattr(token_counter, "_encoders", {MODEL: None})
+
+
+class FakeUpstream:
+    """记录每次发送的假上游，每条输入返回一个 embedding"""
+    
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.calls = []
+    
+    async def send(self, request_data, deadline, auth_result):
+        self.calls.append((request_data, deadline, auth_result))
+        await asyncio.sleep(self.delay)
+        
+        inputs = request_data["input"]
+        count = len(inputs) if isinstance(inputs, list) and not isinstance(inputs[0], int) else 1
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": [float(i)]} for i in range(count)],
+            "usage": {"prompt_tokens": count * 2, "total_tokens": count * 2},
+        }, "http://upstream"
+
+
+def make_batcher(upstream: FakeUpstream, **kwargs) -> EmbeddingBatcher:
+    kwargs.setdefault("max_wait_ms", 10)
+    return EmbeddingBatcher(MODEL, upstream.send, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "raw_input, expected",
+    [
+        ("hello", ("text", ["hello"])),
+        (["a", "b"], ("text", ["a", "b"])),
+        ([1, 2, 3], ("tokens", [[1, 2, 3]])),
+        ([[1, 2], [3]], ("tokens", [[1, 2], [3]])),
+        ([], None),
+        (["a", 1], None),
+        ([[1], "a"], None),
+        (None, None),
+    ],
+)
+def test_normalize_inputs(raw_input, expected):
+    assert normalize_inputs(raw_input) == expected
+
+
+async def test_requests_are_merged_and_split_back():
+    upstream = FakeUpstream()
+    batcher = make_batcher(upstream)
+    
+    results = await asyncio.gather(
+        batcher.submit({"model": MODEL, "input": "a"}),
+        batcher.submit({"model": MODEL, "input": ["b", "c"]}),
+    )
+    
+    assert len(upstream.calls) == 1
+    assert upstream.calls[0][0]["input"] == ["a", "b", "c"]
+    
+    (first, first_upstream), (second, _) = results
+    assert first_upstream == "http://upstream"
+    assert [item["index"] for item in first["data"]] == [0]
+    assert [item["embedding"] for item in second["data"]] == [[1.0], [2.0]]
+    assert [item["index"] for item in second["data"]] == [0, 1]
+    assert first["usage"]["total_tokens"] + second["usage"]["total_tokens"] == 6
+
+
+async def test_token_array_is_a_single_input():
+    upstream = FakeUpstream()
+    batcher = make_batcher(upstream)
+    
+    (single, _), (multi, _) = await asyncio.gather(
+        batcher.submit({"model": MODEL, "input": [1, 2, 3]}),
+        batcher.submit({"model": MODEL, "input": [[4], [5, 6]]}),
+    )
+    
+    assert len(upstream.calls) == 1
+    assert upstream.calls[0][0]["input"] == [[1, 2, 3], [4], [5, 6]]
+    assert len(single["data"]) == 1
+    assert len(multi["data"]) == 2
+
+
+async def test_text_and_token_inputs_are_not_mixed():
+    upstream = FakeUpstream()
+    batcher = make_batcher(upstream)
+    
+    await asyncio.gather(
+        batcher.submit({"model": MODEL, "input": "a"}),
+        batcher.submit({"model": MODEL, "input": [1, 2]}),
+    )
+    
+    assert sorted(str(call[0]["input"]) for call in upstream.calls) == ["['a']", "[[1, 2]]"]
+
+
+async def test_short_deadline_does_not_fail_other_callers():
+    upstream = FakeUpstream(delay=0.1)
+    batcher = make_batcher(upstream)
+    
+    short = asyncio.ensure_future(batcher.submit({"model": MODEL, "input": "a"}, Deadline(0.03)))
+    long = asyncio.ensure_future(batcher.submit({"model": MODEL, "input": "b"}, Deadline(5)))
+    
+    with pytest.raises(DeadlineExceededError):
+        await short
+    result, _ = await long
+    
+    assert len(result["data"]) == 1
+    # 批次使用最晚的截止时间
+    assert upstream.calls[0][1].remaining() > 1
+
+
+async def test_batch_without_deadline_if_any_caller_has_none():
+    upstream = FakeUpstream()
+    batcher = make_batcher(upstream)
+    
+    await asyncio.gather(
+        batcher.submit({"model": MODEL, "input": "a"}, Deadline(5)),
+        batcher.submit({"model": MODEL, "input": "b"}),
+    )
+    
+    assert upstream.calls[0][1] is None
+
+
+async def test_cancelled_first_caller_does_not_fail_batch():
+    upstream = FakeUpstream(delay=0.05)
+    batcher = make_batcher(upstream)
+    
+    first = asyncio.ensure_future(batcher.submit({"model": MODEL, "input": "a"}))
+    second = asyncio.ensure_future(batcher.submit({"model": MODEL, "input": "b"}))
+    await asyncio.sleep(0.03)
+    
+    first.cancel()
+    result, _ = await second
+    
+    assert first.cancelled()
+    assert len(result["data"]) == 1
+
+
+async def test_batch_uses_shared_tenant_only_when_callers_agree():
+    upstream = FakeUpstream()
+    batcher = make_batcher(upstream)
+    
+    await asyncio.gather(
+        batcher.submit({"model": MODEL, "input": "a"}, auth_result={"user_id": "u1"}),
+        batcher.submit({"model": MODEL, "input": "b"}, auth_result={"user_id": "u1"}),
+    )
+    await asyncio.gather(
+        batcher.submit({"model": MODEL, "input": "a"}, auth_result={"user_id": "u1", "priority": "batch"}),
+        batcher.submit({"model": MODEL, "input": "b"}, auth_result={"user_id": "u2"}),
+    )
+    
+    assert upstream.calls[0][2] == {"user_id": "u1", "priority": "interactive"}
+    assert upstream.calls[1][2] == {"user_id": f"embedding-batch:{MODEL}", "priority": "interactive"}
+
+
+async def test_cancelled_batch_resolves_all_callers():
+    upstream = FakeUpstream(delay=10)
+    batcher = make_batcher(upstream)
+    
+    callers = [asyncio.ensure_future(batcher.submit({"model": MODEL, "input": text})) for text in "ab"]
+    await asyncio.sleep(0.03)
+    
+    assert len(batcher._tasks) == 1
+    for task in list(batcher._tasks):
+        task.cancel()
+    
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert all(isinstance(result, UpstreamError) for result in results)
+
+
+async def test_upstream_error_is_passed_to_every_caller():
+    async def failing(request_data, deadline, auth_result):
+        raise UpstreamError("boom")
+    
+    batcher = EmbeddingBatcher(MODEL, failing, max_wait_ms=10)
+    results = await asyncio.gather(
+        batcher.submit({"model": MODEL, "input": "a"}),
+        batcher.submit({"model": MODEL, "input": "b"}),
+        return_exceptions=True,
+    )
+    
+    assert all(isinstance(result, UpstreamError) for result in results)
+
+
+async def test_batcher_is_rebuilt_when_config_changes(monkeypatch):
+    monkeypatch.setattr(embedding_batcher_module, "_batchers", {})
+    old_upstream, new_upstream = FakeUpstream(), FakeUpstream()
+    config = {
+        "model_name": MODEL,
+        "api_base": "http://old",
+        "api_key": "k",
+        "embedding_batching": {"enabled": True, "max_wait_ms": 50},
+    }
+    
+    batcher = get_embedding_batcher(config, old_upstream.send)
+    assert get_embedding_batcher(dict(config), new_upstream.send) is batcher
+    pending = asyncio.ensure_future(batcher.submit({"model": MODEL, "input": "a"}))
+    await asyncio.sleep(0.01)
+    
+    # 重新加载配置后创建新的批处理器，旧批处理器还未发送的批次也使用新的发送函数
+    reloaded = dict(config, api_base="http://new")
+    rebuilt = get_embedding_batcher(reloaded, new_upstream.send)
+    assert rebuilt is not batcher
+    assert get_embedding_batcher(reloaded, old_upstream.send) is rebuilt
+    await pending
+    assert not old_upstream.calls and len(new_upstream.calls) == 1
+    
+    resized = dict(reloaded, embedding_batching={"enabled": True, "max_wait_ms": 50, "max_batch_size": 8})
+    assert get_embedding_batcher(resized, new_upstream.send).max_batch_size == 8
+    assert get_embedding_batcher(dict(resized, embedding_batching={"enabled": False}), new_upstream.send) is None
+
+
+def test_split_inputs():
+    assert split_inputs([1, 1, 1, 1, 1], max_batch_size=2) == [(0, 2), (2, 4), (4, 5)]
+    assert split_inputs([5, 5, 20, 1], max_batch_tokens=10) == [(0, 2), (2, 3), (3, 4)]
+    assert split_inputs([1, 1], max_batch_size=5, max_batch_tokens=100) == [(0, 2)]
+
+
+def test_merge_responses_renumbers_and_sums_usage():
+    merged = merge_responses([
+        {"model": MODEL, "data": [{"index": 1, "embedding": [1]}, {"index": 0, "embedding": [0]}],
+         "usage": {"prompt_tokens": 3, "total_tokens": 3}},
+        {"model": MODEL, "data": [{"index": 0, "embedding": [2]}],
+         "usage": {"prompt_tokens": 2, "total_tokens": 2}},
+    ])
+    
+    assert [item["embedding"] for item in merged["data"]] == [[0], [1], [2]]
+    assert [item["index"] for item in merged["data"]] == [0, 1, 2]
+    assert merged["usage"] == {"prompt_tokens": 5, "total_tokens": 5}
+
+
+@pytest.fixture
+def splitting_forwarder(monkeypatch):
+    from llm_one_api.core.forwarder import NonStreamForwarder
+    
+    forwarder = NonStreamForwarder(
+        {"model_name": "emb-split", "api_base": "http://upstream", "api_key": "k", "max_batch_size": 2},
+        plugin_manager=None,
+    )
+    upstream = FakeUpstream()
+    
+    async def send_chunk(request_data, auth_result=None):
+        response_data, _ = await upstream.send(request_data, None, auth_result)
+        return response_data
+    
+    monkeypatch.setattr(forwarder, "_send_embedding_chunk", send_chunk)
+    return forwarder, upstream
+
+
+async def test_splitter_splits_multiple_inputs(splitting_forwarder):
+    forwarder, upstream = splitting_forwarder
+    
+    response = await forwarder._send_embedding({"model": MODEL, "input": ["a", "b", "c", "d", "e"]})
+    
+    assert [call[0]["input"] for call in upstream.calls] == [["a", "b"], ["c", "d"], ["e"]]
+    assert [item["index"] for item in response["data"]] == [0, 1, 2, 3, 4]
+    
+    upstream.calls.clear()
+    response = await forwarder._send_embedding({"model": MODEL, "input": [[1], [2], [3]]})
+    assert [call[0]["input"] for call in upstream.calls] == [[[1], [2]], [[3]]]
+    assert len(response["data"]) == 3
+
+
+async def test_splitter_keeps_single_token_array_whole(splitting_forwarder):
+    forwarder, upstream = splitting_forwarder
+    
+    response = await forwarder._send_embedding({"model": MODEL, "input": [1, 2, 3, 4, 5]})
+    
+    assert [call[0]["input"] for call in upstream.calls] == [[1, 2, 3, 4, 5]]
+    assert len(response["data"]) == 1
@@ -0,0 +1,199 @@
+"""
+负载均衡器测试
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from llm_one_api.api.dependencies import get_current_settings, get_plugin_manager, verify_api_key
+from llm_one_api.api.routes import stats as stats_route
+from llm_one_api.config.settings import Settings
+from llm_one_api.core import load_balancer as load_balancer_module
+from llm_one_api.core.load_balancer import LoadBalancer, get_load_balancer
+
+
+def make_balancer(**kwargs) -> LoadBalancer:
+    kwargs.setdefault("max_failures", 2)
+    kwargs.setdefault("health_check_interval", 30)
+    return LoadBalancer(
+        [{"api_base": "http://a", "api_key": "k"}, {"api_base": "http://b", "api_key": "k"}],
+        **kwargs,
+    )
+
+
+def trip(balancer: LoadBalancer, server):
+    for _ in range(balancer.max_failures):
+        balancer.mark_request_start(server)
+        balancer.mark_request_failure(server, RuntimeError("boom"))
+
+
+def pick(balancer: LoadBalancer, count: int = 100) -> list:
+    picks = []
+    for _ in range(count):
+        server = balancer.get_server()
+        balancer.mark_request_start(server)
+        balancer.mark_request_success(server)
+        picks.append(server.api_base)
+    return picks
+
+
+def test_tripped_upstream_is_probed_after_cooldown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(load_balancer_module.time, "time", lambda: now[0])
+    balancer = make_balancer()
+    bad = balancer.servers[0]
+    
+    trip(balancer, bad)
+    assert not bad.healthy
+    assert "http://a" not in pick(balancer)
+    
+    # 冷却结束后放行一个探测请求，成功后恢复轮换
+    now[0] += 31
+    probe = balancer.get_server()
+    assert probe is bad and bad.probing
+    assert balancer.get_server() is balancer.servers[1]
+    
+    balancer.mark_request_start(probe)
+    balancer.mark_request_success(probe)
+    assert bad.healthy and not bad.probing
+    assert pick(balancer).count("http://a") == 50
+
+
+def test_failed_probe_restarts_cooldown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(load_balancer_module.time, "time", lambda: now[0])
+    balancer = make_balancer()
+    bad = balancer.servers[0]
+    
+    trip(balancer, bad)
+    now[0] += 31
+    probe = balancer.get_server()
+    balancer.mark_request_start(probe)
+    balancer.mark_request_failure(probe, RuntimeError("still down"))
+    
+    assert not bad.healthy and not bad.probing
+    assert bad.retry_at == now[0] + 30
+    assert "http://a" not in pick(balancer)
+
+
+def test_cancelled_probe_can_be_retried(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(load_balancer_module.time, "time", lambda: now[0])
+    balancer = make_balancer()
+    bad = balancer.servers[0]
+    
+    trip(balancer, bad)
+    now[0] += 31
+    probe = balancer.get_server()
+    balancer.mark_request_start(probe)
+    balancer.mark_request_cancelled(probe)
+    
+    assert balancer.get_server() is bad
+
+
+def test_load_balancer_reused_until_config_changes(monkeypatch):
+    monkeypatch.setattr(load_balancer_module, "_balancers", {})
+    monkeypatch.setattr(load_balancer_module, "_fingerprints", {})
+    dumps = []
+    real_dumps = load_balancer_module.json.dumps
+    monkeypatch.setattr(load_balancer_module.json, "dumps", lambda *a, **k: dumps.append(1) or real_dumps(*a, **k))
+    
+    upstreams = [{"api_base": "http://a", "api_key": "k"}, {"api_base": "http://b", "api_key": "k"}]
+    first = get_load_balancer({"model_name": "m", "upstreams": upstreams})
+    
+    # 每次请求构造新的配置字典，但字段引用同一批对象：不重新序列化
+    for _ in range(10):
+        assert get_load_balancer({"model_name": "m", "upstreams": upstreams}) is first
+    assert len(dumps) == 1
+    
+    # 重新加载出内容相同的配置：沿用原来的负载均衡器
+    reloaded = [dict(upstream) for upstream in upstreams]
+    assert get_load_balancer({"model_name": "m", "upstreams": reloaded}) is first
+    
+    changed = reloaded + [{"api_base": "http://c", "api_key": "k"}]
+    assert get_load_balancer({"model_name": "m", "upstreams": changed}) is not first
+
+
+def test_circuit_state_half_opens_after_cooldown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(load_balancer_module.time, "time", lambda: now[0])
+    balancer = make_balancer()
+    bad = balancer.servers[0]
+    
+    trip(balancer, bad)
+    assert bad.circuit_state == "open"
+    
+    now[0] += 31
+    assert bad.circuit_state == "half_open"
+    probe = balancer.get_server()
+    assert probe is bad and bad.circuit_state == "half_open"
+    
+    balancer.mark_request_start(probe)
+    balancer.mark_request_success(probe)
+    assert bad.circuit_state == "closed"
+
+
+class FakePluginManager:
+    async def list_models(self):
+        return ["multi"]
+    
+    async def get_model_config(self, model_name):
+        return {"model_name": model_name, "upstreams": [{}]}
+
+
+def make_stats_client(monkeypatch, now) -> TestClient:
+    monkeypatch.setattr(load_balancer_module.time, "time", lambda: now[0])
+    monkeypatch.setattr(load_balancer_module, "_balancers", {})
+    monkeypatch.setattr(load_balancer_module, "_snapshot", (0.0, None))
+    
+    plugin_manager = FakePluginManager()
+    app = FastAPI()
+    app.include_router(stats_route.router, prefix="/v1")
+    app.dependency_overrides[get_plugin_manager] = lambda: plugin_manager
+    app.dependency_overrides[verify_api_key] = lambda: {"success": True, "user_id": "alice"}
+    app.dependency_overrides[get_current_settings] = lambda: Settings(profiling={"admin_token": "admin-secret"})
+    return TestClient(app)
+
+
+def test_detailed_health_recovers_from_unhealthy_after_cooldown(monkeypatch):
+    now = [1000.0]
+    client = make_stats_client(monkeypatch, now)
+    balancer = get_load_balancer({
+        "model_name": "multi",
+        "upstreams": [{"api_base": "http://a", "api_key": "k"}, {"api_base": "http://b", "api_key": "k"}],
+        "max_failures": 1,
+        "health_check_interval": 30,
+    })
+    for server in balancer.servers:
+        trip(balancer, server)
+    
+    response = client.get("/v1/health/detailed")
+    assert response.status_code == 503
+    assert response.json()["models"]["multi"]["status"] == "unhealthy"
+    
+    # 冷却结束后上游进入 half_open，不再一直报告 503
+    now[0] += 31
+    response = client.get("/v1/health/detailed")
+    assert response.status_code == 200
+    model = response.json()["models"]["multi"]
+    assert model["status"] == "degraded"
+    assert model["recovering_upstreams"] == 2
+
+
+def test_load_balancer_stats_hide_upstreams_from_non_admins(monkeypatch):
+    client = make_stats_client(monkeypatch, [1000.0])
+    get_load_balancer({
+        "model_name": "multi",
+        "upstreams": [{"api_base": "http://10.0.0.5/v1", "api_key": "sk-secret-1"}],
+    })
+    
+    servers = client.get("/v1/stats/load_balancers").json()["models"]["multi"]["servers"]
+    assert "api_base" not in servers[0] and "keys" not in servers[0]
+    model = client.get("/v1/stats/models/multi").json()
+    assert "api_base" not in model["config"]
+    assert "api_base" not in model["load_balancer"]["servers"][0]
+    
+    headers = {"X-Admin-Token": "admin-secret"}
+    servers = client.get("/v1/stats/load_balancers", headers=headers).json()["models"]["multi"]["servers"]
+    assert servers[0]["api_base"] == "http://10.0.0.5/v1"
+    assert "keys" in servers[0]
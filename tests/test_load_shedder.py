@@ -0,0 +1,88 @@
+"""
+过载保护（CoDel）测试
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from llm_one_api.core.load_balancer import SingleServerWrapper
+from llm_one_api.core.load_shedder import LoadShedder
+from llm_one_api.utils.exceptions import OverloadedError
+
+
+def end_interval(shedder: LoadShedder, priority: str = "interactive"):
+    shedder._states[priority].interval_start -= shedder.interval
+
+
+def test_sheds_when_min_wait_stays_above_target():
+    shedder = LoadShedder(enabled=True, interval_ms=1000, target_ms={"interactive": 100})
+    
+    for wait in (0.3, 0.2, 0.5):
+        shedder.observe("interactive", wait)
+    assert not shedder.should_shed("interactive", lambda: 0.0)
+    
+    end_interval(shedder)
+    assert shedder.should_shed("interactive", lambda: 0.0)
+    assert not shedder.should_shed("batch", lambda: 0.0)
+    
+    # 下一个区间内有请求几乎不用等待，恢复接收
+    shedder.observe("interactive", 0.01)
+    end_interval(shedder)
+    assert not shedder.should_shed("interactive", lambda: 0.0)
+    assert shedder.get_stats()["total_shed"] == {"interactive": 1, "batch": 0}
+
+
+def test_short_wait_in_interval_keeps_accepting():
+    shedder = LoadShedder(enabled=True, interval_ms=1000, target_ms={"interactive": 100})
+    
+    for wait in (0.3, 0.05, 0.5):
+        shedder.observe("interactive", wait)
+    end_interval(shedder)
+    
+    assert not shedder.should_shed("interactive", lambda: 0.0)
+
+
+def test_stalled_queue_without_grants_sheds():
+    shedder = LoadShedder(enabled=True, interval_ms=1000, target_ms={"interactive": 100})
+    end_interval(shedder)
+    
+    assert shedder.should_shed("interactive", lambda: 0.5)
+
+
+async def test_overloaded_balancer_rejects_fast_with_retry_after():
+    balancer = SingleServerWrapper(
+        "http://upstream",
+        "k",
+        max_inflight=1,
+        load_shedding={"enabled": True, "interval_ms": 1000, "target_ms": {"interactive": 100}, "retry_after": 3},
+    )
+    server = await balancer.acquire()
+    
+    queued = asyncio.ensure_future(balancer.acquire())
+    await asyncio.sleep(0)
+    # 第一个区间内的请求不用等待即拿到名额，不拒绝
+    end_interval(balancer.shedder)
+    balancer.check_admission()
+    
+    # 下一个区间内没有请求拿到名额，排队最久的请求已超过目标等待时间
+    balancer.scheduler._queues["interactive"][0].enqueued_at -= 1
+    end_interval(balancer.shedder)
+    
+    start = time.monotonic()
+    with pytest.raises(OverloadedError) as exc_info:
+        await asyncio.wait_for(balancer.acquire(), timeout=1)
+    assert time.monotonic() - start < 0.1
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "3"
+    assert len(balancer.scheduler) == 1
+    
+    with pytest.raises(OverloadedError):
+        balancer.check_admission()
+    
+    # 批处理请求的目标等待时间更长，仍然可以排队
+    balancer.check_admission({"user_id": "u", "metadata": {"priority": "batch"}})
+    
+    balancer.mark_request_cancelled(server)
+    assert await asyncio.wait_for(queued, timeout=1) is server
@@ -0,0 +1,60 @@
+"""
+性能分析测试
+"""
+
+import asyncio
+
+import pytest
+
+from llm_one_api.core import profiler
+from llm_one_api.core.profiler import run_profile, validate_profile_request
+from llm_one_api.utils.exceptions import ProfilingInProgressError, ValidationError
+
+
+def test_validate_defaults_output_format():
+    assert validate_profile_request("sample", None, 10, 0.01, 60) == "collapsed"
+    assert validate_profile_request("cprofile", None, 10, 0.01, 60) == "pstats"
+    assert validate_profile_request("cprofile", "text", 60, 0.01, 60) == "text"
+
+
+@pytest.mark.parametrize(
+    "mode, output, duration, interval",
+    [
+        ("tracemalloc", None, 10, 0.01),    # 不支持的模式
+        ("sample", "pstats", 10, 0.01),     # 模式与格式不匹配
+        ("cprofile", "svg", 10, 0.01),
+        ("sample", None, 61, 0.01),         # 超过 max_duration
+        ("sample", None, 0, 0.01),
+        ("sample", None, 10, 0.0001),       # 采样间隔过小
+    ],
+)
+def test_validate_rejects_invalid_request(mode, output, duration, interval):
+    with pytest.raises(ValidationError):
+        validate_profile_request(mode, output, duration, interval, max_duration=60)
+
+
+async def test_concurrent_session_rejected():
+    first = asyncio.create_task(run_profile("sample", "collapsed", 0.3, 0.01))
+    await asyncio.sleep(0.05)
+    
+    with pytest.raises(ProfilingInProgressError):
+        await run_profile("sample", "collapsed", 0.1, 0.01)
+    
+    result = await first
+    assert result.samples > 0
+    assert b"task:" in result.content
+    
+    # 会话结束后可以再次运行
+    assert not profiler._running
+    result = await run_profile("sample", "collapsed", 0.05, 0.01)
+    assert result.samples > 0
+
+
+async def test_cancelled_session_releases_lock():
+    task = asyncio.create_task(run_profile("sample", "collapsed", 5, 0.01))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert not profiler._running
@@ -0,0 +1,135 @@
+"""
+重试策略测试
+"""
+
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from llm_one_api.core import load_balancer as load_balancer_module
+from llm_one_api.core import retry as retry_module
+from llm_one_api.core.forwarder import NonStreamForwarder
+from llm_one_api.core.retry import RetryBudget, RetryPolicy, parse_retry_after
+
+
+def status_error(status_code: int, headers=None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://upstream/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status_code}", request=request, response=response)
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (status_error(429), True),
+        (status_error(500), True),
+        (status_error(503), True),
+        (status_error(400), False),
+        (status_error(401), False),
+        (status_error(404), False),
+        (status_error(422), False),
+        (httpx.ConnectError("refused"), True),
+        (httpx.ReadTimeout("slow"), True),
+        (httpx.RemoteProtocolError("reset"), True),
+        (ValueError("bad json"), False),
+    ],
+)
+def test_error_classification(error, retryable):
+    assert RetryPolicy().is_retryable(error) is retryable
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(status_error(429, {"retry-after": "2"}).response) == 2.0
+    assert parse_retry_after(status_error(429, {"retry-after-ms": "1500", "retry-after": "9"}).response) == 1.5
+    assert parse_retry_after(status_error(429, {"retry-after": "soon"}).response) is None
+    assert parse_retry_after(status_error(429).response) is None
+    
+    http_date = formatdate(time.time() + 10, usegmt=True)
+    assert 8 <= parse_retry_after(status_error(503, {"retry-after": http_date}).response) <= 10
+
+
+def test_delay_uses_backoff_and_retry_after():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0, max_retry_after=30)
+    
+    for attempt in range(1, 6):
+        assert 0 <= policy.get_delay(attempt, status_error(503)) <= min(2.0, 0.5 * 2 ** (attempt - 1))
+    
+    assert policy.get_delay(1, status_error(429, {"retry-after": "5"})) >= 5
+    assert policy.get_delay(1, status_error(429, {"retry-after": "60"})) is None
+
+
+def test_retry_budget_is_exhausted_and_refilled_by_requests():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=2)
+    
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+    
+    budget.record_request()
+    assert not budget.try_acquire()
+    budget.record_request()
+    assert budget.try_acquire()
+    assert budget.get_stats()["total_rejected"] == 2
+
+
+@pytest.fixture
+def forwarder(monkeypatch):
+    monkeypatch.setattr(load_balancer_module, "_balancers", {})
+    monkeypatch.setattr(retry_module, "_retry_budget", RetryBudget(max_tokens=10))
+    return NonStreamForwarder(
+        {
+            "model_name": "retry-test",
+            "api_base": "http://upstream",
+            "api_key": "k",
+            "retry": {"max_attempts": 3, "base_delay": 0.001, "max_delay": 0.001},
+        },
+        plugin_manager=None,
+    )
+
+
+def failing(*errors):
+    calls = []
+    
+    async def request_func(server):
+        calls.append(server)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return {"ok": True}
+    
+    return request_func, calls
+
+
+async def test_retryable_errors_are_retried(forwarder):
+    request_func, calls = failing(status_error(503), httpx.ConnectError("refused"))
+    
+    assert await forwarder._execute_with_retry(request_func) == {"ok": True}
+    assert len(calls) == 3
+
+
+async def test_fatal_errors_are_not_retried(forwarder):
+    request_func, calls = failing(status_error(400))
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await forwarder._execute_with_retry(request_func)
+    assert len(calls) == 1
+    # 客户端错误不影响上游健康状态
+    assert forwarder.load_balancer.servers[0].consecutive_failures == 0
+
+
+async def test_retry_after_above_limit_stops_retrying(forwarder):
+    request_func, calls = failing(status_error(503, {"retry-after": "120"}))
+    
+    with pytest.raises(httpx.HTTPStatusError):
+        await forwarder._execute_with_retry(request_func)
+    assert len(calls) == 1
+
+
+async def test_exhausted_retry_budget_stops_retrying(forwarder, monkeypatch):
+    monkeypatch.setattr(retry_module, "_retry_budget", RetryBudget(ratio=0, min_per_second=0, max_tokens=1))
+    
+    request_func, calls = failing(status_error(503), status_error(503))
+    with pytest.raises(httpx.HTTPStatusError):
+        await forwarder._execute_with_retry(request_func)
+    assert len(calls) == 2
+    assert retry_module.get_retry_budget().get_stats()["total_rejected"] == 1
@@ -0,0 +1,100 @@
+"""
+请求调度器测试
+"""
+
+import asyncio
+
+import pytest
+
+from llm_one_api.core import scheduler as scheduler_module
+from llm_one_api.core.load_balancer import SingleServerWrapper
+from llm_one_api.core.scheduler import FairScheduler, resolve_tenant
+from llm_one_api.utils.exceptions import UpstreamError
+
+
+def test_resolve_tenant():
+    assert resolve_tenant(None) == ("anonymous", 1.0, "interactive")
+    assert resolve_tenant({"user_id": "u", "metadata": {"weight": "2", "priority": "batch"}}) == ("u", 2.0, "batch")
+    assert resolve_tenant({"user_id": "u", "metadata": {"weight": "x", "priority": "bogus"}}) == ("u", 1.0, "interactive")
+
+
+async def test_interactive_before_batch_and_fair_within_priority():
+    scheduler = FairScheduler()
+    
+    for tenant in ("heavy", "heavy", "heavy", "light"):
+        scheduler.enqueue(tenant)
+    scheduler.enqueue("bulk", priority="batch")
+    
+    order = [scheduler.pop().tenant for _ in range(5)]
+    assert order == ["heavy", "light", "heavy", "heavy", "bulk"]
+    assert scheduler.pop() is None
+
+
+async def test_cancelled_waiters_release_queue_slots():
+    scheduler = FairScheduler(max_queue=2)
+    
+    first = scheduler.enqueue("a")
+    scheduler.enqueue("b")
+    with pytest.raises(UpstreamError):
+        scheduler.enqueue("c")
+    
+    scheduler.cancel(first)
+    scheduler.cancel(first)
+    assert len(scheduler) == 1
+    assert first.future.cancelled()
+    assert scheduler.get_stats()["queued"] == {"interactive": 1, "batch": 0}
+    
+    scheduler.enqueue("c")
+    assert [scheduler.pop().tenant for _ in range(2)] == ["b", "c"]
+    assert len(scheduler) == 0
+
+
+async def test_oldest_wait_ignores_cancelled_and_popped_waiters():
+    scheduler = FairScheduler()
+    assert scheduler.oldest_wait("interactive") == 0.0
+    
+    first = scheduler.enqueue("a")
+    first.enqueued_at -= 100
+    second = scheduler.enqueue("b")
+    second.enqueued_at -= 10
+    
+    assert scheduler.oldest_wait("interactive") >= 100
+    scheduler.cancel(first)
+    assert 10 <= scheduler.oldest_wait("interactive") < 100
+    
+    scheduler.pop()
+    assert scheduler.oldest_wait("interactive") == 0.0
+
+
+async def test_queues_are_compacted(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "_COMPACT_THRESHOLD", 4)
+    scheduler = FairScheduler()
+    
+    waiters = [scheduler.enqueue("a") for _ in range(20)]
+    for waiter in waiters[:15]:
+        scheduler.cancel(waiter)
+    
+    assert len(scheduler._queues["interactive"]) <= 2 * len(scheduler) + 4
+    assert len(scheduler._arrivals["interactive"]) <= 2 * len(scheduler) + 4
+    assert [scheduler.pop() for _ in range(5)] == waiters[15:]
+
+
+async def test_cancelled_acquire_leaves_queue():
+    balancer = SingleServerWrapper("http://upstream", "k", max_inflight=1, max_queue=1)
+    server = await balancer.acquire()
+    
+    waiting = asyncio.ensure_future(balancer.acquire())
+    await asyncio.sleep(0)
+    assert len(balancer.scheduler) == 1
+    
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert len(balancer.scheduler) == 0
+    
+    # 名额已释放，新请求可以排队并在上游空闲后分配到服务器
+    queued = asyncio.ensure_future(balancer.acquire())
+    await asyncio.sleep(0)
+    balancer.mark_request_cancelled(server)
+    assert await asyncio.wait_for(queued, timeout=1) is server
+    assert server.active_connections == 1
@@ -0,0 +1,88 @@
+"""
+分位数 sketch 测试
+"""
+
+import math
+import random
+
+import pytest
+
+from llm_one_api.utils.sketch import DDSketch
+
+QUANTILES = (0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999, 1.0)
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[math.floor(q * (len(ordered) - 1))]
+
+
+def assert_within_accuracy(sketch: DDSketch, values, quantiles=QUANTILES):
+    for q in quantiles:
+        expected = exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - expected) <= sketch.relative_accuracy * expected * (1 + 1e-9), q
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.02, 0.05])
+@pytest.mark.parametrize(
+    "distribution",
+    [
+        lambda rng: rng.lognormvariate(0, 1.5),      # 长尾延迟
+        lambda rng: rng.uniform(0.001, 60),
+        lambda rng: rng.expovariate(10),
+    ],
+)
+def test_quantile_error_within_relative_accuracy(relative_accuracy, distribution):
+    rng = random.Random(42)
+    values = [distribution(rng) for _ in range(20000)]
+    
+    sketch = DDSketch(relative_accuracy)
+    for value in values:
+        sketch.add(value)
+    
+    assert_within_accuracy(sketch, values)
+    assert sketch.count == len(values)
+    assert sketch.avg == pytest.approx(sum(values) / len(values))
+
+
+def test_merged_sketch_keeps_accuracy():
+    rng = random.Random(7)
+    parts = [[rng.lognormvariate(i, 1) for _ in range(3000)] for i in range(4)]
+    
+    merged = DDSketch(0.01)
+    for part in parts:
+        sketch = DDSketch(0.01)
+        for value in part:
+            sketch.add(value)
+        merged.merge(sketch)
+    
+    assert_within_accuracy(merged, [value for part in parts for value in part])
+    
+    with pytest.raises(ValueError):
+        merged.merge(DDSketch(0.02))
+
+
+def test_collapsing_bins_only_affects_lowest_quantiles():
+    rng = random.Random(3)
+    # 跨越 9 个数量级（约 1000 个桶），上限只保留最高的约 1.7 个数量级
+    values = [10 ** rng.uniform(-6, 3) for _ in range(20000)]
+    
+    sketch = DDSketch(0.01, max_bins=200)
+    for value in values:
+        sketch.add(value)
+    
+    assert len(sketch.bins) <= 200
+    assert_within_accuracy(sketch, values, quantiles=(0.9, 0.95, 0.99, 1.0))
+    # 被合并的低分位数只会偏高，不会低于真实值
+    assert sketch.quantile(0.5) >= exact_quantile(values, 0.5)
+
+
+def test_zero_values_and_empty_sketch():
+    sketch = DDSketch(0.01)
+    assert sketch.quantile(0.5) is None
+    assert sketch.quantiles((0.5,)) == {"p50": None}
+    
+    for value in [0.0] * 60 + [1.0] * 40:
+        sketch.add(value)
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(0.99) == pytest.approx(1.0, rel=0.01)
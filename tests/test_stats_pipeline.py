@@ -0,0 +1,91 @@
+"""
+异步统计管道测试
+"""
+
+import asyncio
+
+import pytest
+
+from llm_one_api.plugins.stats_pipeline import StatsPipeline
+
+
+class RecordingPlugin:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.batches = []
+    
+    async def record_batch(self, batch):
+        await asyncio.sleep(self.delay)
+        self.batches.append([record["n"] for record in batch])
+    
+    @property
+    def records(self):
+        return [n for batch in self.batches for n in batch]
+
+
+class FailingPlugin:
+    async def record_batch(self, batch):
+        raise RuntimeError("disk full")
+
+
+def submit(pipeline: StatsPipeline, count: int):
+    for n in range(count):
+        pipeline.submit({"n": n})
+
+
+@pytest.mark.parametrize("overflow, kept", [("drop_oldest", [2, 3, 4]), ("drop_newest", [0, 1, 2])])
+async def test_overflow_drops_records(overflow, kept):
+    plugin = RecordingPlugin()
+    pipeline = StatsPipeline([plugin], max_queue=3, batch_size=10, overflow=overflow)
+    
+    submit(pipeline, 5)
+    assert pipeline.get_stats()["queued"] == 3
+    assert pipeline.total_dropped == 2
+    
+    await pipeline.stop()
+    assert plugin.records == kept
+    assert pipeline.get_stats()["total_delivered"] == 3
+
+
+def test_invalid_overflow_policy():
+    with pytest.raises(ValueError):
+        StatsPipeline([], overflow="block")
+
+
+async def test_full_batches_are_delivered_in_background():
+    plugin = RecordingPlugin()
+    pipeline = StatsPipeline([plugin], batch_size=2, flush_interval=10)
+    pipeline.start()
+    
+    submit(pipeline, 5)
+    await asyncio.sleep(0.01)
+    assert plugin.batches == [[0, 1], [2, 3], [4]]
+    await pipeline.stop()
+
+
+async def test_remaining_records_are_flushed_at_shutdown():
+    plugin = RecordingPlugin()
+    pipeline = StatsPipeline([FailingPlugin(), plugin], batch_size=100, flush_interval=10)
+    pipeline.start()
+    
+    # 不足一批且未到 flush_interval，只有关闭时才会交付
+    submit(pipeline, 5)
+    await asyncio.sleep(0.01)
+    assert plugin.records == []
+    
+    await pipeline.stop()
+    assert plugin.records == [0, 1, 2, 3, 4]
+    assert pipeline.get_stats()["plugin_errors"] == {"FailingPlugin": 1}
+
+
+async def test_shutdown_flush_is_bounded_by_timeout():
+    plugin = RecordingPlugin(delay=1)
+    pipeline = StatsPipeline([plugin], batch_size=1, shutdown_timeout=0.05)
+    
+    submit(pipeline, 3)
+    await pipeline.stop()
+    
+    # 正在交付的记录和队列中剩余的记录都计入丢弃
+    assert plugin.records == []
+    assert pipeline.total_dropped == 3
+    assert pipeline.get_stats()["queued"] == 0
@@ -0,0 +1,75 @@
+"""
+流式响应计时与超时看门狗测试
+"""
+
+import asyncio
+
+import pytest
+
+from llm_one_api.core.stream_timing import StreamTiming, StreamWatchdog, has_content
+
+
+def test_has_content():
+    assert has_content({"choices": [{"delta": {"content": "hi"}}]})
+    assert has_content({"choices": [{"text": "hi"}]})
+    assert not has_content({"choices": [{"delta": {"role": "assistant"}}]})
+    assert not has_content({"usage": {"total_tokens": 3}})
+
+
+def test_timing_summary():
+    timing = StreamTiming(10.0)
+    
+    assert timing.on_chunk(10.5) is None
+    assert timing.on_chunk(11.0) == 0.5
+    assert timing.on_chunk(12.0) == 1.0
+    
+    summary = timing.summary(completion_tokens=5)
+    assert summary["ttft"] == 0.5
+    assert summary["tokens_per_second"] == 2.67
+    assert summary["inter_token_latency"]["count"] == 2
+    assert summary["inter_token_latency"]["max"] == 1.0
+
+
+async def test_watchdog_times_out_stalled_step():
+    watchdog = StreamWatchdog()
+    
+    with pytest.raises(asyncio.TimeoutError):
+        await watchdog.wait(asyncio.sleep(10), 0.02)
+    watchdog.close()
+    
+    # 超时被转换后当前任务不再处于取消状态
+    task = asyncio.current_task()
+    if hasattr(task, "cancelling"):
+        assert task.cancelling() == 0
+    await asyncio.sleep(0)
+
+
+async def test_watchdog_is_reset_per_step_without_creating_tasks():
+    watchdog = StreamWatchdog()
+    tasks_before = len(asyncio.all_tasks())
+    
+    # 总耗时超过单步超时，但每一步都在超时之内
+    for _ in range(30):
+        assert await watchdog.wait(asyncio.sleep(0.01, result="ok"), 0.2) == "ok"
+        assert len(asyncio.all_tasks()) == tasks_before
+    
+    # 未在等待时到期不会取消任务
+    await asyncio.sleep(0.3)
+    assert await watchdog.wait(asyncio.sleep(0, result="ok"), None) == "ok"
+    watchdog.close()
+
+
+async def test_external_cancellation_is_not_reported_as_timeout():
+    async def consume():
+        watchdog = StreamWatchdog()
+        try:
+            await watchdog.wait(asyncio.sleep(10), 5)
+        finally:
+            watchdog.close()
+    
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    
+    with pytest.raises(asyncio.CancelledError):
+        await task
@@ -0,0 +1,102 @@
+"""
+token_counter 测试
+"""
+
+import threading
+
+import pytest
+
+from llm_one_api.utils import token_counter
+
+
+class WordEncoder:
+    """按空格分词的假编码器"""
+    
+    def encode_ordinary(self, text):
+        return text.split()
+    
+    def encode_ordinary_batch(self, texts, num_threads=8):
+        raise AssertionError("不应使用会新建线程池的批量接口")
+
+
+@pytest.fixture
+def word_encoder(monkeypatch):
+    monkeypatch.setattr(token_counter, "_encoders", {"fake": WordEncoder()})
+    return "fake"
+
+
+def test_count_tokens_batch_encodes_each_text(word_encoder):
+    assert token_counter.count_tokens_batch(["a b", "c", ""], word_encoder) == [2, 1, 0]
+    assert token_counter.count_tokens_batch([], word_encoder) == []
+
+
+def test_count_chat_tokens(word_encoder):
+    messages = [
+        {"role": "system", "content": "be brief"},
+        {"role": "user", "content": "hello there friend"},
+    ]
+    # 3 + 每条消息 4 + role/content 的 token 数
+    assert token_counter.count_chat_tokens(messages, word_encoder) == 3 + 8 + (1 + 2) + (1 + 3)
+
+
+async def test_async_counters_match_sync(word_encoder, monkeypatch):
+    text = "x " * 10
+    assert await token_counter.acount_tokens(text, word_encoder) == 10
+    
+    # 超过阈值时在线程池中计算，结果一致
+    monkeypatch.setattr(token_counter, "OFFLOAD_THRESHOLD_CHARS", 1)
+    assert await token_counter.acount_tokens(text, word_encoder) == 10
+    assert await token_counter.acount_tokens_batch([text, "y"], word_encoder) == [10, 1]
+
+
+@pytest.fixture
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(token_counter, "_encoders", {})
+    monkeypatch.setattr(token_counter, "_encoder_failures", {})
+    monkeypatch.setattr(token_counter, "_encoders_loading", set())
+
+
+def test_failed_load_is_retried_after_interval(fresh_registry, monkeypatch):
+    attempts = []
+    
+    def flaky_load(model):
+        attempts.append(model)
+        if len(attempts) == 1:
+            raise OSError("download failed")
+        return WordEncoder()
+    
+    monkeypatch.setattr(token_counter, "_load_encoder", flaky_load)
+    
+    assert token_counter.get_encoder("m") is None
+    # 重试间隔内不再尝试
+    assert token_counter.get_encoder("m") is None
+    assert len(attempts) == 1
+    
+    token_counter._encoder_failures["m"] = 0
+    assert isinstance(token_counter.get_encoder("m"), WordEncoder)
+    assert token_counter.count_tokens("a b c", "m") == 3
+    assert len(attempts) == 2
+
+
+def test_concurrent_lookup_does_not_wait_for_loading(fresh_registry, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    
+    def slow_load(model):
+        started.set()
+        release.wait(5)
+        return WordEncoder()
+    
+    monkeypatch.setattr(token_counter, "_load_encoder", slow_load)
+    
+    loader = threading.Thread(target=token_counter.get_encoder, args=("m",))
+    loader.start()
+    assert started.wait(5)
+    
+    # 其他线程正在加载时立即返回，使用粗略估算
+    assert token_counter.get_encoder("m") is None
+    assert token_counter.count_tokens("abcdefgh", "m") == 2
+    
+    release.set()
+    loader.join(5)
+    assert isinstance(token_counter.get_encoder("m"), WordEncoder)
@@ -0,0 +1,43 @@
+"""
+链路追踪测试
+"""
+
+import queue
+
+from llm_one_api.core.tracing import Tracer
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SAMPLED_PARENT = f"00-{TRACE_ID}-00f067aa0ba902b7-01"
+
+
+def make_tracer(**config) -> Tracer:
+    tracer = Tracer()
+    tracer.configure(dict({"enabled": True, "export_path": "", "server_timing": False}, **config))
+    # 不启动导出线程，只提供导出队列
+    tracer._queue = queue.Queue()
+    return tracer
+
+
+def test_incoming_sampled_flag_is_ignored_by_default():
+    tracer = make_tracer(sample_rate=0.0)
+    
+    assert tracer.start_trace("request", SAMPLED_PARENT) is None
+    
+    tracer.server_timing = True
+    trace = tracer.start_trace("request", SAMPLED_PARENT)
+    assert trace.trace_id == TRACE_ID and not trace.sampled
+
+
+def test_incoming_sampled_flag_is_honored_when_trusted():
+    tracer = make_tracer(sample_rate=0.0, trust_incoming_sampling=True)
+    
+    trace = tracer.start_trace("request", SAMPLED_PARENT)
+    assert trace.trace_id == TRACE_ID and trace.sampled
+    assert tracer.start_trace("request", SAMPLED_PARENT[:-2] + "00") is None
+
+
+def test_sample_rate_applies_to_requests_with_traceparent():
+    tracer = make_tracer(sample_rate=1.0)
+    
+    trace = tracer.start_trace("request", SAMPLED_PARENT[:-2] + "00")
+    assert trace.trace_id == TRACE_ID and trace.sampled
@@ -0,0 +1,76 @@
+"""
+上游限流额度测试
+"""
+
+import pytest
+
+from llm_one_api.core import upstream_quota as upstream_quota_module
+from llm_one_api.core.upstream_quota import DEFAULT_WINDOW, UpstreamQuota, parse_reset
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("30", 30.0),
+        ("1.5", 1.5),
+        ("1m30s", 90.0),
+        ("120ms", 0.12),
+        ("6m0s", 360.0),
+        ("1h2m3.5s", 3723.5),
+        ("", None),
+        (None, None),
+        ("soon", None),
+        ("1m30", None),
+    ],
+)
+def test_parse_reset(value, expected):
+    assert parse_reset(value) == (pytest.approx(expected) if expected is not None else None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(upstream_quota_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_reset_header_in_seconds_and_duration_form(clock):
+    quota = UpstreamQuota()
+    quota.update({
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "30",
+        "x-ratelimit-limit-tokens": "1000",
+        "x-ratelimit-remaining-tokens": "500",
+        "x-ratelimit-reset-tokens": "1m30s",
+    })
+    assert quota.exhausted
+    assert quota.get_stats()["requests"]["reset_in"] == 30
+    assert quota.get_stats()["tokens"]["reset_in"] == 90
+    
+    clock[0] += 31
+    assert not quota.exhausted
+    assert quota.headroom() == 0.5
+    
+    clock[0] += 60
+    assert quota.headroom() == 1.0
+
+
+def test_quota_without_reset_header_expires_after_default_window(clock):
+    quota = UpstreamQuota()
+    quota.update({"x-ratelimit-limit-tokens": "1000", "x-ratelimit-remaining-tokens": "100"})
+    assert quota.headroom() == 0.1
+    assert quota.get_stats()["tokens"]["reset_in"] == DEFAULT_WINDOW
+    
+    # 没有新的响应头时，过期的额度信息不再影响选择
+    clock[0] += DEFAULT_WINDOW
+    assert quota.headroom() == 1.0
+
+
+def test_exhausted_quota_without_reset_header_is_avoided_briefly(clock):
+    quota = UpstreamQuota()
+    quota.update({"x-ratelimit-remaining-requests": "0"})
+    assert quota.exhausted
+    
+    clock[0] += 1
+    assert not quota.exhausted
@@ -0,0 +1,212 @@
+"""
+用量查询测试（sqlite 和 columnar 统计插件）
+"""
+
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from llm_one_api.api.dependencies import get_current_settings, get_plugin_manager, verify_api_key
+from llm_one_api.api.routes import stats as stats_route
+from llm_one_api.config.settings import Settings
+from llm_one_api.plugins.builtin.sqlite_stats import SQLiteStatsPlugin
+
+MINUTE = 1790000040  # 整分钟
+
+
+def make_record(user: str, model: str = "gpt-4", offset: float = 0, total: int = 10, **extra):
+    record = {
+        "timestamp": datetime.fromtimestamp(MINUTE + offset).isoformat(),
+        "model": model,
+        "user": user,
+        "upstream": "0",
+        "duration": 1.0,
+        "token_usage": {"prompt_tokens": total // 2, "completion_tokens": total - total // 2, "total_tokens": total},
+    }
+    record.update(extra)
+    return record
+
+
+RECORDS = [
+    make_record("alice", total=10),
+    make_record("alice", model="gpt-3.5", offset=30, total=4, ttft=0.5),
+    make_record("alice", offset=3600, total=6, error="timeout"),
+    make_record("bob", total=100),
+]
+
+
+def make_columnar(path):
+    columnar_stats = pytest.importorskip("llm_one_api.plugins.builtin.columnar_stats")
+    if columnar_stats.np is None:
+        pytest.skip("numpy 未安装")
+    return columnar_stats.ColumnarStatsPlugin({"path": str(path), "initial_capacity": 4, "flush_interval": 3600})
+
+
+@pytest.fixture(params=["sqlite", "columnar"])
+async def plugin(request, tmp_path):
+    if request.param == "sqlite":
+        plugin = SQLiteStatsPlugin({"path": str(tmp_path / "stats.db"), "flush_interval": 0.01})
+    else:
+        plugin = make_columnar(tmp_path / "columnar")
+    
+    await plugin.initialize()
+    await plugin.record_batch(RECORDS)
+    if request.param == "sqlite":
+        # 关闭写线程，保证记录已经写入
+        await plugin.cleanup()
+    
+    yield plugin
+    await plugin.cleanup()
+
+
+async def test_group_by_model_and_user(plugin):
+    rows = await plugin.query_usage(MINUTE, MINUTE + 7200, group_by=["model", "user"])
+    
+    summary = {(row["model"], row["user"]): (row["requests"], row["total_tokens"]) for row in rows}
+    assert summary == {
+        ("gpt-4", "bob"): (1, 100),
+        ("gpt-4", "alice"): (2, 16),
+        ("gpt-3.5", "alice"): (1, 4),
+    }
+    # 按总 token 数从大到小排序
+    assert [row["total_tokens"] for row in rows] == [100, 16, 4]
+
+
+async def test_bucket_and_time_range(plugin):
+    rows = await plugin.query_usage(MINUTE, MINUTE + 7200, group_by=[], bucket="hour")
+    
+    hour = MINUTE // 3600 * 3600
+    assert [(row["bucket"], row["requests"]) for row in rows] == [(hour, 3), (hour + 3600, 1)]
+    
+    rows = await plugin.query_usage(MINUTE + 60, MINUTE + 7200, group_by=[])
+    assert [(row["requests"], row["errors"]) for row in rows] == [(1, 1)]
+
+
+async def test_filter_by_user(plugin):
+    rows = await plugin.query_usage(MINUTE, MINUTE + 7200, group_by=["user"], user="alice")
+    assert [(row["user"], row["requests"], row["total_tokens"], row["errors"]) for row in rows] == [("alice", 3, 20, 1)]
+    assert rows[0]["avg_ttft"] == 0.5
+    
+    assert await plugin.query_usage(MINUTE, MINUTE + 7200, user="nobody") == []
+
+
+async def test_columnar_filter_by_user_after_seal(tmp_path):
+    plugin = make_columnar(tmp_path / "columnar")
+    await plugin.initialize()
+    await plugin.record_batch(RECORDS)
+    plugin._seal(None)
+    await plugin.record_batch([make_record("alice", offset=7000, total=1)])
+    
+    rows = await plugin.query_usage(MINUTE, MINUTE + 7200, group_by=[], user="alice")
+    assert [(row["requests"], row["total_tokens"]) for row in rows] == [(4, 21)]
+    await plugin.cleanup()
+
+
+class FakeUsagePlugin:
+    def __init__(self):
+        self.calls = []
+    
+    async def query_usage(self, start, end, group_by=("model",), bucket=None, user=None):
+        self.calls.append(user)
+        return []
+
+
+class FakePluginManager:
+    def __init__(self):
+        self.stats_plugins = [FakeUsagePlugin()]
+
+
+@pytest.fixture
+def usage_client():
+    plugin_manager = FakePluginManager()
+    app = FastAPI()
+    app.include_router(stats_route.router, prefix="/v1")
+    app.dependency_overrides[get_plugin_manager] = lambda: plugin_manager
+    app.dependency_overrides[verify_api_key] = lambda: {"success": True, "user_id": "alice"}
+    app.dependency_overrides[get_current_settings] = lambda: Settings(profiling={"admin_token": "admin-secret"})
+    return TestClient(app), plugin_manager.stats_plugins[0]
+
+
+def test_usage_route_is_scoped_to_caller(usage_client):
+    client, plugin = usage_client
+    
+    assert client.get("/v1/stats/usage").json()["user"] == "alice"
+    assert client.get("/v1/stats/usage?user=alice").status_code == 200
+    assert client.get("/v1/stats/usage?user=bob").status_code == 403
+    assert client.get("/v1/stats/usage?user=bob", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert plugin.calls == ["alice", "alice"]
+
+
+def test_usage_route_admin_can_query_all_users(usage_client):
+    client, plugin = usage_client
+    headers = {"X-Admin-Token": "admin-secret"}
+    
+    assert client.get("/v1/stats/usage", headers=headers).json()["user"] is None
+    assert client.get("/v1/stats/usage?user=bob", headers=headers).status_code == 200
+    assert plugin.calls == [None, "bob"]
+
+
+async def test_columnar_record_batch_does_not_wait_for_lock(tmp_path):
+    plugin = make_columnar(tmp_path / "columnar")
+    await plugin.initialize()
+    
+    # 写线程持有锁（例如正在交换映射）时，事件循环上的记录不被阻塞
+    with plugin._lock:
+        await plugin.record_batch(RECORDS)
+    assert plugin.get_stats()["queued"] == len(RECORDS)
+    
+    rows = await plugin.query_usage(MINUTE, MINUTE + 7200, group_by=[])
+    assert [row["requests"] for row in rows] == [4]
+    await plugin.cleanup()
+
+
+async def test_columnar_seal_grows_arrays_and_persists(tmp_path):
+    path = tmp_path / "columnar"
+    plugin = make_columnar(path)
+    await plugin.initialize()
+    
+    records = [make_record(f"user-{i}", offset=60 * i, total=1) for i in range(10)]
+    await plugin.record_batch(records)
+    plugin._drain()
+    plugin._seal(MINUTE + 60 * 6)
+    
+    stats = plugin.get_stats()
+    assert (stats["rows"], stats["pending"]) == (6, 4)
+    assert stats["capacity"] >= 6
+    
+    rows = await plugin.query_usage(MINUTE, MINUTE + 3600, group_by=[])
+    assert rows[0]["requests"] == 10
+    
+    # 追加过程中（计数已移出 _pending、行数尚未更新）查询结果不变
+    with plugin._lock:
+        key = next(iter(plugin._pending))
+        plugin._sealing = {key: plugin._pending.pop(key)}
+    rows = await plugin.query_usage(MINUTE, MINUTE + 3600, group_by=[])
+    assert rows[0]["requests"] == 10
+    with plugin._lock:
+        plugin._pending.update(plugin._sealing)
+        plugin._sealing = {}
+    await plugin.cleanup()
+    
+    reopened = make_columnar(path)
+    await reopened.initialize()
+    rows = await reopened.query_usage(MINUTE, MINUTE + 3600, group_by=["user"], user="user-9")
+    assert [(row["user"], row["requests"]) for row in rows] == [("user-9", 1)]
+    await reopened.cleanup()
+
+
+async def test_columnar_prune_drops_expired_rows(tmp_path):
+    plugin = make_columnar(tmp_path / "columnar")
+    await plugin.initialize()
+    
+    await plugin.record_batch(RECORDS)
+    plugin._drain()
+    plugin._seal(None)
+    
+    plugin.retention_days = 0
+    plugin._prune()
+    assert plugin.get_stats()["rows"] == 0
+    assert await plugin.query_usage(MINUTE, MINUTE + 7200) == []
+    await plugin.cleanup()